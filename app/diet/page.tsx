@@ -10,6 +10,7 @@ import { Dumbbell, Utensils, Upload, ArrowLeft } from "lucide-react"
 import Link from "next/link"
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card"
 import { Alert, AlertDescription, AlertTitle } from "@/components/ui/alert"
+import { readEventStream } from "@/lib/event-stream"
 
 type FormData = {
   name: string
@@ -27,20 +28,21 @@ type FormData = {
   thyroxineReport: File | null
 }
 
+// Filled in stage by stage as /analyzereport/stream reports them
 interface Results {
-  analysis: {
+  analysis?: {
     blood: Record<string, string>;
     cholesterol: Record<string, string>;
     thyroxine: Record<string, string>;
   } | null;
-  diet_recommendations: {
+  diet_recommendations?: {
     breakfast: Array<{ item: string; calories: number }>;
     lunch: Array<{ item: string; calories: number }>;
     dinner: Array<{ item: string; calories: number }>;
     snacks: Array<{ item: string; calories: number }>;
     daily_calories: number;
   } | null;
-  health_status: {
+  health_status?: {
     weight_status: string;
     recommendations: string[];
   };
@@ -67,6 +69,7 @@ export default function AIDietWorkoutRecommendation() {
   const [loading, setLoading] = useState(false)
   const [error, setError] = useState<string | null>(null)
   const [results, setResults] = useState<Results | null>(null)
+  const [progress, setProgress] = useState<string | null>(null)
 
   const handleChange = (e: React.ChangeEvent<HTMLInputElement>) => {
     const { name, value, type } = e.target
@@ -88,6 +91,8 @@ export default function AIDietWorkoutRecommendation() {
     e.preventDefault()
     setLoading(true)
     setError(null)
+    setResults(null)
+    setProgress(null)
 
     if (!formData.bloodReport || !formData.cholesterolReport || !formData.thyroxineReport) {
       setError('Please upload all three medical reports')
@@ -111,7 +116,7 @@ export default function AIDietWorkoutRecommendation() {
       formDataToSend.append('dairy_allergy', formData.dairy_allergy.toString())
       formDataToSend.append('peanut_allergy', formData.peanut_allergy.toString())
 
-      const response = await fetch("http://localhost:5000/analyzereport", {
+      const response = await fetch("http://localhost:5000/analyzereport/stream", {
         method: "POST",
         body: formDataToSend,
       })
@@ -120,13 +125,37 @@ export default function AIDietWorkoutRecommendation() {
         throw new Error("Failed to generate recommendation")
       }
 
-      const data = await response.json()
-      setResults(data)
+      // Show each stage as soon as the server finishes it
+      let reports = 0
+      let finished = false
+      await readEventStream(response, (event, data) => {
+        if (event === "file") {
+          reports += 1
+          setProgress(`Analyzed ${reports} of 3 reports...`)
+        } else if (event === "conditions") {
+          setResults((prev) => ({ ...prev, analysis: data.analysis, health_status: data.health_status }))
+          setProgress("Planning your meals...")
+        } else if (event === "recommendations") {
+          setResults((prev) => ({ ...prev, diet_recommendations: data.diet_recommendations }))
+          setProgress("Writing your PDF report...")
+        } else if (event === "pdf" || event === "done") {
+          setResults((prev) => ({ ...prev, ...data }))
+          if (event === "done") finished = true
+        } else if (event === "error") {
+          finished = true
+          setError(data.error)
+        }
+      })
+      // The server ends every stream with 'done' or 'error'; anything else was cut off
+      if (!finished) {
+        throw new Error("The analysis stopped before it finished, please try again")
+      }
     } catch (error) {
       console.error("Error:", error)
       setError(error instanceof Error ? error.message : "An unexpected error occurred")
     } finally {
       setLoading(false)
+      setProgress(null)
     }
   }
 
@@ -305,7 +334,7 @@ export default function AIDietWorkoutRecommendation() {
               className="w-full bg-blue-600 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded-lg transition-all duration-300"
               disabled={loading}
             >
-              {loading ? "Analyzing..." : "Generate Recommendations"}
+              {loading ? progress ?? "Analyzing..." : "Generate Recommendations"}
             </Button>
           </form>
 
@@ -318,44 +347,48 @@ export default function AIDietWorkoutRecommendation() {
 
           {results && (
             <div className="mt-8 space-y-6">
-              <Card className="border-blue-200">
-                <CardHeader className="bg-blue-50 rounded-t-xl">
-                  <CardTitle className="text-blue-900">Health Status</CardTitle>
-                </CardHeader>
-                <CardContent className="pt-6">
-                  <div className="space-y-2">
-                    <p className="font-semibold text-blue-900">Weight Status: {results.health_status.weight_status}</p>
-                    <ul className="list-disc pl-4 text-blue-800">
-                      {results.health_status.recommendations.map((rec, index) => (
-                        <li key={index}>{rec}</li>
-                      ))}
-                    </ul>
-                  </div>
-                </CardContent>
-              </Card>
+              {results.health_status && (
+                <Card className="border-blue-200">
+                  <CardHeader className="bg-blue-50 rounded-t-xl">
+                    <CardTitle className="text-blue-900">Health Status</CardTitle>
+                  </CardHeader>
+                  <CardContent className="pt-6">
+                    <div className="space-y-2">
+                      <p className="font-semibold text-blue-900">Weight Status: {results.health_status.weight_status}</p>
+                      <ul className="list-disc pl-4 text-blue-800">
+                        {results.health_status.recommendations.map((rec, index) => (
+                          <li key={index}>{rec}</li>
+                        ))}
+                      </ul>
+                    </div>
+                  </CardContent>
+                </Card>
+              )}
 
-              <Card className="border-blue-200">
-                <CardHeader className="bg-blue-50 rounded-t-xl">
-                  <CardTitle className="text-blue-900">Diet Recommendations</CardTitle>
-                </CardHeader>
-                <CardContent className="pt-6">
-                  <div className="space-y-4">
-                    <p className="font-semibold text-blue-900">Daily Calorie Target: {results.diet_recommendations?.daily_calories} kcal</p>
-                    {(['breakfast', 'lunch', 'dinner', 'snacks'] as const).map((meal) => (
-                      <div key={meal} className="space-y-2">
-                        <h3 className="font-semibold capitalize text-blue-900">{meal}</h3>
-                        <ul className="list-disc pl-4 text-blue-800">
-                          {results.diet_recommendations?.[meal].map((item: { item: string; calories: number }, index: number) => (
-                            <li key={index}>
-                              {item.item} ({item.calories} kcal)
-                            </li>
-                          ))}
-                        </ul>
-                      </div>
-                    ))}
-                  </div>
-                </CardContent>
-              </Card>
+              {results.diet_recommendations && (
+                <Card className="border-blue-200">
+                  <CardHeader className="bg-blue-50 rounded-t-xl">
+                    <CardTitle className="text-blue-900">Diet Recommendations</CardTitle>
+                  </CardHeader>
+                  <CardContent className="pt-6">
+                    <div className="space-y-4">
+                      <p className="font-semibold text-blue-900">Daily Calorie Target: {results.diet_recommendations?.daily_calories} kcal</p>
+                      {(['breakfast', 'lunch', 'dinner', 'snacks'] as const).map((meal) => (
+                        <div key={meal} className="space-y-2">
+                          <h3 className="font-semibold capitalize text-blue-900">{meal}</h3>
+                          <ul className="list-disc pl-4 text-blue-800">
+                            {results.diet_recommendations?.[meal].map((item: { item: string; calories: number }, index: number) => (
+                              <li key={index}>
+                                {item.item} ({item.calories} kcal)
+                              </li>
+                            ))}
+                          </ul>
+                        </div>
+                      ))}
+                    </div>
+                  </CardContent>
+                </Card>
+              )}
 
               {results.pdf_url && (
                 <div className="text-center">
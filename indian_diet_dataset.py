@@ -2,7 +2,12 @@ import pandas as pd
 import numpy as np
 from sklearn.preprocessing import StandardScaler
 from sklearn.cluster import KMeans
+import os
 import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server'))
+from food_catalog import get_catalog, CONDITIONS
 
 # Generate synthetic blood test data
 def generate_blood_data(n_samples=2000):
@@ -24,56 +29,11 @@ def generate_blood_data(n_samples=2000):
 def get_diet_recommendations(blood_data):
     recommendations = []
     
-    # Common Indian foods and their health benefits
+    # Common Indian foods and their health benefits, from the shared food catalog
+    catalog = get_catalog()
     indian_foods = {
-        'diabetes': [
-            'Bitter gourd (Karela) curry',
-            'Fenugreek (Methi) leaves',
-            'Whole grain roti',
-            'Moong dal',
-            'Curd with flaxseeds',
-            'Sprouted salads',
-            'Green leafy vegetables',
-            'Cinnamon tea',
-            'Jamun (Indian blackberry)',
-            'Amla (Indian gooseberry)'
-        ],
-        'cholesterol': [
-            'Oats porridge',
-            'Green tea',
-            'Garlic in meals',
-            'Turmeric milk',
-            'Flaxseed chutney',
-            'Walnuts',
-            'Almonds',
-            'Olive oil cooking',
-            'Green leafy vegetables',
-            'Whole grains'
-        ],
-        'thyroid': [
-            'Coconut oil',
-            'Seafood',
-            'Dairy products',
-            'Nuts and seeds',
-            'Whole grains',
-            'Fresh fruits',
-            'Green vegetables',
-            'Lentils',
-            'Eggs',
-            'Berries'
-        ],
-        'general_health': [
-            'Khichdi with vegetables',
-            'Daliya (broken wheat)',
-            'Sprouts salad',
-            'Buttermilk',
-            'Fresh fruits',
-            'Nuts and seeds',
-            'Green vegetables',
-            'Whole grain roti',
-            'Lentil soup',
-            'Herbal teas'
-        ]
+        condition: catalog.names_for(catalog.select(source='indian', condition=condition))
+        for condition in CONDITIONS
     }
     
     for _, row in blood_data.iterrows():
@@ -0,0 +1,36 @@
+// Reads a text/event-stream response (e.g. /analyzereport/stream) and calls
+// onEvent for each event as it arrives. EventSource can't POST a form, so the
+// stream comes from fetch() and is parsed here.
+export async function readEventStream(
+  response: Response,
+  onEvent: (event: string, data: any) => void
+) {
+  if (!response.body) {
+    throw new Error("Response has no body to stream")
+  }
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ""
+
+  const dispatch = (block: string) => {
+    let event = "message"
+    const data: string[] = []
+    for (const line of block.split("\n")) {
+      if (line.startsWith("event:")) event = line.slice(6).trim()
+      else if (line.startsWith("data:")) data.push(line.slice(5).trimStart())
+    }
+    if (data.length) onEvent(event, JSON.parse(data.join("\n")))
+  }
+
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+    let end
+    while ((end = buffer.indexOf("\n\n")) !== -1) {
+      dispatch(buffer.slice(0, end))
+      buffer = buffer.slice(end + 2)
+    }
+  }
+  if (buffer.trim()) dispatch(buffer)
+}
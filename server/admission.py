@@ -0,0 +1,240 @@
+"""Admission control: per-route concurrency limits weighted by what each request costs.
+
+The expensive routes share a pool of cost units per worker process:
+
+    reports  /analyzereport, /analyzereport/stream  (PDF parse, model, ReportLab)
+    diet     /diet                                   (OCR, LLM, xhtml2pdf)
+
+A request costs 1 unit, plus 1 per uploaded file and 1 per MB uploaded (see
+request_cost). The line is joined on the Content-Length alone, before the body
+is parsed, so a shed request never pays for parsing its upload; once admitted,
+its cost grows by its file count (refine). A body without a Content-Length
+(chunked) is charged as if it were MAX_CONTENT_LENGTH (with the defaults, the
+whole pool), and no body may be larger than that (413). It runs once its units
+fit in the pool; until then it waits in line, in arrival order. Requests are
+shed instead of served late:
+
+    429  the pool's line is full, or waiting requests would leave the worker
+         fewer than ARISE_ADMISSION_RESERVED_THREADS threads for everything else
+    503  the request waited longer than the pool's max_wait
+
+Both carry Retry-After, estimated from how long admitted requests have been
+holding their units. Everything else (/, /download, /healthz, /metrics...)
+is never limited, so a burst of report uploads can't starve downloads.
+
+    ARISE_ADMISSION=off                 disable (every request is admitted)
+    ARISE_ADMISSION_REPORTS=8,10,2      capacity in units, max_wait seconds, max queued requests
+    ARISE_ADMISSION_DIET=3,15,2
+    ARISE_ADMISSION_RESERVED_THREADS=1  threads kept free of limited routes (of ARISE_THREADS)
+    ARISE_MAX_UPLOAD_MB=32              largest request body on any route
+
+Rejections count under arise_admission_rejections_total{pool,reason}; the
+units in use, the line and the time spent in it are exported too.
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+
+from flask import g, jsonify, request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+import metrics
+
+ENABLED = os.environ.get('ARISE_ADMISSION', 'on') != 'off'
+BYTES_PER_UNIT = 2 ** 20
+MAX_CONTENT_LENGTH = int(float(os.environ.get('ARISE_MAX_UPLOAD_MB', '32')) * 2 ** 20)
+RETRY_AFTER_MAX = 60
+
+# pool: (capacity in cost units, max seconds in line, max requests in line)
+POOL_LIMITS = {
+    'reports': (8, 10.0, 2),
+    'diet': (3, 15.0, 2),
+}
+ROUTE_POOLS = {
+    '/analyzereport': 'reports',
+    '/analyzereport/stream': 'reports',
+    '/diet': 'diet',
+}
+
+# Limited requests, running or in line, hold a worker thread each; keep some for the rest
+THREADS = int(os.environ.get('ARISE_THREADS', '4'))
+RESERVED_THREADS = int(os.environ.get('ARISE_ADMISSION_RESERVED_THREADS', '1'))
+
+
+def _limits(pool, default):
+    value = os.environ.get(f'ARISE_ADMISSION_{pool.upper()}')
+    if not value:
+        return default
+    capacity, max_wait, max_queue = value.split(',')
+    return float(capacity), float(max_wait), int(max_queue)
+
+
+def request_cost(files, content_length):
+    """Cost units of a request uploading `files` files in `content_length` bytes; an unknown
+    length counts as the largest body allowed"""
+    if content_length is None:
+        content_length = MAX_CONTENT_LENGTH
+    return 1 + files + content_length / BYTES_PER_UNIT
+
+
+class CostSemaphore:
+    """Capacity in cost units; waiters are admitted in arrival order, so a costly request
+    at the head of the line isn't overtaken forever by cheap ones"""
+
+    def __init__(self, name, capacity, max_wait, max_queue):
+        self.name = name
+        self.capacity = capacity
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.in_use = 0.0
+        self.queued_cost = 0.0
+        self.hold_seconds = 1.0     # moving average of how long admitted requests hold their units
+        self._line = deque()
+        self._cond = threading.Condition()
+
+    def acquire(self, cost):
+        """None once `cost` units are held, else why not: 'queue_full' or 'timeout'.
+        Costs above the capacity are capped, so such a request runs alone"""
+        cost = min(cost, self.capacity)
+        with self._cond:
+            if not self._line and self.in_use + cost <= self.capacity:
+                self._admit(cost)
+                return None
+            if len(self._line) >= self.max_queue:
+                return 'queue_full'
+            ticket = object()
+            self._line.append(ticket)
+            self.queued_cost += cost
+            metrics.ADMISSION_QUEUED.set(len(self._line), pool=self.name)
+            deadline = time.monotonic() + self.max_wait
+            try:
+                while self._line[0] is not ticket or self.in_use + cost > self.capacity:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return 'timeout'
+                    self._cond.wait(remaining)
+                self._admit(cost)
+                return None
+            finally:
+                self._line.remove(ticket)
+                self.queued_cost -= cost
+                metrics.ADMISSION_QUEUED.set(len(self._line), pool=self.name)
+                # Whoever is next in line may fit now
+                self._cond.notify_all()
+
+    def _admit(self, cost):
+        self.in_use += cost
+        metrics.ADMISSION_IN_USE.set(self.in_use, pool=self.name)
+
+    def resize(self, held, cost):
+        """Hold `cost` units instead of `held` for an admitted request. Doesn't wait: the pool
+        may go over capacity until it's released, and later arrivals wait for that"""
+        held, cost = min(held, self.capacity), min(cost, self.capacity)
+        with self._cond:
+            self.in_use += cost - held
+            metrics.ADMISSION_IN_USE.set(self.in_use, pool=self.name)
+            if cost < held:
+                self._cond.notify_all()
+
+    def release(self, cost, held_seconds):
+        cost = min(cost, self.capacity)
+        with self._cond:
+            self.in_use -= cost
+            self.hold_seconds = 0.8 * self.hold_seconds + 0.2 * held_seconds
+            metrics.ADMISSION_IN_USE.set(self.in_use, pool=self.name)
+            self._cond.notify_all()
+
+    def retry_after(self):
+        """Seconds until the units now held or queued are likely to have drained"""
+        with self._cond:
+            backlog = self.in_use + self.queued_cost
+        return max(1, min(RETRY_AFTER_MAX, math.ceil(self.hold_seconds * backlog / self.capacity)))
+
+
+pools = {name: CostSemaphore(name, *_limits(name, limits)) for name, limits in POOL_LIMITS.items()}
+_threads = threading.BoundedSemaphore(max(1, THREADS - RESERVED_THREADS))
+
+
+def acquire(route, cost, hold_thread=True):
+    """(ticket, None) when a request to `route` may run (ticket None if the route isn't
+    limited), or (None, (status, body, headers)) when it is shed. hold_thread: the request
+    waits on a worker thread, so it counts against the threads kept for other routes"""
+    pool = pools.get(ROUTE_POOLS.get(route))
+    if not ENABLED or pool is None:
+        return None, None
+    if hold_thread and not _threads.acquire(blocking=False):
+        reason = 'queue_full'
+    else:
+        start = time.monotonic()
+        reason = pool.acquire(cost)
+        metrics.ADMISSION_WAIT_SECONDS.observe(time.monotonic() - start, pool=pool.name)
+        if reason is None:
+            return (pool, cost, time.monotonic(), hold_thread), None
+        if hold_thread:
+            _threads.release()
+    metrics.ADMISSION_REJECTIONS.inc(pool=pool.name, reason=reason)
+    status = 429 if reason == 'queue_full' else 503
+    retry_after = pool.retry_after()
+    body = {"error": "Server busy, retry later" if status == 503 else "Too many concurrent requests, retry later",
+            "retry_after": retry_after}
+    return None, (status, body, {'Retry-After': str(retry_after)})
+
+
+def refine(ticket, cost):
+    """The ticket of an admitted request, now holding `cost` units (once its body is
+    parsed and the file count known)"""
+    if ticket is None:
+        return None
+    pool, held, admitted, held_thread = ticket
+    pool.resize(held, cost)
+    return pool, cost, admitted, held_thread
+
+
+def release(ticket):
+    if ticket is None:
+        return
+    pool, cost, admitted, held_thread = ticket
+    pool.release(cost, time.monotonic() - admitted)
+    if held_thread:
+        _threads.release()
+
+
+def init_app(app):
+    """Apply the limits to a Flask app's routes"""
+    # Werkzeug enforces this while reading, chunked bodies included
+    app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+
+    @app.errorhandler(RequestEntityTooLarge)
+    def _too_large(e):
+        return jsonify({"error": f"Request body over {MAX_CONTENT_LENGTH // 2 ** 20} MB"}), 413
+
+    @app.before_request
+    def _admit():
+        route = request.url_rule.rule if request.url_rule else None
+        if route not in ROUTE_POOLS:
+            return None
+        # Decide from the headers; parsing the upload is part of what's being limited
+        if (request.content_length or 0) > MAX_CONTENT_LENGTH:
+            raise RequestEntityTooLarge()
+        ticket, rejection = acquire(route, request_cost(0, request.content_length))
+        if rejection is not None:
+            status, body, headers = rejection
+            return jsonify(body), status, headers
+        g.admission_ticket = ticket
+        files = sum(1 for _ in request.files.items(multi=True))
+        g.admission_ticket = refine(ticket, request_cost(files, request.content_length))
+        return None
+
+    @app.after_request
+    def _hold_while_streaming(response):
+        # Teardown runs when the view returns; a streamed response keeps working until it closes
+        if response.is_streamed and 'admission_ticket' in g:
+            ticket = g.pop('admission_ticket')
+            response.call_on_close(lambda: release(ticket))
+        return response
+
+    @app.teardown_request
+    def _release(exc):
+        release(g.pop('admission_ticket', None))
@@ -0,0 +1,314 @@
+"""Lab report analysis shared by back.py and gem.py.
+
+Extraction (report text -> panel of lab values), the panel defaults and the
+food recommendation strategies live here once. Every strategy takes a batch
+of panels and returns one {meal_type: [food names]} dict per panel:
+
+    model   DietRecommender over the classified conditions (back.py's /analyzereport)
+    knn     diet of the nearest labelled case in indian_diet_dataset.csv (gem.py)
+    rules   catalog foods for the conditions the panel's thresholds flag, i.e. the
+            rules indian_diet_dataset.py labels its cases with (health_rules.FOOD_CONDITIONS)
+
+gem.py picks its strategy with ARISE_ANALYSIS_STRATEGY (default knn).
+bench.py times each strategy (analysis.<name>) and scores it with
+diet_agreement against the diets the dataset's last HOLDOUT_CASES cases are
+labelled with; knn is built without those cases for the comparison.
+
+Importing this module stays cheap: NumPy, PyPDF2, the catalog and the models
+come in on first use.
+"""
+import ast
+import csv
+import math
+import os
+import threading
+
+import health_rules
+
+ENGINE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATASET_PATH = os.environ.get('ARISE_DIET_DATASET',
+                              os.path.join(os.path.dirname(ENGINE_DIR), 'indian_diet_dataset.csv'))
+
+PANEL_FIELDS = ("Fasting Blood Sugar", "Post Prandial Blood Sugar", "Thyroxine",
+                "Cholesterol", "LDL Cholesterol", "HDL Cholesterol")
+
+# Default average values for missing parameters
+AVERAGE_VALUES = {
+    "Fasting Blood Sugar": 90,  # mg/dL
+    "Post Prandial Blood Sugar": 120,  # mg/dL
+    "Thyroxine": 1.5,  # ng/dL
+    "Cholesterol": 180,  # mg/dL (Total)
+    "LDL Cholesterol": 90,  # mg/dL
+    "HDL Cholesterol": 50  # mg/dL
+}
+
+# indian_diet_dataset.csv column for each PANEL_FIELDS entry, in the same order
+DATASET_COLUMNS = ('Fasting_Blood_Sugar', 'Post_Prandial_Blood_Sugar', 'Thyroxine',
+                   'Cholesterol', 'LDL_Cholesterol', 'HDL_Cholesterol')
+HOLDOUT_CASES = 200   # last dataset cases, kept out of knn when strategies are scored
+
+# Label printed before each value in the lab's reports
+REPORT_MARKERS = {
+    "Fasting Blood Sugar": "Blood Sugar Fasting",
+    "Post Prandial Blood Sugar": "Glucose - Post Prandial",
+    "Thyroxine": "Thyroxine",
+    "Cholesterol": "Cholesterol",
+    "LDL Cholesterol": "LDL Cholesterol",
+    "HDL Cholesterol": "HDL Cholesterol",
+}
+
+# Fields carried by each of gem.py's typed uploads
+REPORT_TYPES = {
+    'blood_sugar': ("Fasting Blood Sugar", "Post Prandial Blood Sugar"),
+    'cholesterol': ("Cholesterol", "LDL Cholesterol", "HDL Cholesterol"),
+    'thyroxine': ("Thyroxine",),
+}
+
+# --- extraction ------------------------------------------------------------
+
+def extract_panel(text, report_type=None):
+    """Values found in report text, as printed; only report_type's fields if given
+    (none for unknown types)"""
+    fields = REPORT_TYPES.get(report_type, ()) if report_type else PANEL_FIELDS
+    panel = {}
+    for field in fields:
+        if REPORT_MARKERS[field] in text:
+            tokens = text.split(REPORT_MARKERS[field])[1].split()
+            if tokens:
+                panel[field] = tokens[0]
+    return panel
+
+
+def _readable(value):
+    try:
+        return math.isfinite(float(value))
+    except (TypeError, ValueError):
+        return False
+
+
+def complete_panel(panel):
+    """Every field of the panel; missing ones, and ones that aren't a number (whatever the
+    report printed after the marker, e.g. "Pending"), replaced by AVERAGE_VALUES"""
+    return {field: panel[field] if _readable(panel.get(field)) else AVERAGE_VALUES[field]
+            for field in PANEL_FIELDS}
+
+
+def read_pdf_text(file_path):
+    import PyPDF2
+    with open(file_path, 'rb') as pdf_file:
+        reader = PyPDF2.PdfReader(pdf_file)
+        text = ""
+        for page in reader.pages:
+            text += page.extract_text()
+    return text
+
+
+def _number(value, default):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float(default)
+
+
+def read_dataset(dataset_path=DATASET_PATH):
+    """(panels, diets) of the labelled cases in indian_diet_dataset.csv. Raises
+    FileNotFoundError without the dataset (run indian_diet_dataset.py)"""
+    with open(dataset_path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    panels = [{field: float(row[column]) for field, column in zip(PANEL_FIELDS, DATASET_COLUMNS)}
+              for row in rows]
+    diets = [ast.literal_eval(row['Diet_Recommendations']) for row in rows]
+    return panels, diets
+
+
+def panel_matrix(panels):
+    """(len(panels), len(PANEL_FIELDS)) floats; missing or unreadable values get the average"""
+    import numpy as np
+    return np.array([[_number(panel.get(field), AVERAGE_VALUES[field]) for field in PANEL_FIELDS]
+                     for panel in panels], dtype=np.float64).reshape(len(panels), len(PANEL_FIELDS))
+
+
+def condition_flags(matrix):
+    """(len(matrix), len(CONDITIONS)) booleans from health_rules.FOOD_CONDITIONS, in
+    food_catalog.CONDITIONS order"""
+    from food_catalog import CONDITIONS
+    return health_rules.food_condition_flags(matrix, PANEL_FIELDS, CONDITIONS)
+
+
+def classify_health_conditions(data, bmi=None):
+    """Condition levels used by the recommenders for one extracted panel"""
+    return health_rules.condition_levels([data], None if bmi is None else [bmi])[0]
+
+
+# --- strategies ------------------------------------------------------------
+
+class Strategy:
+    """recommend(panels, exclude_allergens) -> one {meal_type: [food names]} per complete panel"""
+    name = None
+
+    def prepare(self):
+        """Load what the strategy needs; get_strategy() calls this once"""
+
+    def recommend(self, panels, exclude_allergens=0):
+        raise NotImplementedError
+
+
+class ModelStrategy(Strategy):
+    """DietRecommender picks for breakfast/lunch/dinner plus the catalog's default snacks"""
+    name = 'model'
+    MEALS = ('breakfast', 'lunch', 'dinner')
+
+    def __init__(self, get_recommender=None):
+        # back.py passes model_state's recommender so registry swaps are picked up
+        self.get_recommender = get_recommender
+        self._own = None
+
+    def prepare(self):
+        if self.get_recommender is None and self._own is None:
+            from diet_recommender import DietRecommender
+            self._own = DietRecommender(model_dir=os.path.join(ENGINE_DIR, 'models'))
+
+    def recommend(self, panels, exclude_allergens=0):
+        from food_catalog import get_catalog
+        recommender = self.get_recommender() if self.get_recommender else self._own
+        requests = [(conditions, meal_type)
+                    for conditions in health_rules.condition_levels(panels) for meal_type in self.MEALS]
+        picks = recommender.recommend_foods_batch(requests, exclude_allergens=exclude_allergens)
+        catalog = get_catalog()
+        snacks = catalog.names_for(catalog.select(meal_type='snacks', source='snack',
+                                                  exclude_allergens=exclude_allergens))
+        results = []
+        for start in range(0, len(picks), len(self.MEALS)):
+            meals = dict(zip(self.MEALS, picks[start:start + len(self.MEALS)]))
+            meals['snacks'] = list(snacks)
+            results.append(meals)
+        return results
+
+
+class KnnStrategy(Strategy):
+    """Diet of the nearest labelled case, by standardised distance over the panel fields"""
+    name = 'knn'
+
+    def __init__(self, dataset_path=DATASET_PATH, holdout=0):
+        # holdout: leave out the dataset's last `holdout` cases, to be scored against them
+        self.dataset_path = dataset_path
+        self.holdout = holdout
+
+    def prepare(self):
+        """Raises FileNotFoundError without the dataset (run indian_diet_dataset.py)"""
+        panels, diets = read_dataset(self.dataset_path)
+        if self.holdout:
+            panels, diets = panels[:-self.holdout], diets[:-self.holdout]
+        cases = panel_matrix(panels)
+        self.mean = cases.mean(axis=0)
+        self.scale = cases.std(axis=0)
+        self.cases = (cases - self.mean) / self.scale
+        self.case_norms = (self.cases ** 2).sum(axis=1)
+        self.diets = diets
+
+    def nearest(self, panels):
+        """Index of the closest case for each panel"""
+        X = (panel_matrix(panels) - self.mean) / self.scale
+        # |x - c|^2 without |x|^2, which doesn't change the argmin: one matrix product for the batch
+        return (self.case_norms[None, :] - 2 * X @ self.cases.T).argmin(axis=1)
+
+    def recommend(self, panels, exclude_allergens=0):
+        from food_catalog import get_catalog
+        catalog = get_catalog()
+        results = []
+        for index in self.nearest(panels).tolist():
+            diet = self.diets[index]
+            if exclude_allergens:
+                diet = {meal: [food for food, ok in zip(foods, catalog.allowed(foods, exclude_allergens=exclude_allergens))
+                               if ok] for meal, foods in diet.items()}
+            results.append({meal: list(foods) for meal, foods in diet.items()})
+        return results
+
+
+class RulesStrategy(Strategy):
+    """Catalog foods tagged with each flagged condition, spread over the meals"""
+    name = 'rules'
+    PER_MEAL = {'breakfast': 2, 'lunch': 2, 'dinner': 2, 'snacks': 1}
+
+    def prepare(self):
+        self._foods = {}
+
+    def _condition_foods(self, exclude_allergens):
+        """{condition: [names]} of Indian catalog foods, cached per allergen mask"""
+        foods = self._foods.get(exclude_allergens)
+        if foods is None:
+            from food_catalog import CONDITIONS, get_catalog
+            catalog = get_catalog()
+            foods = {condition: catalog.names_for(catalog.select(source='indian', condition=condition,
+                                                                  exclude_allergens=exclude_allergens))
+                     for condition in CONDITIONS}
+            self._foods[exclude_allergens] = foods
+        return foods
+
+    def recommend(self, panels, exclude_allergens=0):
+        from food_catalog import CONDITIONS
+        foods = self._condition_foods(exclude_allergens)
+        flags = condition_flags(panel_matrix(panels))
+        results = []
+        for row in flags:
+            diet = {meal: [] for meal in self.PER_MEAL}
+            for condition in (c for c, flagged in zip(CONDITIONS, row) if flagged):
+                names = foods[condition]
+                if not names:
+                    continue
+                # Rotate through the condition's foods so each meal gets different ones
+                offset = 0
+                for meal, count in self.PER_MEAL.items():
+                    diet[meal].extend(names[(offset + i) % len(names)] for i in range(count))
+                    offset += count
+            results.append(diet)
+        return results
+
+
+STRATEGIES = {strategy.name: strategy for strategy in (ModelStrategy, KnnStrategy, RulesStrategy)}
+
+_strategies = {}
+_strategies_lock = threading.Lock()
+
+
+def get_strategy(name):
+    """Shared, prepared instance of a registered strategy; KeyError for unknown names"""
+    strategy = _strategies.get(name)
+    if strategy is None:
+        with _strategies_lock:
+            strategy = _strategies.get(name)
+            if strategy is None:
+                strategy = STRATEGIES[name]()
+                strategy.prepare()
+                _strategies[name] = strategy
+    return strategy
+
+
+def diet_agreement(recommendations, diets, exact=False):
+    """Agreement of each panel's recommended diet with its labelled one, averaged over panels
+    and meals; the accuracy score bench.py reports per strategy. Per meal it is the mean of
+    how well each recommended food matches its closest labelled food and vice versa, by
+    weekly_planner.food_similarity (names and nutrients, 1 for the same food), so foods the
+    labels never use (the model's) still score by how close they are. exact: Jaccard overlap
+    of the food names instead. Meals empty in both count as agreeing"""
+    import numpy as np
+    from food_catalog import get_catalog
+    catalog = get_catalog()
+    if not exact:
+        from weekly_planner import food_similarity
+        similarity = food_similarity(catalog)
+    scores = []
+    for recommended, labelled in zip(recommendations, diets):
+        for meal in set(recommended) | set(labelled):
+            got, want = set(recommended.get(meal, ())), set(labelled.get(meal, ()))
+            if not got or not want:
+                scores.append(0.0 if got or want else 1.0)
+            elif exact:
+                scores.append(len(got & want) / len(got | want))
+            else:
+                ids = [catalog.name_ids.get(name, -1) for name in (*got, *want)]
+                if min(ids) < 0:
+                    raise KeyError(f"not in the food catalog: {sorted(n for n, i in zip((*got, *want), ids) if i < 0)}")
+                pairs = similarity[np.ix_(ids[:len(got)], ids[len(got):])]
+                scores.append((pairs.max(axis=1).mean() + pairs.max(axis=0).mean()) / 2)
+    return float(np.mean(scores)) if scores else 0.0
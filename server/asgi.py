@@ -0,0 +1,259 @@
+"""Optional ASGI entry point for the health recommendation API.
+
+    ARISE_SERVER_MODE=asgi gunicorn -c gunicorn.conf.py
+    uvicorn asgi:app            (single process, for local testing)
+
+Requires `asgiref` and `uvicorn`. Most routes are the regular Flask views run
+through asgiref's WSGI adapter. /diet is served natively: the CPU-bound steps
+run on a small thread pool while the Gemini call is awaited on the event loop,
+so a slow LLM response no longer pins a worker thread. /ws/exercise/<exercise>
+is a WebSocket stream of pose keypoint batches for rep_counter.py (uvicorn
+needs `websockets` or `wsproto` for it: pip install 'uvicorn[standard]').
+"""
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:  # pragma: no cover - optional dependency
+    sys.exit("asgi.py needs asgiref (and uvicorn to serve it): pip install asgiref uvicorn")
+
+from werkzeug.wrappers import Request
+
+import admission
+import back
+import metrics
+import tracing
+
+flask_app = back.create_app()
+wsgi_adapter = WsgiToAsgi(flask_app)
+
+# Threads for the CPU-bound parts of natively served routes
+cpu_pool = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('ARISE_ASGI_CPU_THREADS', '4')),
+    thread_name_prefix='asgi-cpu'
+)
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+async def read_body(receive, limit=admission.MAX_CONTENT_LENGTH):
+    """The whole request body; BodyTooLarge once it passes `limit` bytes"""
+    body = bytearray()
+    while True:
+        message = await receive()
+        body.extend(message.get('body', b''))
+        if len(body) > limit:
+            raise BodyTooLarge()
+        if not message.get('more_body'):
+            return bytes(body)
+
+
+def build_environ(scope, body):
+    """Minimal WSGI environ, enough for werkzeug to parse forms and files"""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': BytesIO(body),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            environ[f'HTTP_{name}'] = value
+    return environ
+
+
+async def send_response(send, status, body, headers):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(k.encode('latin-1'), v.encode('latin-1')) for k, v in headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def content_length(scope):
+    """The Content-Length header as an int, None if missing or malformed"""
+    for name, value in scope.get('headers', []):
+        if name.lower() == b'content-length':
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+
+async def send_too_large(send):
+    message = {"error": f"Request body over {admission.MAX_CONTENT_LENGTH // 2 ** 20} MB"}
+    await send_response(send, 413, json.dumps(message).encode(), [('content-type', 'application/json')])
+
+
+async def diet(scope, receive, send):
+    """Async twin of back.diet()"""
+    # Same limits as the Flask routes, decided before the upload is read and parsed;
+    # waiting happens on a helper thread, not the event loop
+    length = content_length(scope)
+    if length is not None and length > admission.MAX_CONTENT_LENGTH:
+        await send_too_large(send)
+        return
+    ticket, rejection = await asyncio.to_thread(
+        admission.acquire, '/diet', admission.request_cost(0, length), False)
+    if rejection is not None:
+        status, body, headers = rejection
+        await send_response(send, status, json.dumps(body).encode(),
+                            [('content-type', 'application/json')] + [(k.lower(), v) for k, v in headers.items()])
+        return
+    try:
+        try:
+            body = await read_body(receive)
+        except BodyTooLarge:
+            await send_too_large(send)
+            return
+        request = Request(build_environ(scope, body))
+        files = request.files.getlist('reports')
+        try:
+            user_input = back.parse_diet_form(request.form)
+        except (KeyError, ValueError) as e:
+            await send_response(send, 400, f'{{"error": "Invalid form field: {e}"}}'.encode(),
+                                [('content-type', 'application/json')])
+            return
+        ticket = admission.refine(ticket, admission.request_cost(len(files), request.content_length))
+        await diet_pipeline(send, files, user_input)
+    finally:
+        admission.release(ticket)
+
+
+def run_cpu(fn, *args):
+    """fn(*args) on the CPU pool, in the caller's context so its spans land on the request's trace"""
+    call = functools.partial(contextvars.copy_context().run, fn, *args)
+    return asyncio.get_running_loop().run_in_executor(cpu_pool, call)
+
+
+async def diet_pipeline(send, files, user_input):
+    """The admitted part of /diet"""
+    # The LLM call only waits on the network, so start it first and let the
+    # CPU-bound steps run on the pool meanwhile
+    suggestions = asyncio.ensure_future(back.generate_diet_suggestions_async(user_input))
+    if files:
+        report_details = await run_cpu(back.extract_text_from_reports, files)
+    else:
+        report_details = "No reports uploaded."
+    recommended_plan = await run_cpu(back.recommend_meal_and_workout, user_input)
+    diet_suggestions = await suggestions
+    pdf = await run_cpu(back.generate_pdf, recommended_plan, report_details, diet_suggestions)
+
+    await send_response(send, 200, pdf.getvalue(), [
+        ('content-type', 'application/pdf'),
+        ('content-disposition', 'attachment; filename=Health_Report.pdf'),
+        ('access-control-allow-origin', '*'),
+    ])
+
+
+async def exercise_stream(scope, receive, send):
+    """WebSocket /ws/exercise/<exercise>: one rep_counter batch per message (JSON text or
+    binary), one JSON result back per batch. The counter lives as long as the connection. A batch takes
+    well under a millisecond of NumPy, so it runs on the event loop rather than paying
+    for a thread hop."""
+    from rep_counter import EXERCISES, RepCounter, handle_message
+    exercise = scope['path'][len(EXERCISE_STREAM_PREFIX):]
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    if exercise not in EXERCISES:
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+    await send({'type': 'websocket.accept'})
+    counter = RepCounter(exercise)
+    while True:
+        message = await receive()
+        if message['type'] == 'websocket.disconnect':
+            return
+        batch = message.get('text')
+        if batch is None:
+            batch = message.get('bytes') or b''
+        await send({'type': 'websocket.send', 'text': handle_message(counter, batch)})
+
+
+async def instrumented(handler, scope, receive, send):
+    """Run a native route with what back.py's and tracing.py's Flask hooks give the others:
+    the request metrics, a trace (X-Trace-Id, slow-request log) and its spans"""
+    endpoint = scope['path']
+    status = 500
+    trace_id = None
+    for name, value in scope.get('headers', []):
+        if name.lower() == b'x-trace-id':
+            trace_id = tracing.trace_id_from(value.decode('latin-1'))
+
+    async def send_with_trace(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+            headers = list(message.get('headers', [])) + [(b'x-trace-id', trace.trace_id.encode())]
+            message = dict(message, headers=headers)
+        await send(message)
+
+    start = time.perf_counter()
+    metrics.QUEUE_DEPTH.inc(endpoint=endpoint)
+    with tracing.start_trace(endpoint, trace_id) as trace:
+        try:
+            await handler(scope, receive, send_with_trace)
+        except Exception as e:
+            trace.attributes['error'] = type(e).__name__
+            raise
+        finally:
+            metrics.QUEUE_DEPTH.dec(endpoint=endpoint)
+            metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+            metrics.REQUESTS.inc(endpoint=endpoint, status=status)
+            trace.attributes['status'] = status
+            tracing.log_trace(trace)
+
+
+NATIVE_ROUTES = {
+    ('POST', '/diet'): diet,
+}
+EXERCISE_STREAM_PREFIX = '/ws/exercise/'
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'http':
+        handler = NATIVE_ROUTES.get((scope['method'], scope['path']))
+        if handler is not None:
+            await instrumented(handler, scope, receive, send)
+            return
+    elif scope['type'] == 'websocket':
+        if scope['path'].startswith(EXERCISE_STREAM_PREFIX):
+            await exercise_stream(scope, receive, send)
+        else:
+            await receive()
+            await send({'type': 'websocket.close', 'code': 4404})
+        return
+    elif scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                cpu_pool.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    await wsgi_adapter(scope, receive, send)
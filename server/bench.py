@@ -0,0 +1,517 @@
+"""Benchmarks for the hot paths in server/.
+
+    python bench.py                    run everything, compare against the baseline
+    python bench.py -k recommend       only benchmarks whose name contains "recommend"
+    python bench.py --save-baseline    store this run as this machine's baseline
+    python bench.py --list
+
+Every run is written to .benchmarks/<timestamp>.json; the comparison is made
+against .benchmarks/baseline.json (or the previous run when there is no
+baseline) and benchmarks whose median got slower than --threshold are
+reported as regressions (exit status 1 with --fail-on-regression). Timings
+only compare on the same machine, so .benchmarks/ is not committed: save a
+baseline locally (or in CI) from the commit you are comparing against.
+
+Fixtures are built from the sample reports in the repository root (b.pdf,
+c.pdf, t.pdf) and the CSVs: report texts are generated from b.pdf's layout
+with panel values drawn from indian_diet_dataset.csv.
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from io import BytesIO
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SERVER_DIR)
+RESULTS_DIR = os.path.join(SERVER_DIR, '.benchmarks')
+SAMPLE_REPORTS = ['b.pdf', 'c.pdf', 't.pdf']
+
+BENCHMARKS = {}
+
+
+def benchmark(name, min_rounds=5, min_time=0.2):
+    """Register a benchmark; the decorated function returns the callable to time"""
+    def register(setup):
+        BENCHMARKS[name] = {'setup': setup, 'min_rounds': min_rounds, 'min_time': min_time}
+        return setup
+    return register
+
+
+# --- fixtures --------------------------------------------------------------
+
+_cache = {}
+
+
+def _once(key, build):
+    if key not in _cache:
+        _cache[key] = build()
+    return _cache[key]
+
+
+@contextlib.contextmanager
+def working_directory(path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def load_back():
+    """Import back.py with its models loaded (once per benchmark run)"""
+    def build():
+        import back
+        back.load_models()
+        return back
+    return _once('back', build)
+
+
+def load_gem():
+    # gem.py reads indian_diet_dataset.csv relative to the repository root
+    def build():
+        sys.path.insert(0, ROOT_DIR)
+        with working_directory(ROOT_DIR):
+            import gem
+        return gem
+    return _once('gem', build)
+
+
+def sample_report_bytes():
+    def build():
+        reports = {}
+        for name in SAMPLE_REPORTS:
+            with open(os.path.join(ROOT_DIR, name), 'rb') as f:
+                reports[name] = f.read()
+        return reports
+    return _once('sample_reports', build)
+
+
+def panel_rows(n=200):
+    """Blood panels from indian_diet_dataset.csv as dicts keyed like AVERAGE_VALUES"""
+    def build():
+        import pandas as pd
+        df = pd.read_csv(os.path.join(ROOT_DIR, 'indian_diet_dataset.csv'))
+        rows = []
+        for row in df.head(1000).itertuples(index=False):
+            rows.append({
+                "Fasting Blood Sugar": round(row.Fasting_Blood_Sugar, 1),
+                "Post Prandial Blood Sugar": round(row.Post_Prandial_Blood_Sugar, 1),
+                "Thyroxine": round(row.Thyroxine, 2),
+                "Cholesterol": round(row.Cholesterol),
+                "LDL Cholesterol": round(row.LDL_Cholesterol),
+                "HDL Cholesterol": round(row.HDL_Cholesterol),
+            })
+        return rows
+    return _once('panels', build)[:n]
+
+
+def held_out_panels(n=200):
+    """Panels drawn like indian_diet_dataset.py's, from another seed, so no strategy has seen them"""
+    def build():
+        import numpy as np
+        rng = np.random.default_rng(7)
+        spread = {"Fasting Blood Sugar": (90, 15), "Post Prandial Blood Sugar": (120, 20), "Thyroxine": (1.5, 0.3),
+                  "Cholesterol": (180, 30), "LDL Cholesterol": (90, 20), "HDL Cholesterol": (50, 10)}
+        columns = {field: rng.normal(mean, std, 1000).round(2) for field, (mean, std) in spread.items()}
+        return [{field: float(values[i]) for field, values in columns.items()} for i in range(1000)]
+    return _once('held_out_panels', build)[:n]
+
+
+def synthetic_report_text(panel):
+    """A report in b.pdf's text layout carrying the given panel values"""
+    return (
+        "Bio.Ref.Range Unit Value InvestigationBIOCHEMISTRY\n"
+        "Glucose (F & Pp), Plasma\n"
+        f"Blood Sugar Fasting {panel['Fasting Blood Sugar']} mg/dL 70 -- 110\n"
+        "Urine Glucose - Fasting Sample Not Received\n"
+        "Method Hexokinase\n"
+        f"Glucose - Post Prandial {panel['Post Prandial Blood Sugar']} mg/dL 80 -- 140\n"
+        f"Thyroxine {panel['Thyroxine']} ng/dL 0.9 -- 2.3\n"
+        f"Cholesterol {panel['Cholesterol']} mg/dL < 200\n"
+        f"LDL Cholesterol {panel['LDL Cholesterol']} mg/dL < 130\n"
+        f"HDL Cholesterol {panel['HDL Cholesterol']} mg/dL > 40\n"
+    )
+
+
+def synthetic_report_texts(n=200):
+    return [synthetic_report_text(panel) for panel in panel_rows(n)]
+
+
+def synthetic_report_pdf(panel):
+    """Render a synthetic report to PDF bytes that PyPDF2 can read back"""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=letter)
+    y = 720
+    for line in synthetic_report_text(panel).splitlines():
+        pdf.drawString(72, y, line)
+        y -= 16
+    pdf.save()
+    return buffer.getvalue()
+
+
+def health_condition_grid():
+    levels = ['high', 'normal', 'low']
+    bmi = ['underweight', 'normal', 'overweight', 'obese']
+    return [
+        {'blood_sugar_level': s, 'cholesterol_level': c, 'bmi_category': b}
+        for s in levels for c in levels for b in bmi
+    ]
+
+
+def sample_user_info():
+    return {'name': 'Bench', 'age': 40, 'weight': 68.0, 'height': 162.0,
+            'dairy_allergy': False, 'peanut_allergy': False}
+
+
+# --- benchmarks ------------------------------------------------------------
+
+def _subprocess_timer(code):
+    def run():
+        subprocess.run([sys.executable, '-c', code], cwd=SERVER_DIR, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return run
+
+
+@benchmark('cold_start.import_back', min_rounds=3, min_time=0)
+def bench_import_back():
+    return _subprocess_timer('import back')
+
+
+@benchmark('cold_start.create_app', min_rounds=3, min_time=0)
+def bench_create_app():
+    return _subprocess_timer('import back; back.create_app()')
+
+
+@benchmark('diet_recommender.load', min_rounds=5)
+def bench_recommender_load():
+    from diet_recommender import DietRecommender
+    return DietRecommender
+
+
+@benchmark('recommend_foods.single')
+def bench_recommend_single():
+    load_back()
+    import model_state
+    conditions = {'blood_sugar_level': 'high', 'cholesterol_level': 'normal', 'bmi_category': 'overweight'}
+    return lambda: model_state.diet_recommender.recommend_foods(conditions, 'breakfast')
+
+
+@benchmark('recommend_foods.batch')
+def bench_recommend_batch():
+    load_back()
+    import model_state
+    grid = health_condition_grid()
+
+    requests = [(conditions, meal_type) for conditions in grid
+                for meal_type in ('breakfast', 'lunch', 'dinner', 'snacks')]
+    return lambda: model_state.diet_recommender.recommend_foods_batch(requests)
+
+
+@benchmark('meal_planner.plan_day')
+def bench_plan_day():
+    from food_catalog import allergen_mask
+    from meal_planner import plan_day
+    grid = health_condition_grid()
+    dairy = allergen_mask(['dairy'])
+
+    def run():
+        for i, conditions in enumerate(grid):
+            plan_day(1800 + 20 * i, conditions, dairy if i % 2 else 0)
+    return run
+
+
+@benchmark('extract_data_from_report')
+def bench_extract():
+    back = load_back()
+    texts = synthetic_report_texts(200)
+
+    def run():
+        for text in texts:
+            back.extract_data_from_report(text)
+    return run
+
+
+@benchmark('pypdf2.parse')
+def bench_pdf_parse():
+    import PyPDF2
+    reports = list(sample_report_bytes().values())
+
+    def run():
+        for data in reports:
+            reader = PyPDF2.PdfReader(BytesIO(data))
+            "".join(page.extract_text() for page in reader.pages)
+    return run
+
+
+@benchmark('generate_pdf_report')
+def bench_generate_pdf_report():
+    back = load_back()
+    data = back.extract_data_from_report(synthetic_report_text(panel_rows(1)[0]))
+    recommendations, diet = back.health_recommendation(data)
+    diet['daily_calories'] = 2000
+    analysis = {'blood': recommendations, 'cholesterol': {}, 'thyroxine': {}}
+    return lambda: back.generate_pdf_report(sample_user_info(), analysis, diet, 24.0, 2000)
+
+
+@benchmark('generate_pdf')
+def bench_generate_pdf():
+    back = load_back()
+    user_input = {'Age': 30, 'Gender': 'female', 'Weight': 60.0, 'Height': 165.0,
+                  'Diseases': 'none', 'ActivityLevel': 3, 'Goal': 1}
+    plan = back.recommend_meal_and_workout(user_input)
+    return lambda: back.generate_pdf(plan, "No reports uploaded.", "")
+
+
+@benchmark('gem.get_indian_diet_recommendations')
+def bench_gem_recommendations():
+    gem = load_gem()
+    panel = panel_rows(1)[0]
+    return lambda: gem.get_indian_diet_recommendations(panel)
+
+
+def _status_inputs(n):
+    panels = held_out_panels(n)
+    return panels, [17 + (i % 20) for i in range(len(panels))]
+
+
+@benchmark('health_rules.single')
+def bench_health_rules_single():
+    from analysis_engine import classify_health_conditions
+    from report_routes import analyze_health_status
+    panels, bmis = _status_inputs(1000)
+
+    def run():
+        for panel, bmi in zip(panels, bmis):
+            classify_health_conditions(panel, bmi)
+            analyze_health_status(bmi, panel)
+    return run
+
+
+@benchmark('health_rules.batch')
+def bench_health_rules_batch():
+    import health_rules
+    panels, bmis = _status_inputs(1000)
+
+    def run():
+        health_rules.condition_levels(panels, bmis)
+        health_rules.health_status_batch(bmis, panels)
+    return run
+
+
+def _rep_stream_batches(exercise, streams, batch=8):
+    """One 8-frame batch per stream, as the WebSocket receives them, JSON and binary"""
+    import numpy as np
+    import rep_counter
+    recording = rep_counter.synthesize(exercise, reps=3, partial_every=2)
+    texts, blobs = [], []
+    for s in range(streams):
+        start = (s * batch) % (len(recording) - batch)
+        frames = recording[start:start + batch]
+        texts.append(json.dumps({'frames': [f['landmarks'] for f in frames], 'timestamps': [f['t'] for f in frames]}))
+        blobs.append(np.hstack([np.array([[f['t']] for f in frames]),
+                                np.array([f['landmarks'] for f in frames]).reshape(batch, -1)]).astype('<f4').tobytes())
+    return texts, blobs
+
+
+@benchmark('rep_counter.streams_json')
+def bench_rep_streams_json():
+    import rep_counter
+    texts, _ = _rep_stream_batches('squats', 300)
+    counters = [rep_counter.RepCounter('squats') for _ in texts]
+    return lambda: [rep_counter.handle_message(c, text) for c, text in zip(counters, texts)]
+
+
+@benchmark('rep_counter.streams_binary')
+def bench_rep_streams_binary():
+    import rep_counter
+    _, blobs = _rep_stream_batches('squats', 300)
+    counters = [rep_counter.RepCounter('squats') for _ in blobs]
+    return lambda: [rep_counter.handle_message(c, blob) for c, blob in zip(counters, blobs)]
+
+
+def _cache_benchmark(url):
+    """1000 hits on a recommendations-sized value; redis:// runs against fake_redis.py on loopback"""
+    def setup():
+        import cache_backends
+        import fake_redis
+        server = _once('fake_redis', fake_redis.start_in_thread)
+        cache = cache_backends.Cache('bench', cache_backends.from_url(url.replace('URL', server.url)))
+        value = {'recommendations': ["Focus on heart-healthy diet and regular exercise"] * 4,
+                 'diet_recommendations': {meal: [{'item': f'{meal} {i}', 'calories': 180.0 + i, 'protein': 6.5}
+                                                 for i in range(6)] for meal in ('breakfast', 'lunch', 'dinner')}}
+        keys = [f'user:{i}' for i in range(1000)]
+        for key in keys:
+            cache.set(key, value)
+        return lambda: [cache.get(key) for key in keys]
+    return setup
+
+
+for _name, _url in (('memory', 'memory://'), ('redis', 'URL'), ('tiered', 'tiered+URL')):
+    benchmark(f'cache.{_name}')(_cache_benchmark(_url))
+
+
+def held_out_cases():
+    """(panels, diets) of the dataset cases held out of knn, with their labelled diets"""
+    def build():
+        import analysis_engine
+        panels, diets = analysis_engine.read_dataset()
+        holdout = analysis_engine.HOLDOUT_CASES
+        return panels[-holdout:], diets[-holdout:]
+    return _once('held_out_cases', build)
+
+
+def _analysis_benchmark(name):
+    def setup():
+        import analysis_engine
+        if name == 'model':
+            load_back()
+        if name == 'knn':
+            # Without the held-out cases, or it would find each one's own label
+            strategy = analysis_engine.KnnStrategy(holdout=analysis_engine.HOLDOUT_CASES)
+            strategy.prepare()
+        else:
+            strategy = analysis_engine.get_strategy(name)
+        panels, diets = held_out_cases()
+
+        def run():
+            return strategy.recommend(panels)
+        # Accuracy next to the timing, so the fastest acceptable strategy can be picked
+        recommendations = run()
+        run.scores = {'diet_agreement': analysis_engine.diet_agreement(recommendations, diets),
+                      'exact_overlap': analysis_engine.diet_agreement(recommendations, diets, exact=True)}
+        return run
+    return setup
+
+
+for _strategy in ('model', 'knn', 'rules'):
+    benchmark(f'analysis.{_strategy}')(_analysis_benchmark(_strategy))
+
+
+def _analyzereport_benchmark(cached):
+    """POST /analyzereport with the same upload every round. Uncached, the profile cache is
+    emptied first so every stage (extraction, recommendations, PDF) runs; cached, the
+    warm-up round fills it and the rounds time the resubmission path"""
+    def setup():
+        import report_routes
+        back = load_back()
+        client = back.app.test_client()
+        report = synthetic_report_pdf(panel_rows(1)[0])
+        form = {k: str(v) for k, v in sample_user_info().items()}
+
+        def run():
+            if not cached:
+                report_routes.profile_cache.clear()
+            data = dict(form, file=(BytesIO(report), 'blood_report.pdf'))
+            response = client.post('/analyzereport', data=data, content_type='multipart/form-data')
+            assert response.status_code == 200, response.data
+        return run
+    return setup
+
+
+benchmark('endpoint.analyzereport')(_analyzereport_benchmark(cached=False))
+benchmark('endpoint.analyzereport.cached')(_analyzereport_benchmark(cached=True))
+
+
+# --- runner ----------------------------------------------------------------
+
+def measure(fn, min_rounds, min_time):
+    fn()  # warm-up
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < min_rounds or time.perf_counter() - started < min_time:
+        t0 = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - t0)
+    return {
+        'rounds': len(timings),
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.fmean(timings),
+        'stdev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+    }
+
+
+def _previous_results():
+    baseline = os.path.join(RESULTS_DIR, 'baseline.json')
+    if os.path.exists(baseline):
+        return baseline
+    runs = sorted(f for f in os.listdir(RESULTS_DIR) if f[0].isdigit()) if os.path.isdir(RESULTS_DIR) else []
+    return os.path.join(RESULTS_DIR, runs[-1]) if runs else None
+
+
+def compare(results, previous_path, threshold):
+    with open(previous_path) as f:
+        previous = json.load(f)['benchmarks']
+    regressions = []
+    print(f"\nCompared with {os.path.relpath(previous_path, SERVER_DIR)}:")
+    for name, stats in results.items():
+        if name not in previous:
+            continue
+        before, after = previous[name]['median'], stats['median']
+        change = (after - before) / before if before else 0.0
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"  {name:<40} {before * 1000:10.3f} -> {after * 1000:10.3f} ms  {change:+7.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-k', dest='pattern', help='only run benchmarks whose name contains this')
+    parser.add_argument('--list', action='store_true')
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed median slowdown (default 0.2 = 20%%)')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args(argv)
+
+    selected = [name for name in BENCHMARKS if not args.pattern or args.pattern in name]
+    if args.list:
+        print("\n".join(selected))
+        return 0
+
+    os.chdir(SERVER_DIR)
+    previous_path = _previous_results()
+    results = {}
+    print(f"{'benchmark':<40} {'median ms':>10} {'min ms':>10} {'rounds':>7}")
+    for name in selected:
+        spec = BENCHMARKS[name]
+        fn = spec['setup']()
+        stats = measure(fn, spec['min_rounds'], spec['min_time'])
+        scores = getattr(fn, 'scores', {})
+        results[name] = dict(stats, **scores)
+        print(f"{name:<40} {stats['median'] * 1000:10.3f} {stats['min'] * 1000:10.3f} {stats['rounds']:7d}"
+              + ''.join(f"  {metric} {value:.3f}" for metric, value in scores.items()))
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    record = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'benchmarks': results,
+    }
+    run_path = os.path.join(RESULTS_DIR, datetime.datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    with open(run_path, 'w') as f:
+        json.dump(record, f, indent=2)
+    if args.save_baseline:
+        with open(os.path.join(RESULTS_DIR, 'baseline.json'), 'w') as f:
+            json.dump(record, f, indent=2)
+
+    regressions = compare(results, previous_path, args.threshold) if previous_path else []
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,468 @@
+"""Cache backends that can be shared by workers and by the nodes behind a load balancer.
+
+ARISE_CACHE_URL picks where cached values live:
+
+    memory://                       in-process LRU (the default: per worker, lost on restart)
+    disk:///var/cache/arise         files in a local directory, shared by the workers on a node
+    redis://[:password@]host:6379/0 a server speaking the Redis protocol, shared by every node
+    tiered+redis://host:6379/0      the same, with hot keys also kept in a small in-process LRU
+    tiered+disk:///var/cache/arise
+
+Backends store bytes. Cache adds a namespace per use, JSON values and the
+arise_cache_requests_total{cache=<namespace>} counters. A backend that can't
+be reached, or a disk that is full, unreadable or holds a truncated file,
+counts under arise_cache_errors_total and reads as a miss, so a cache outage
+makes requests slower but never fails them. In tiered mode a
+value another node changes can look stale here for up to
+ARISE_CACHE_NEAR_TTL seconds. fake_redis.py is a local stand-in server.
+
+    ARISE_CACHE_TTL        seconds values are kept (default 7 days; 0: until evicted)
+    ARISE_CACHE_NEAR_TTL   seconds the near tier keeps a copy (default 30)
+    ARISE_CACHE_MEMORY_MB  size of the in-process LRU, and of the near tier (default 64)
+    ARISE_CACHE_DISK_MB    size the disk backend is pruned back to (default 1024)
+"""
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import socket
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import unquote, urlsplit
+
+import metrics
+
+logger = logging.getLogger('arise.cache')
+
+CACHE_URL = os.environ.get('ARISE_CACHE_URL', 'memory://')
+DEFAULT_TTL = float(os.environ.get('ARISE_CACHE_TTL', str(7 * 24 * 3600)))
+NEAR_TTL = float(os.environ.get('ARISE_CACHE_NEAR_TTL', '30'))
+MEMORY_MAX_BYTES = int(float(os.environ.get('ARISE_CACHE_MEMORY_MB', '64')) * 2 ** 20)
+DISK_MAX_BYTES = int(float(os.environ.get('ARISE_CACHE_DISK_MB', '1024')) * 2 ** 20)
+RETRY_SECONDS = 5.0    # how long an unreachable server is skipped before reconnecting
+SOCKET_TIMEOUT = 1.0
+
+
+class CacheUnavailable(Exception):
+    """The backend couldn't be reached or refused the command"""
+
+
+def input_hash(inputs):
+    """Stable digest of JSON-like inputs (dict key order doesn't matter)"""
+    if isinstance(inputs, bytes):
+        return hashlib.sha256(inputs).hexdigest()
+    encoded = json.dumps(inputs, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class MemoryBackend:
+    """LRU bounded by the total size of its values; expired entries are dropped when read"""
+    remote = False
+
+    def __init__(self, max_bytes=MEMORY_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()     # key -> (expiry time or None, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] is not None and entry[0] <= time.monotonic():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._pop(key)
+            if len(value) > self.max_bytes:
+                return
+            self._entries[key] = (expires, value)
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, (_, oldest) = self._entries.popitem(last=False)
+                self.size -= len(oldest)
+
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self, prefix=''):
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                self._pop(key)
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+
+class DiskBackend:
+    """One file per key under `directory`, written atomically so every worker on the node
+    can share it. Reads bump the file's mtime; when more than a tenth of max_bytes has been
+    written since the last check, the least recently used files are removed until the
+    directory is back under max_bytes."""
+    remote = False
+    # expiry (unix time, 0: none), key length; then the key and the value
+    HEADER = struct.Struct('<dI')
+
+    def __init__(self, directory, max_bytes=DISK_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._written = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _read(self, path):
+        """(key, expiry, value) stored in path, None if it's gone or unreadable"""
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            raise CacheUnavailable(f"Can't read {path}: {e}") from e
+        try:
+            expires, key_length = self.HEADER.unpack_from(data)
+            start = self.HEADER.size
+            key = data[start:start + key_length].decode()
+        except (struct.error, UnicodeDecodeError):
+            # Truncated (a full disk, a crash mid-copy) or not ours: drop it, it reads as a miss
+            logger.warning("Removing corrupt cache file %s", path)
+            self._remove(path)
+            return None
+        return key, expires, data[start + key_length:]
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            raise CacheUnavailable(f"Can't remove {path}: {e}") from e
+
+    def get(self, key):
+        path = self._path(key)
+        entry = self._read(path)
+        if entry is None:
+            return None
+        stored_key, expires, value = entry
+        if stored_key != key:
+            return None
+        if expires and expires <= time.time():
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key, value, ttl=None):
+        path = self._path(key)
+        encoded = key.encode()
+        header = self.HEADER.pack(time.time() + ttl if ttl else 0.0, len(encoded))
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        except OSError as e:
+            raise CacheUnavailable(f"Can't write {path}: {e}") from e
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header + encoded + value)
+            os.replace(temporary, path)
+        except BaseException as e:
+            # ENOSPC, EACCES...: leave no partial file behind, and report a write failure
+            with contextlib.suppress(OSError):
+                os.remove(temporary)
+            if isinstance(e, OSError):
+                raise CacheUnavailable(f"Can't write {path}: {e}") from e
+            raise
+        with self._lock:
+            self._written += len(value)
+            prune = self._written > self.max_bytes / 10
+            if prune:
+                self._written = 0
+        if prune:
+            self.prune()
+
+    def delete(self, key):
+        self._remove(self._path(key))
+
+    def _files(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith('.tmp'):
+                    yield os.path.join(root, name)
+
+    def clear(self, prefix=''):
+        for path in list(self._files()):
+            entry = self._read(path)
+            if entry is not None and entry[0].startswith(prefix):
+                self._remove(path)
+
+    def prune(self):
+        """Remove expired files, then the least recently used until under max_bytes"""
+        now = time.time()
+        files = []
+        for path in self._files():
+            try:
+                stat = os.stat(path)
+                with open(path, 'rb') as f:
+                    expires, _ = self.HEADER.unpack(f.read(self.HEADER.size))
+            except (OSError, struct.error):
+                continue
+            if expires and expires <= now:
+                self._remove(path)
+            else:
+                files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+
+def encode_command(*args):
+    """A command as a RESP array of bulk strings"""
+    parts = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+    return b''.join(parts)
+
+
+def read_reply(stream):
+    """One RESP2 reply from a buffered binary stream; error replies raise CacheUnavailable"""
+    line = stream.readline()
+    if not line.endswith(b'\r\n'):
+        raise ConnectionError("Connection closed mid-reply")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b'+':
+        return rest.decode()
+    if kind == b'-':
+        raise CacheUnavailable(rest.decode())
+    if kind == b':':
+        return int(rest)
+    if kind == b'$':
+        length = int(rest)
+        if length < 0:
+            return None
+        data = stream.read(length + 2)
+        if len(data) != length + 2:
+            raise ConnectionError("Connection closed mid-reply")
+        return data[:-2]
+    if kind == b'*':
+        length = int(rest)
+        return None if length < 0 else [read_reply(stream) for _ in range(length)]
+    raise CacheUnavailable(f"Unexpected reply {line[:40]!r}")
+
+
+class RedisBackend:
+    """Minimal Redis protocol client (GET, SET with PX, DEL, SCAN), one connection per thread.
+    After a failure the server is skipped for RETRY_SECONDS instead of paying a connect
+    timeout on every call."""
+    remote = True
+
+    def __init__(self, url, timeout=SOCKET_TIMEOUT):
+        parts = urlsplit(url)
+        self.host = parts.hostname or '127.0.0.1'
+        self.port = parts.port or 6379
+        self.db = int(parts.path.strip('/') or 0)
+        self.password = unquote(parts.password) if parts.password else None
+        self.timeout = timeout
+        self._local = threading.local()
+        self._down_until = 0.0
+
+    @property
+    def address(self):
+        return f"{self.host}:{self.port}/{self.db}"
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        stream = sock.makefile('rb')
+        setup = ([('AUTH', self.password)] if self.password else []) + ([('SELECT', self.db)] if self.db else [])
+        for command in setup:
+            sock.sendall(encode_command(*command))
+            read_reply(stream)
+        return os.getpid(), sock, stream
+
+    def _close(self):
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            connection[1].close()
+
+    def command(self, *args):
+        if time.monotonic() < self._down_until:
+            raise CacheUnavailable(f"{self.address} is marked down")
+        try:
+            connection = getattr(self._local, 'connection', None)
+            # A forked worker must not share its parent's socket
+            if connection is None or connection[0] != os.getpid():
+                connection = self._local.connection = self._connect()
+            connection[1].sendall(encode_command(*args))
+            return read_reply(connection[2])
+        except (OSError, ConnectionError, CacheUnavailable) as e:
+            self._close()
+            self._down_until = time.monotonic() + RETRY_SECONDS
+            logger.warning("Cache server %s unavailable for %ss: %s", self.address, RETRY_SECONDS, e)
+            raise CacheUnavailable(str(e)) from e
+
+    def get(self, key):
+        return self.command('GET', key)
+
+    def set(self, key, value, ttl=None):
+        if ttl:
+            self.command('SET', key, value, 'PX', max(1, int(ttl * 1000)))
+        else:
+            self.command('SET', key, value)
+
+    def delete(self, key):
+        self.command('DEL', key)
+
+    def clear(self, prefix=''):
+        pattern = ''.join('\\' + c if c in '*?[]\\' else c for c in prefix) + '*'
+        cursor = b'0'
+        while True:
+            cursor, keys = self.command('SCAN', cursor, 'MATCH', pattern, 'COUNT', 1000)
+            if keys:
+                self.command('DEL', *keys)
+            if cursor == b'0':
+                break
+
+
+class TieredBackend:
+    """Reads try the in-process `near` tier before the shared `far` one; far hits and all
+    writes also go to near, for near_ttl seconds"""
+
+    def __init__(self, near, far, near_ttl=NEAR_TTL):
+        self.near = near
+        self.far = far
+        self.near_ttl = near_ttl
+        self.remote = far.remote
+
+    def _near_ttl(self, ttl):
+        return min(ttl, self.near_ttl) if ttl else self.near_ttl
+
+    def get(self, key):
+        value = self.near.get(key)
+        if value is None:
+            value = self.far.get(key)
+            if value is not None:
+                self.near.set(key, value, self.near_ttl)
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.near.set(key, value, self._near_ttl(ttl))
+        self.far.set(key, value, ttl)
+
+    def delete(self, key):
+        self.near.delete(key)
+        self.far.delete(key)
+
+    def clear(self, prefix=''):
+        self.near.clear(prefix)
+        self.far.clear(prefix)
+
+
+def from_url(url):
+    """Backend for an ARISE_CACHE_URL (see the module docstring)"""
+    scheme, _, rest = url.partition('://')
+    if scheme.startswith('tiered+'):
+        return TieredBackend(MemoryBackend(), from_url(url[len('tiered+'):]))
+    if scheme == 'memory':
+        return MemoryBackend()
+    if scheme in ('disk', 'file'):
+        return DiskBackend(rest or 'cache')
+    if scheme in ('redis', 'resp'):
+        return RedisBackend(url)
+    raise ValueError(f"Unknown cache backend '{url}'; expected memory://, disk://, redis:// or tiered+...")
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """The process-wide backend for ARISE_CACHE_URL, created on first use"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = from_url(CACHE_URL)
+    return _backend
+
+
+def set_backend(backend):
+    """Replace the process-wide backend (used by bench.py and scripts)"""
+    global _backend
+    _backend = backend
+
+
+class Cache:
+    """Values stored under `namespace` in a backend (the process-wide one unless given).
+    Hits and misses count under arise_cache_requests_total{cache=<namespace>}"""
+
+    def __init__(self, namespace, backend=None, ttl=DEFAULT_TTL):
+        self.namespace = namespace
+        self.ttl = ttl
+        self._backend = backend
+
+    @property
+    def backend(self):
+        return self._backend or get_backend()
+
+    def _call(self, method, key, *args):
+        try:
+            return getattr(self.backend, method)(f'{self.namespace}:{key}', *args)
+        except (CacheUnavailable, OSError):
+            # Backends report failures as CacheUnavailable; OSError is the net for anything missed
+            metrics.CACHE_ERRORS.inc(cache=self.namespace)
+            return None
+
+    def get_bytes(self, key):
+        value = self._call('get', key)
+        metrics.record_cache(self.namespace, value is not None)
+        return value
+
+    def set_bytes(self, key, value, ttl=None):
+        self._call('set', key, value, self.ttl if ttl is None else ttl)
+
+    def get(self, key):
+        """Cached JSON value or None; every call gets its own copy"""
+        value = self.get_bytes(key)
+        return None if value is None else json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        self.set_bytes(key, json.dumps(value, separators=(',', ':')).encode(), ttl)
+
+    def get_or_compute(self, key, compute, ttl=None):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value, ttl)
+        return value
+
+    def delete(self, key):
+        self._call('delete', key)
+
+    def clear(self, prefix=''):
+        self._call('clear', prefix)
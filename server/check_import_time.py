@@ -0,0 +1,59 @@
+"""Import-time budget for back.py.
+
+    python check_import_time.py                  # fails if `import back` is over budget
+    python check_import_time.py --budget-ms 300 --top 15
+
+Runs `python -X importtime -c "import back"` in a fresh interpreter, prints
+the slowest modules and exits non-zero if the cumulative import time of back
+exceeds the budget (ARISE_IMPORT_BUDGET_MS, default 500 ms) or if any of the
+heavy stacks that must stay lazy was imported.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+BUDGET_MS = float(os.environ.get('ARISE_IMPORT_BUDGET_MS', '500'))
+
+# Top-level packages only the warm-up thread or the first request may import
+LAZY_MODULES = ('sklearn', 'scipy', 'pandas', 'numpy', 'reportlab', 'xhtml2pdf', 'PyPDF2', 'pdf2image',
+                'pytesseract', 'google.generativeai', 'joblib')
+
+
+def import_times(module='back'):
+    """{module: (self_us, cumulative_us)} for everything importing `module` pulls in"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=SERVER_DIR, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='back')
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS)
+    parser.add_argument('--top', type=int, default=10, help='slowest modules to list')
+    args = parser.parse_args(argv)
+
+    times = import_times(args.module)
+    total_ms = times[args.module][1] / 1000
+    print(f"import {args.module}: {total_ms:.0f} ms (budget {args.budget_ms:.0f} ms)")
+    for name, (self_us, _) in sorted(times.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f"  {self_us / 1000:8.1f} ms  {name}")
+
+    eager = sorted(name for name in LAZY_MODULES if name in times)
+    if eager:
+        print(f"Imported eagerly, should be lazy: {', '.join(eager)}")
+    if total_ms > args.budget_ms:
+        print("Over budget")
+    return 1 if eager or total_ms > args.budget_ms else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
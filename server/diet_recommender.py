@@ -8,11 +8,107 @@ from sklearn.neighbors import KNeighborsClassifier
 from sklearn.naive_bayes import GaussianNB
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, classification_report
 import joblib
+import json
 import os
-import random
+import time
+from scipy.optimize import minimize
+from food_catalog import get_catalog
+from serving_format import FlatForest, Scaler, save_bundle, load_bundle
+
+# Possible values of the categorical features. Training encodes each column with
+# a LabelEncoder, which numbers the values in sorted order, so serving looks the
+# codes up in the same sorted order.
+CATEGORIES = {
+    'blood_sugar_level': ['high', 'normal', 'low'],
+    'cholesterol_level': ['high', 'normal', 'low'],
+    'bmi_category': ['underweight', 'normal', 'overweight', 'obese'],
+    'meal_type': ['breakfast', 'lunch', 'dinner', 'snacks']
+}
+CATEGORY_CODES = {col: {value: code for code, value in enumerate(sorted(values))}
+                  for col, values in CATEGORIES.items()}
+NUMERICAL_FEATURES = ['calories', 'protein', 'carbs', 'fats', 'fiber']
+FEATURES = NUMERICAL_FEATURES + list(CATEGORIES)
+CATEGORY_DEFAULTS = {'blood_sugar_level': 'normal', 'cholesterol_level': 'normal', 'bmi_category': 'normal'}
+
+def top_k(scores, k):
+    """Column indices of the k best scores in each row, best first
+
+    scores is a (rows, classes) array; -inf marks classes that must not be picked,
+    so a row can come back with fewer than k indices. argpartition finds the k
+    winners in linear time and only those k get sorted.
+    """
+    scores = np.atleast_2d(scores)
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return [np.empty(0, dtype=np.intp) for _ in range(len(scores))]
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    best_scores = np.take_along_axis(scores, best, axis=1)
+    order = np.argsort(-best_scores, axis=1, kind='stable')
+    best = np.take_along_axis(best, order, axis=1)
+    feasible = np.isfinite(np.take_along_axis(best_scores, order, axis=1))
+    return [row[ok] for row, ok in zip(best, feasible)]
+
+def expand_features(X):
+    """Feature map of the distilled scorer: scaled numerics and their squares,
+    one-hot categories, and numerics per meal type"""
+    n = len(NUMERICAL_FEATURES)
+    numeric = X[:, :n]
+    parts = [numeric, numeric ** 2]
+    for column, (col, values) in enumerate(CATEGORIES.items(), start=n):
+        one_hot = np.eye(len(values))[X[:, column].astype(np.intp)]
+        parts.append(one_hot)
+    parts.append((one_hot[:, :, None] * numeric[:, None, :]).reshape(len(X), -1))
+    return np.hstack(parts)
+
+class DistilledScorer:
+    """Softmax regression fitted to a teacher model's probabilities; plain NumPy at serving"""
+
+    def __init__(self, weights, bias, classes, meta=None):
+        self.weights = weights
+        self.bias = bias
+        self.classes_ = classes
+        self.meta = meta or {}
+
+    def predict_proba(self, X):
+        logits = expand_features(np.asarray(X, dtype=np.float64)) @ self.weights + self.bias
+        logits -= logits.max(axis=1, keepdims=True)
+        np.exp(logits, out=logits)
+        logits /= logits.sum(axis=1, keepdims=True)
+        return logits
+
+    @classmethod
+    def fit(cls, X, teacher_probabilities, classes, l2=1e-3):
+        """Minimise cross-entropy against the teacher's soft labels with L-BFGS"""
+        F = expand_features(X)
+        n_features, n_classes = F.shape[1], teacher_probabilities.shape[1]
+
+        def loss(params):
+            W = params[:-n_classes].reshape(n_features, n_classes)
+            b = params[-n_classes:]
+            logits = F @ W + b
+            logits -= logits.max(axis=1, keepdims=True)
+            log_p = logits - np.log(np.exp(logits).sum(axis=1, keepdims=True))
+            value = -(teacher_probabilities * log_p).sum() / len(F) + 0.5 * l2 * (W ** 2).sum()
+            residual = (np.exp(log_p) - teacher_probabilities) / len(F)
+            grad_W = F.T @ residual + l2 * W
+            return value, np.concatenate([grad_W.ravel(), residual.sum(axis=0)])
+
+        result = minimize(loss, np.zeros(n_features * n_classes + n_classes), jac=True,
+                          method='L-BFGS-B', options={'maxiter': 500})
+        weights = result.x[:-n_classes].reshape(n_features, n_classes)
+        return cls(weights, result.x[-n_classes:], np.asarray(classes))
+
+    def save(self, path):
+        np.savez(path, weights=self.weights, bias=self.bias, classes=self.classes_.astype(str),
+                 meta=np.array(json.dumps(self.meta)))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['weights'], data['bias'], data['classes'], json.loads(str(data['meta'])))
 
 class DietRecommender:
-    def __init__(self):
+    def __init__(self, model_dir='models'):
         self.models = {
             'Random Forest': RandomForestClassifier(
                 n_estimators=200,
@@ -42,158 +138,80 @@ class DietRecommender:
         self.best_model = None
         self.scaler = StandardScaler()
         self.label_encoder = LabelEncoder()
-        self.model_path = 'models/diet_recommender.pkl'
-        self.scaler_path = 'models/scaler.pkl'
-        self.encoder_path = 'models/label_encoder.pkl'
+        self.model_dir = model_dir
+        self.model_path = os.path.join(model_dir, 'diet_recommender.pkl')
+        self.scaler_path = os.path.join(model_dir, 'scaler.pkl')
+        self.encoder_path = os.path.join(model_dir, 'label_encoder.pkl')
+        self.metrics_path = os.path.join(model_dir, 'training_metrics.json')
+        self.scorer_path = os.path.join(model_dir, 'diet_scorer.npz')
+        self.serving_dir = os.path.join(model_dir, 'serving')
+        self.model_scores = {}
+        # Distilled stand-in for best_model, used for serving when present
+        self.scorer = None
+        self.distillation_report = {}
+        # Optional feedback.FeedbackLearner that reweights probabilities online
+        self.feedback = None
         
         # Create models directory if it doesn't exist
-        os.makedirs('models', exist_ok=True)
+        os.makedirs(model_dir, exist_ok=True)
         
-        # Load or create model
-        if os.path.exists(self.model_path):
+        # Load or create model; the pickle-free serving bundle is preferred
+        if os.path.exists(os.path.join(self.serving_dir, 'manifest.json')):
+            self.load_serving()
+        elif os.path.exists(self.model_path):
             self.load_model()
         else:
             self.create_and_train_models()
 
-    def create_sample_dataset(self):
-        """Create a comprehensive dataset of Indian food items and health conditions"""
+    def create_sample_dataset(self, rng=None):
+        """Create a comprehensive dataset of Indian food items and health conditions
+
+        rng: a numpy Generator to draw from (a fresh unseeded one if not given)
+        """
+        rng = np.random.default_rng() if rng is None else rng
         # Define all possible values for categorical features
         blood_sugar_levels = ['high', 'normal', 'low']
         cholesterol_levels = ['high', 'normal', 'low']
         bmi_categories = ['underweight', 'normal', 'overweight', 'obese']
         meal_types = ['breakfast', 'lunch', 'dinner', 'snacks']
         
-        # Base food items with their nutritional values
-        base_foods = {
-            # Breakfast items
-            'breakfast': [
-                {'name': 'Oats with almond milk', 'calories': 300, 'protein': 10, 'carbs': 45, 'fats': 8, 'fiber': 6},
-                {'name': 'Whole wheat toast', 'calories': 250, 'protein': 8, 'carbs': 40, 'fats': 6, 'fiber': 5},
-                {'name': 'Idli with sambar', 'calories': 280, 'protein': 12, 'carbs': 50, 'fats': 7, 'fiber': 7},
-                {'name': 'Poha with vegetables', 'calories': 280, 'protein': 9, 'carbs': 45, 'fats': 7, 'fiber': 6},
-                {'name': 'Upma with vegetables', 'calories': 300, 'protein': 10, 'carbs': 48, 'fats': 8, 'fiber': 7},
-                {'name': 'Dosa with chutney', 'calories': 320, 'protein': 11, 'carbs': 52, 'fats': 9, 'fiber': 8},
-                {'name': 'Besan chilla', 'calories': 250, 'protein': 12, 'carbs': 40, 'fats': 6, 'fiber': 5},
-                {'name': 'Methi paratha', 'calories': 300, 'protein': 10, 'carbs': 45, 'fats': 8, 'fiber': 6},
-                {'name': 'Moong dal cheela', 'calories': 280, 'protein': 11, 'carbs': 42, 'fats': 7, 'fiber': 6},
-                {'name': 'Ragi dosa', 'calories': 290, 'protein': 9, 'carbs': 44, 'fats': 7, 'fiber': 7},
-                {'name': 'Vegetable uttapam', 'calories': 310, 'protein': 11, 'carbs': 50, 'fats': 8, 'fiber': 8},
-                {'name': 'Sabudana khichdi', 'calories': 270, 'protein': 8, 'carbs': 46, 'fats': 6, 'fiber': 5},
-                {'name': 'Rava idli', 'calories': 260, 'protein': 9, 'carbs': 43, 'fats': 6, 'fiber': 6},
-                {'name': 'Vegetable sandwich', 'calories': 290, 'protein': 10, 'carbs': 45, 'fats': 7, 'fiber': 7},
-                {'name': 'Sprouts salad', 'calories': 200, 'protein': 8, 'carbs': 30, 'fats': 5, 'fiber': 8}
-            ],
-            # Lunch items
-            'lunch': [
-                {'name': 'Brown rice with dal', 'calories': 400, 'protein': 15, 'carbs': 60, 'fats': 10, 'fiber': 8},
-                {'name': 'Roti with palak tofu', 'calories': 350, 'protein': 14, 'carbs': 55, 'fats': 9, 'fiber': 7},
-                {'name': 'Quinoa salad', 'calories': 380, 'protein': 13, 'carbs': 58, 'fats': 12, 'fiber': 9},
-                {'name': 'Jeera rice with dal', 'calories': 400, 'protein': 14, 'carbs': 58, 'fats': 10, 'fiber': 7},
-                {'name': 'Chapati with curry', 'calories': 350, 'protein': 12, 'carbs': 56, 'fats': 9, 'fiber': 8},
-                {'name': 'Vegetable pulao', 'calories': 380, 'protein': 13, 'carbs': 60, 'fats': 11, 'fiber': 9},
-                {'name': 'Rajma chawal', 'calories': 450, 'protein': 16, 'carbs': 65, 'fats': 12, 'fiber': 8},
-                {'name': 'Dal tadka with rice', 'calories': 400, 'protein': 15, 'carbs': 60, 'fats': 10, 'fiber': 7},
-                {'name': 'Vegetable biryani', 'calories': 420, 'protein': 14, 'carbs': 62, 'fats': 11, 'fiber': 8},
-                {'name': 'Sambar rice', 'calories': 380, 'protein': 13, 'carbs': 58, 'fats': 10, 'fiber': 8},
-                {'name': 'Curd rice', 'calories': 360, 'protein': 12, 'carbs': 55, 'fats': 9, 'fiber': 7},
-                {'name': 'Vegetable khichdi', 'calories': 370, 'protein': 13, 'carbs': 57, 'fats': 10, 'fiber': 8},
-                {'name': 'Dal rice with ghee', 'calories': 390, 'protein': 14, 'carbs': 59, 'fats': 11, 'fiber': 7},
-                {'name': 'Vegetable fried rice', 'calories': 410, 'protein': 13, 'carbs': 61, 'fats': 12, 'fiber': 8},
-                {'name': 'Paneer butter masala with roti', 'calories': 440, 'protein': 15, 'carbs': 58, 'fats': 13, 'fiber': 7}
-            ],
-            # Dinner items
-            'dinner': [
-                {'name': 'Moong dal khichdi', 'calories': 350, 'protein': 16, 'carbs': 55, 'fats': 8, 'fiber': 8},
-                {'name': 'Vegetable soup', 'calories': 300, 'protein': 8, 'carbs': 40, 'fats': 5, 'fiber': 6},
-                {'name': 'Grilled fish', 'calories': 400, 'protein': 25, 'carbs': 0, 'fats': 15, 'fiber': 0},
-                {'name': 'Dal rice with ghee', 'calories': 350, 'protein': 12, 'carbs': 50, 'fats': 8, 'fiber': 7},
-                {'name': 'Vegetable khichdi', 'calories': 300, 'protein': 10, 'carbs': 45, 'fats': 6, 'fiber': 6},
-                {'name': 'Chapati with dal', 'calories': 320, 'protein': 12, 'carbs': 48, 'fats': 8, 'fiber': 7},
-                {'name': 'Vegetable upma', 'calories': 300, 'protein': 10, 'carbs': 45, 'fats': 6, 'fiber': 6},
-                {'name': 'Sambar rice', 'calories': 350, 'protein': 12, 'carbs': 50, 'fats': 8, 'fiber': 7},
-                {'name': 'Curd rice', 'calories': 300, 'protein': 10, 'carbs': 45, 'fats': 6, 'fiber': 6},
-                {'name': 'Vegetable pulao', 'calories': 340, 'protein': 11, 'carbs': 52, 'fats': 7, 'fiber': 7},
-                {'name': 'Dal tadka with roti', 'calories': 330, 'protein': 12, 'carbs': 48, 'fats': 8, 'fiber': 7},
-                {'name': 'Vegetable biryani', 'calories': 360, 'protein': 13, 'carbs': 55, 'fats': 9, 'fiber': 8},
-                {'name': 'Paneer curry with roti', 'calories': 380, 'protein': 14, 'carbs': 50, 'fats': 10, 'fiber': 7},
-                {'name': 'Vegetable stew with appam', 'calories': 340, 'protein': 11, 'carbs': 52, 'fats': 7, 'fiber': 7},
-                {'name': 'Dal makhani with roti', 'calories': 370, 'protein': 13, 'carbs': 54, 'fats': 9, 'fiber': 8}
-            ],
-            # Snacks
-            'snacks': [
-                {'name': 'Sprouts salad', 'calories': 200, 'protein': 8, 'carbs': 30, 'fats': 5, 'fiber': 8},
-                {'name': 'Fruit smoothie', 'calories': 250, 'protein': 6, 'carbs': 40, 'fats': 6, 'fiber': 5},
-                {'name': 'Vegetable sandwich', 'calories': 300, 'protein': 10, 'carbs': 45, 'fats': 8, 'fiber': 6},
-                {'name': 'Roasted makhana', 'calories': 150, 'protein': 5, 'carbs': 25, 'fats': 4, 'fiber': 4},
-                {'name': 'Fruit chaat', 'calories': 200, 'protein': 4, 'carbs': 35, 'fats': 5, 'fiber': 5},
-                {'name': 'Bhel puri', 'calories': 250, 'protein': 6, 'carbs': 40, 'fats': 6, 'fiber': 6},
-                {'name': 'Roasted chana', 'calories': 180, 'protein': 7, 'carbs': 28, 'fats': 5, 'fiber': 7},
-                {'name': 'Vegetable soup', 'calories': 150, 'protein': 5, 'carbs': 25, 'fats': 4, 'fiber': 5},
-                {'name': 'Fruit salad', 'calories': 180, 'protein': 4, 'carbs': 30, 'fats': 5, 'fiber': 5},
-                {'name': 'Roasted peanuts', 'calories': 200, 'protein': 8, 'carbs': 20, 'fats': 6, 'fiber': 6},
-                {'name': 'Vegetable cutlet', 'calories': 220, 'protein': 7, 'carbs': 35, 'fats': 7, 'fiber': 6},
-                {'name': 'Fruit yogurt', 'calories': 180, 'protein': 6, 'carbs': 30, 'fats': 5, 'fiber': 5},
-                {'name': 'Roasted corn', 'calories': 160, 'protein': 5, 'carbs': 32, 'fats': 4, 'fiber': 5},
-                {'name': 'Vegetable roll', 'calories': 240, 'protein': 8, 'carbs': 38, 'fats': 7, 'fiber': 6},
-                {'name': 'Fruit juice', 'calories': 150, 'protein': 3, 'carbs': 35, 'fats': 4, 'fiber': 4}
-            ]
-        }
+        # Training foods and their nutritional values come from the shared catalog
+        catalog = get_catalog()
+        num_entries = 500  # 500 entries per meal type
+        
+        # Randomly select a food item for every entry of each meal type
+        chosen = np.concatenate([
+            rng.choice(catalog.select(meal_type=meal_type, source='model'), num_entries)
+            for meal_type in meal_types
+        ])
+        foods = catalog.entries[chosen]
+        total = len(chosen)
         
-        # Generate 2000 entries
+        # Generate 2000 entries with random health conditions
         data = {
-            'food_item': [],
-            'calories': [],
-            'protein': [],
-            'carbs': [],
-            'fats': [],
-            'fiber': [],
-            'blood_sugar_level': [],
-            'cholesterol_level': [],
-            'bmi_category': [],
-            'meal_type': []
+            'food_item': catalog.names_for(chosen),
+            'calories': foods['calories'].astype(int),
+            'protein': foods['protein'].astype(int),
+            'carbs': foods['carbs'].astype(int),
+            'fats': foods['fats'].astype(int),
+            'fiber': foods['fiber'].astype(int),
+            'blood_sugar_level': rng.choice(blood_sugar_levels, total),
+            'cholesterol_level': rng.choice(cholesterol_levels, total),
+            'bmi_category': rng.choice(bmi_categories, total),
+            'meal_type': np.repeat(meal_types, num_entries)
         }
         
-        # Generate entries for each meal type
-        for meal_type in meal_types:
-            num_entries = 500  # 500 entries per meal type
-            for _ in range(num_entries):
-                # Randomly select a food item
-                food = random.choice(base_foods[meal_type])
-                
-                # Add food details
-                data['food_item'].append(food['name'])
-                data['calories'].append(food['calories'])
-                data['protein'].append(food['protein'])
-                data['carbs'].append(food['carbs'])
-                data['fats'].append(food['fats'])
-                data['fiber'].append(food['fiber'])
-                
-                # Add health conditions
-                data['blood_sugar_level'].append(random.choice(blood_sugar_levels))
-                data['cholesterol_level'].append(random.choice(cholesterol_levels))
-                data['bmi_category'].append(random.choice(bmi_categories))
-                data['meal_type'].append(meal_type)
-        
         return pd.DataFrame(data)
 
     def preprocess_data(self, df):
         """Preprocess the data for training"""
-        # Define all possible categories
-        all_categories = {
-            'blood_sugar_level': ['high', 'normal', 'low'],
-            'cholesterol_level': ['high', 'normal', 'low'],
-            'bmi_category': ['underweight', 'normal', 'overweight', 'obese'],
-            'meal_type': ['breakfast', 'lunch', 'dinner', 'snacks']
-        }
-        
         # Fit label encoders with all possible categories
-        for col, categories in all_categories.items():
+        for col, categories in CATEGORIES.items():
             self.label_encoder.fit(categories)
             df[col] = self.label_encoder.transform(df[col])
         
         # Scale numerical features
-        numerical_features = ['calories', 'protein', 'carbs', 'fats', 'fiber']
-        df[numerical_features] = self.scaler.fit_transform(df[numerical_features])
+        df[NUMERICAL_FEATURES] = self.scaler.fit_transform(df[NUMERICAL_FEATURES])
         
         return df
 
@@ -271,55 +289,235 @@ class DietRecommender:
             print(f"{name:<20} {scores['accuracy']:.4f}    {scores['precision']:.4f}    {scores['recall']:.4f}    {scores['f1']:.4f}    {scores['cv_mean']:.4f}")
         print("=" * 80)
         print(f"\nBest Model: {self.best_model_name} (F1 Score: {best_score:.4f})")
+        self.model_scores = model_scores
+        
+        # Compress the best model into a NumPy scorer for serving
+        self.distill()
         
         # Save best model and preprocessing objects
         self.save_model()
+        self.export_serving()
 
     def save_model(self):
         """Save the trained model and preprocessing objects"""
         joblib.dump(self.best_model, self.model_path)
         joblib.dump(self.scaler, self.scaler_path)
         joblib.dump(self.label_encoder, self.encoder_path)
+        self.save_scorer()
+        with open(self.metrics_path, 'w') as f:
+            json.dump({
+                'best_model': getattr(self, 'best_model_name', None),
+                'scores': self.model_scores,
+                'distillation': self.distillation_report
+            }, f, indent=2)
+
+    def export_serving(self):
+        """Write the serving bundle (see serving_format.py); only tree ensembles can be flattened"""
+        try:
+            forest = FlatForest.from_sklearn(self.best_model)
+        except TypeError:
+            print(f"{self.teacher_name} can't be exported to the serving format; serving will use the pickle")
+            return False
+        save_bundle(self.serving_dir, forest, Scaler(self.scaler.mean_, self.scaler.scale_),
+                    FEATURES, CATEGORIES, self.scorer, teacher=self.teacher_name)
+        return True
+
+    def load_serving(self):
+        """Load the memory-mapped serving bundle; no unpickling"""
+        manifest, self.best_model, self.scaler, arrays = load_bundle(self.serving_dir)
+        self.best_model_name = manifest.get('teacher')
+        if os.path.exists(self.metrics_path):
+            with open(self.metrics_path) as f:
+                self.model_scores = json.load(f).get('scores', {})
+        if manifest.get('scorer'):
+            self.scorer = DistilledScorer(arrays['scorer_weights'], arrays['scorer_bias'],
+                                          np.array(manifest['scorer']['classes']), manifest['scorer']['meta'])
+            self.distillation_report = self.scorer.meta.get('report', {})
+        else:
+            self.distill()
+
+    def save_scorer(self):
+        if self.scorer is not None:
+            self.scorer.save(self.scorer_path)
 
     def load_model(self):
         """Load the trained model and preprocessing objects"""
         self.best_model = joblib.load(self.model_path)
         self.scaler = joblib.load(self.scaler_path)
         self.label_encoder = joblib.load(self.encoder_path)
+        # Training metrics are only written by create_and_train_models
+        if os.path.exists(self.metrics_path):
+            with open(self.metrics_path) as f:
+                stored = json.load(f)
+            self.best_model_name = stored.get('best_model')
+            self.model_scores = stored.get('scores', {})
+        if os.path.exists(self.scorer_path):
+            self.scorer = DistilledScorer.load(self.scorer_path)
+            self.distillation_report = self.scorer.meta.get('report', {})
+        else:
+            # Models trained before distillation existed: distill once and keep it
+            self.distill()
+            self.save_scorer()
+
+    def _encode_dataset(self, df):
+        """Model input for a create_sample_dataset() frame, using the fitted scaler"""
+        requests = [(row, row['meal_type']) for row in df.to_dict('records')]
+        return self._features(requests)
+
+    def distill(self, seed=42):
+        """Fit a DistilledScorer to best_model and compare the two on held-out data
+
+        The teacher is queried on a fresh sample dataset (the training distribution)
+        and on every category combination with empty nutrients, which is what
+        health_recommendation sends at serving time.
+        """
+        # A local generator: reseeding numpy's global one would reset it for the whole process
+        rng = np.random.default_rng(seed)
+        classes = self.best_model.classes_
+        served = []
+        for blood_sugar in CATEGORIES['blood_sugar_level']:
+            for cholesterol in CATEGORIES['cholesterol_level']:
+                for bmi in CATEGORIES['bmi_category']:
+                    for meal_type in CATEGORIES['meal_type']:
+                        served.append(({'blood_sugar_level': blood_sugar, 'cholesterol_level': cholesterol,
+                                        'bmi_category': bmi}, meal_type))
+        X_served = self._features(served)
+        X = np.vstack([self._encode_dataset(self.create_sample_dataset(rng)), X_served])
+        teacher = self.best_model.predict_proba(pd.DataFrame(X, columns=FEATURES))
+        scorer = DistilledScorer.fit(X, teacher, classes)
+
+        # Held-out comparison: labelled rows the teacher could have predicted
+        holdout = self.create_sample_dataset(rng)
+        holdout = holdout[holdout['food_item'].isin(classes)]
+        X_test = np.vstack([self._encode_dataset(holdout), X_served])
+        y_test = holdout['food_item'].to_numpy()
+        teacher_test = self.best_model.predict_proba(pd.DataFrame(X_test, columns=FEATURES))
+        student_test = scorer.predict_proba(X_test)
+        labelled = slice(0, len(y_test))
+        teacher_top3 = [set(row) for row in top_k(teacher_test, 3)]
+        student_top3 = [set(row) for row in top_k(student_test, 3)]
+
+        def latency_ms(predict, rows, rounds=20):
+            started = time.perf_counter()
+            for _ in range(rounds):
+                predict(rows)
+            return (time.perf_counter() - started) / rounds * 1000
+
+        single = X_served[:1]
+        teacher_predict = lambda rows: self.best_model.predict_proba(pd.DataFrame(rows, columns=FEATURES))
+        self.distillation_report = {
+            'teacher_accuracy': float((classes[teacher_test[labelled].argmax(axis=1)] == y_test).mean()),
+            'student_accuracy': float((classes[student_test[labelled].argmax(axis=1)] == y_test).mean()),
+            'top1_agreement': float((teacher_test.argmax(axis=1) == student_test.argmax(axis=1)).mean()),
+            'top3_overlap': float(np.mean([len(t & s) / 3 for t, s in zip(teacher_top3, student_top3)])),
+            'mean_abs_prob_error': float(np.abs(teacher_test - student_test).mean()),
+            'teacher_ms_single': latency_ms(teacher_predict, single),
+            'student_ms_single': latency_ms(scorer.predict_proba, single),
+            'teacher_ms_batch': latency_ms(teacher_predict, X_served),
+            'student_ms_batch': latency_ms(scorer.predict_proba, X_served),
+            'batch_rows': len(X_served),
+        }
+        scorer.meta = {'teacher': self.teacher_name, 'report': self.distillation_report}
+        self.scorer = scorer
+        self.print_distillation_report()
+        return self.distillation_report
+
+    @property
+    def teacher_name(self):
+        return getattr(self, 'best_model_name', None) or type(self.best_model).__name__
+
+    def print_distillation_report(self):
+        report = self.distillation_report
+        print(f"\nDistilled scorer vs {self.teacher_name}:")
+        print(f"{'':<24} {'teacher':>10} {'student':>10}")
+        print(f"{'accuracy':<24} {report['teacher_accuracy']:10.4f} {report['student_accuracy']:10.4f}")
+        print(f"{'latency 1 row (ms)':<24} {report['teacher_ms_single']:10.3f} {report['student_ms_single']:10.3f}")
+        print(f"{'latency %d rows (ms)' % report['batch_rows']:<24} "
+              f"{report['teacher_ms_batch']:10.3f} {report['student_ms_batch']:10.3f}")
+        print(f"top-1 agreement {report['top1_agreement']:.4f}, top-3 overlap {report['top3_overlap']:.4f}, "
+              f"mean |p error| {report['mean_abs_prob_error']:.4f}")
+
+    def _class_mask(self, meal_type=None, exclude_allergens=0):
+        """Which model classes may be recommended for a meal and allergen bit mask (cached)"""
+        # Cached against the serving model's classes array itself (as feedback.py does), not its
+        # id(): distill() or a reload may free the old model and a new one reuse the id
+        classes = self.serving_model.classes_
+        cached_classes, cache = self.__dict__.get('_class_mask_cache', (None, None))
+        if cached_classes is not classes:
+            cache = {}
+            self._class_mask_cache = (classes, cache)
+        key = (meal_type, exclude_allergens)
+        if key not in cache:
+            cache[key] = get_catalog().allowed(list(classes), meal_type, exclude_allergens)
+        return cache[key]
 
-    def recommend_foods(self, health_conditions, meal_type, num_recommendations=3):
-        """Recommend foods based on health conditions using the best model"""
+    def _features(self, requests):
+        """Model input for (health_conditions, meal_type) pairs, encoded and scaled"""
+        X = np.empty((len(requests), len(FEATURES)), dtype=np.float64)
+        for row, (health_conditions, meal_type) in enumerate(requests):
+            X[row, :len(NUMERICAL_FEATURES)] = [health_conditions.get(col, 0) for col in NUMERICAL_FEATURES]
+            for column, col in enumerate(CATEGORIES, start=len(NUMERICAL_FEATURES)):
+                value = meal_type if col == 'meal_type' else health_conditions.get(col, CATEGORY_DEFAULTS[col])
+                X[row, column] = CATEGORY_CODES[col][value]
+        n = len(NUMERICAL_FEATURES)
+        X[:, :n] = (X[:, :n] - self.scaler.mean_) / self.scaler.scale_
+        return X
+
+    @property
+    def serving_model(self):
+        return self.scorer if self.scorer is not None else self.best_model
+
+    def predict_proba(self, X):
+        """Class probabilities from the serving model for _features() rows"""
+        if self.scorer is not None:
+            return self.scorer.predict_proba(X)
+        return self.best_model.predict_proba(pd.DataFrame(X, columns=FEATURES))
+
+    def recommend_foods(self, health_conditions, meal_type, num_recommendations=3, exclude_allergens=0):
+        """Recommend foods based on health conditions using the best model
+
+        exclude_allergens is a food_catalog allergen bit mask; foods carrying any of
+        those allergens, or not served at meal_type, are removed before ranking.
+        """
+        return self.recommend_foods_batch([(health_conditions, meal_type)], num_recommendations,
+                                          exclude_allergens)[0]
+
+    def recommend_foods_batch(self, requests, num_recommendations=3, exclude_allergens=0, mask=None):
+        """recommend_foods for many (health_conditions, meal_type) pairs in one model call
+
+        mask is an optional boolean (len(requests), n_classes) array of classes to
+        allow on top of the meal-type and allergen filters.
+        """
+        requests = list(requests)
         try:
-            # Create input features
-            input_features = pd.DataFrame({
-                'calories': [health_conditions.get('calories', 0)],
-                'protein': [health_conditions.get('protein', 0)],
-                'carbs': [health_conditions.get('carbs', 0)],
-                'fats': [health_conditions.get('fats', 0)],
-                'fiber': [health_conditions.get('fiber', 0)],
-                'blood_sugar_level': [health_conditions.get('blood_sugar_level', 'normal')],
-                'cholesterol_level': [health_conditions.get('cholesterol_level', 'normal')],
-                'bmi_category': [health_conditions.get('bmi_category', 'normal')],
-                'meal_type': [meal_type]
-            })
-            
-            # Preprocess input
-            for col in ['blood_sugar_level', 'cholesterol_level', 'bmi_category', 'meal_type']:
-                input_features[col] = self.label_encoder.transform(input_features[col])
-            
-            numerical_features = ['calories', 'protein', 'carbs', 'fats', 'fiber']
-            input_features[numerical_features] = self.scaler.transform(input_features[numerical_features])
-            
-            # Get predictions from best model
-            probabilities = self.best_model.predict_proba(input_features)[0]
-            top_indices = np.argsort(probabilities)[-num_recommendations:][::-1]
-            recommended_foods = [self.best_model.classes_[i] for i in top_indices]
-            
-            return recommended_foods
+            probabilities = self.predict_proba(self._features(requests))
+            if self.feedback is not None:
+                probabilities = self.feedback.adjust(probabilities, requests, self.serving_model.classes_)
+            allowed = np.stack([self._class_mask(meal_type, exclude_allergens) for _, meal_type in requests])
+            if mask is not None:
+                allowed &= mask
+            top = top_k(np.where(allowed, probabilities, -np.inf), num_recommendations)
+            classes = self.serving_model.classes_
+            return [[str(classes[i]) for i in row] for row in top]
         except Exception as e:
             print(f"Error in recommend_foods: {str(e)}")
-            # Return default recommendations if ML fails
-            return ['Oats with almond milk', 'Whole wheat toast', 'Idli with sambar']
+            return [self.default_foods(meal_type, num_recommendations, exclude_allergens)
+                    for _, meal_type in requests]
+
+    def default_foods(self, meal_type, num_recommendations=3, exclude_allergens=0):
+        """Default recommendations if ML fails, minus anything the user is allergic to"""
+        catalog = get_catalog()
+        defaults = ['Oats with almond milk', 'Whole wheat toast', 'Idli with sambar']
+        foods = [food for food, safe in zip(defaults, catalog.allergen_free(defaults, exclude_allergens)) if safe]
+        if len(foods) < num_recommendations:
+            # Top up with allergen-free training foods for this meal
+            for index in catalog.select(meal_type=meal_type, source='model', exclude_allergens=exclude_allergens):
+                name = catalog.name(index)
+                if name not in foods:
+                    foods.append(name)
+                if len(foods) == num_recommendations:
+                    break
+        return foods[:num_recommendations]
 
 # Example usage
 if __name__ == "__main__":
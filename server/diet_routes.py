@@ -0,0 +1,311 @@
+"""/diet: meal and workout plan, Gemini diet suggestions and the xhtml2pdf report.
+
+pandas, scikit-learn, Gemini, pytesseract and xhtml2pdf are imported on first
+use (or by back.py's warm-up thread), not when this module is imported.
+"""
+import asyncio
+import os
+import re
+from io import BytesIO
+
+from flask import Blueprint, request, send_file
+
+import model_state
+from cache_backends import Cache, input_hash
+from model_state import Goal, USER_FEATURES
+from tracing import span
+
+blueprint = Blueprint('diet', __name__)
+
+LLM_MODEL = "gemini-1.5-flash"
+# Gemini answers by prompt; the prompt only depends on age, gender and goal, so most /diet
+# requests repeat one. A day keeps suggestions from going stale for good.
+llm_cache = Cache('llm', ttl=24 * 3600)
+
+# Recommend meal and workout based on user input
+def recommend_meal_and_workout(user_input):
+    import numpy as np
+    import pandas as pd
+    from food_catalog import MEAL_BITS, get_catalog
+
+    model_state.load_models()
+    workout_df = model_state.workout_df
+    user_df = pd.DataFrame([user_input])
+    user_df = model_state.preprocess_data(user_df)
+    user_cluster = model_state.clustering_pipeline.predict(user_df[USER_FEATURES])[0]
+    bmi_pred = model_state.rf_reg.predict(user_df[USER_FEATURES])[0]
+
+    catalog = get_catalog()
+    general_foods = catalog.select(source='general')
+    calories = catalog.entries['calories'][general_foods]
+
+    # Filter food items based on user's goal
+    if user_input['Goal'] == Goal.LOSE_WEIGHT:
+        food_items = general_foods[calories <= 400]
+        workout_items = workout_df[workout_df['Type'] == 'Lose Weight']
+    elif user_input['Goal'] == Goal.GAIN_WEIGHT:
+        food_items = general_foods[calories >= 500]
+        workout_items = workout_df[workout_df['Type'] == 'Gain Weight']
+    else:  # Stay Healthy
+        food_items = general_foods[(calories > 400) & (calories < 500)]
+        workout_items = workout_df[workout_df['Type'] == 'Stay Healthy']
+
+    def safe_sample(indices, meal_type, n=2):
+        filtered = indices[(catalog.entries['meals'][indices] & MEAL_BITS[meal_type]) != 0]
+        if len(filtered) > n:
+            filtered = np.random.choice(filtered, n, replace=False)
+        if not len(filtered):
+            return [{'FoodItem': 'No recommendation', 'Calories': 'N/A', 'Nutrients': 'N/A'}]
+        return [
+            {'FoodItem': catalog.name(i), 'Calories': int(catalog.entries['calories'][i]),
+             'Nutrients': catalog.nutrients_label(i)}
+            for i in filtered
+        ]
+
+    # Get 2 recommendations for each meal
+    breakfast = safe_sample(food_items, 'breakfast', 2)
+    lunch = safe_sample(food_items, 'lunch', 2)
+    dinner = safe_sample(food_items, 'dinner', 2)
+
+    # Get 2 workout recommendations
+    if len(workout_items) >= 2:
+        workout_plan = workout_items.sample(2)
+    elif not workout_items.empty:
+        workout_plan = workout_items
+    else:
+        workout_plan = pd.DataFrame({'Exercise': ['No recommendation'], 'Timing': ['N/A']})
+
+    # Build the recommendation dictionary
+    return {
+        'BMI': bmi_pred,
+        'Breakfast': breakfast,
+        'Lunch': lunch,
+        'Dinner': dinner,
+        'Workout': workout_plan.to_dict(orient='records')
+    }
+
+# Generate diet suggestions using Gemini AI
+def diet_suggestions_prompt(user_input):
+    return f"Suggest an Indian diet plan for a {user_input['Age']} year old {user_input['Gender']} with a goal to {user_input['Goal']}. Include options for breakfast, lunch, and dinner in three lines."
+
+def generate_diet_suggestions(user_input):
+    prompt = diet_suggestions_prompt(user_input)
+    key = input_hash([LLM_MODEL, prompt])
+    cached = llm_cache.get(key)
+    if cached is not None:
+        return cached
+    import google.generativeai as genai
+    model_state.load_models()  # configures the Gemini client
+    model = genai.GenerativeModel(LLM_MODEL)
+    with span('llm_call'):
+        response = model.generate_content(prompt)
+    llm_cache.set(key, response.text)
+    return response.text
+
+async def generate_diet_suggestions_async(user_input):
+    """Same as generate_diet_suggestions, without holding a thread while Gemini answers"""
+    if os.environ.get('GEMINI_API_ENDPOINT'):
+        # The REST transport used for custom endpoints has no async client
+        return await asyncio.to_thread(generate_diet_suggestions, user_input)
+    prompt = diet_suggestions_prompt(user_input)
+    key = input_hash([LLM_MODEL, prompt])
+    # A shared backend is a network round trip; keep it off the event loop
+    cached = await asyncio.to_thread(llm_cache.get, key)
+    if cached is not None:
+        return cached
+    import google.generativeai as genai
+    await asyncio.to_thread(model_state.load_models)
+    model = genai.GenerativeModel(LLM_MODEL)
+    with span('llm_call'):
+        response = await model.generate_content_async(prompt)
+    await asyncio.to_thread(llm_cache.set, key, response.text)
+    return response.text
+
+# Extract text from reports
+def extract_blood_sugar(text):
+    patterns = [
+        r'(?i)blood\s*sugar\s*[:\-]?\s*(\d+)',  # Match "Blood Sugar: 110"
+        r'(?i)sugar\s*level\s*[:\-]?\s*(\d+)'   # Match "Sugar Level: 110"
+    ]
+    for pattern in patterns:
+        match = re.search(pattern, text)
+        if match:
+            return int(match.group(1))  # Extract the value as an integer
+    return None
+
+def extract_text_from_reports(files):
+    report_details = []
+    blood_sugar_values = []
+
+    for file in files:
+        try:
+            # (Image and PDF processing logic as before)
+            # After extracting text from each page:
+            import pytesseract
+            text = pytesseract.image_to_string(image)
+            report_details.append(text)
+
+            # Try to extract blood sugar values
+            blood_sugar = extract_blood_sugar(text)
+            if blood_sugar is not None:
+                blood_sugar_values.append(blood_sugar)
+        except Exception as e:
+            report_details.append(f"Error processing file: {e}")
+
+    # Compile blood sugar values
+    if blood_sugar_values:
+        avg_blood_sugar = sum(blood_sugar_values) / len(blood_sugar_values)
+        report_details.append(f"Average Blood Sugar: {avg_blood_sugar} mg/dL")
+    else:
+        report_details.append("No blood sugar values were identified.")
+
+    return "\n".join(report_details)
+
+# Generate PDF report
+def generate_pdf(plan, report_details, diet_suggestions):
+    def format_meal(meals):
+        rows = ""
+        for meal in meals:
+            rows += f"""
+            <tr>
+                <td>{meal['FoodItem']}</td>
+                <td>{meal['Calories']}</td>
+                <td>{meal['Nutrients']}</td>
+            </tr>
+            """
+        return rows
+
+    def format_workout(workouts):
+        rows = ""
+        for workout in workouts:
+            rows += f"""
+            <p><b>Exercise:</b> {workout['Exercise']}<br>
+            <b>Timing:</b> {workout['Timing']}</p>
+            """
+        return rows
+
+    def format_diet_suggestions():
+        return f"""
+        <table style="font-size: 1.5em;">
+            <thead>
+                <tr>
+                    <th>Goal</th>
+                    <th>Meal</th>
+                    <th>Suggestions</th>
+                </tr>
+            </thead>
+            <tbody>
+                <tr>
+                    <td>Weight Loss</td>
+                    <td>Breakfast</td>
+                    <td>Oats with milk and fruits, or idli/dosa with sambar and chutney.</td>
+                </tr>
+                <tr>
+                    <td>Weight Loss</td>
+                    <td>Lunch</td>
+                    <td>Brown rice/roti with dal, vegetables (like spinach, bhindi), and a small portion of curd.</td>
+                </tr>
+                <tr>
+                    <td>Weight Loss</td>
+                    <td>Dinner</td>
+                    <td>Vegetable khichdi, or moong dal cheela with salad.</td>
+                </tr>
+                <tr>
+                    <td>Muscle Gain</td>
+                    <td>Breakfast</td>
+                    <td>2-3 whole eggs, 2 whole wheat toast with peanut butter, banana.</td>
+                </tr>
+                <tr>
+                    <td>Muscle Gain</td>
+                    <td>Lunch</td>
+                    <td>Brown rice/roti with chicken/paneer curry, dal, and mixed vegetables.</td>
+                </tr>
+                <tr>
+                    <td>Muscle Gain</td>
+                    <td>Dinner</td>
+                    <td>Chicken breast with brown rice and stir-fried vegetables, or lentils with paneer.</td>
+                </tr>
+            </tbody>
+        </table>
+        """
+
+    template = f"""
+    <html>
+    <head>
+        <style>
+            body {{ font-family: Arial, sans-serif; }}
+            h1 {{ text-align: center; color: #4CAF50; }}
+            table {{ width: 100%; border-collapse: collapse; margin-top: 20px; }}
+            th, td {{ border: 1px solid #ddd; padding: 8px; text-align: left; }}
+            th {{ background-color: #4CAF50; color: white; }}
+            .diet-suggestions {{ font-size: 1.5em; color: #FF5722; }}
+        </style>
+    </head>
+    <body>
+        <h1>Health Report</h1>
+        <h2>Recommended Meal Plan</h2>
+        <h3>Breakfast</h3>
+        <table>
+            <tr><th>Food Item</th><th>Calories</th><th>Nutrients</th></tr>
+            {format_meal(plan['Breakfast'])}
+        </table>
+        <h3>Lunch</h3>
+        <table>
+            <tr><th>Food Item</th><th>Calories</th><th>Nutrients</th></tr>
+            {format_meal(plan['Lunch'])}
+        </table>
+        <h3>Dinner</h3>
+        <table>
+            <tr><th>Food Item</th><th>Calories</th><th>Nutrients</th></tr>
+            {format_meal(plan['Dinner'])}
+        </table>
+        <h2>Workout Plan</h2>
+        {format_workout(plan['Workout'])}
+        <h2>Health Report Details</h2>
+        <p>{report_details}</p>
+        <h2>Predicted BMI</h2>
+        <p>Your predicted BMI is: <b>{plan['BMI']:.2f}</b></p>
+        <h2>Diet Suggestions</h2>
+        <div class="diet-suggestions">{format_diet_suggestions()}</div>
+    </body>
+    </html>
+    """
+
+    from xhtml2pdf import pisa
+
+    pdf_file = BytesIO()
+    with span('pdf_render'):
+        pisa.CreatePDF(BytesIO(template.encode("utf-8")), dest=pdf_file)
+    pdf_file.seek(0)
+    return pdf_file
+
+def parse_diet_form(data):
+    """Build the model input for /diet from the submitted form"""
+    return {
+        'Age': int(data['age']),
+        'Gender': data['gender'],
+        'Weight': float(data['weight']),
+        'Height': float(data['height']),
+        'Diseases': data['diseases'],
+        'ActivityLevel': int(data['activity_level']),
+        'Goal': int(data['goal'])
+    }
+
+# API routes
+@blueprint.route('/diet', methods=['POST'])
+def diet():
+    data = request.form
+    files = request.files.getlist('reports')
+
+    # Check if any reports are uploaded, else set an empty report
+    if files:
+        report_details = extract_text_from_reports(files)
+    else:
+        report_details = "No reports uploaded."
+
+    user_input = parse_diet_form(data)
+
+    recommended_plan = recommend_meal_and_workout(user_input)
+    diet_suggestions = generate_diet_suggestions(user_input)
+    pdf = generate_pdf(recommended_plan, report_details, diet_suggestions)
+    return send_file(pdf, download_name='Health_Report.pdf', as_attachment=True)
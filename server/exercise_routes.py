@@ -0,0 +1,34 @@
+"""/exercise/<exercise>: rep counting for batches of pose keypoints over plain HTTP.
+
+The server keeps nothing between calls: each response carries the counter's
+`state`, which the client sends back with its next batch, so any worker can
+take any batch. Long sessions should use the WebSocket stream in asgi.py,
+which keeps the state per connection (see rep_counter.py for the formats).
+"""
+from flask import Blueprint, jsonify, request
+
+from rep_counter import EXERCISES, RepCounter
+from tracing import span
+
+blueprint = Blueprint('exercise', __name__)
+
+@blueprint.route('/exercise', methods=['GET'])
+def list_exercises():
+    return jsonify({"exercises": list(EXERCISES)})
+
+@blueprint.route('/exercise/<exercise>', methods=['POST'])
+def count_reps(exercise):
+    """Results for one batch of frames; pass the returned `state` with the next batch"""
+    if exercise not in EXERCISES:
+        return jsonify({"error": f"Unknown exercise '{exercise}'", "exercises": list(EXERCISES)}), 404
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or 'frames' not in data:
+        return jsonify({"error": "Expected a JSON body with frames"}), 400
+    try:
+        counter = RepCounter(exercise, data.get('state'))
+        with span('rep_counter'):
+            result = counter.feed(data['frames'], data.get('timestamps'))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid batch: {e}"}), 400
+    result['state'] = counter.state()
+    return jsonify(result)
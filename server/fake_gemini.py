@@ -0,0 +1,115 @@
+"""Local stand-in for the Gemini REST API, for load tests and offline development.
+
+    python fake_gemini.py --port 8089 --latency-ms 800 --jitter-ms 200 --error-rate 0.02
+
+Point back.py at it with GEMINI_API_ENDPOINT=http://127.0.0.1:8089, which
+switches the google-generativeai client to its REST transport. Only
+generateContent is implemented; every answer is a canned three-line plan.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_PLAN = (
+    "Breakfast: Vegetable poha with a glass of buttermilk.\n"
+    "Lunch: Two rotis, moong dal, mixed vegetable sabzi and salad.\n"
+    "Dinner: Vegetable khichdi with curd."
+)
+
+
+class FakeGeminiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms=500.0, jitter_ms=0.0, error_rate=0.0, seed=None):
+        super().__init__(address, FakeGeminiHandler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+
+    @property
+    def endpoint(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def next_outcome(self):
+        """(delay in seconds, whether to fail) for the next call"""
+        with self.lock:
+            self.calls += 1
+            delay = max(0.0, self.random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+            fail = self.random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        return delay, fail
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        if not self.path.split('?')[0].endswith(':generateContent'):
+            self._send_json(404, {'error': {'code': 404, 'message': f'{self.path} not implemented', 'status': 'NOT_FOUND'}})
+            return
+
+        delay, fail = self.server.next_outcome()
+        time.sleep(delay)
+        if fail:
+            self._send_json(503, {'error': {'code': 503, 'message': 'Injected failure', 'status': 'UNAVAILABLE'}})
+            return
+        self._send_json(200, {
+            'candidates': [{
+                'content': {'parts': [{'text': CANNED_PLAN}], 'role': 'model'},
+                'finishReason': 'STOP',
+                'index': 0,
+            }],
+            'usageMetadata': {'promptTokenCount': 32, 'candidatesTokenCount': 40, 'totalTokenCount': 72},
+        })
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_in_thread(host='127.0.0.1', port=0, **options):
+    """Start a server on a background thread; port 0 picks a free port"""
+    server = FakeGeminiServer((host, port), **options)
+    thread = threading.Thread(target=server.serve_forever, name='fake-gemini', daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency-ms', type=float, default=500.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeGeminiServer((args.host, args.port), latency_ms=args.latency_ms,
+                              jitter_ms=args.jitter_ms, error_rate=args.error_rate)
+    print(f"Fake Gemini listening on {server.endpoint}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""Local stand-in for a Redis server, for tests, benchmarks and offline development.
+
+    python fake_redis.py --port 6390 --latency-ms 0.5
+
+Point the app at it with ARISE_CACHE_URL=redis://127.0.0.1:6390/0 (or
+tiered+redis://... for the near/far mode). Only what cache_backends.py uses
+is implemented: PING, AUTH, SELECT, GET, SET (EX/PX), DEL, EXISTS, SCAN,
+DBSIZE and FLUSHDB. --latency-ms delays every reply, standing in for the
+network between nodes.
+"""
+import argparse
+import fnmatch
+import socketserver
+import threading
+import time
+
+from cache_backends import CacheUnavailable, read_reply
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, latency_ms=0.0, password=None):
+        super().__init__(address, FakeRedisHandler)
+        self.latency_ms = latency_ms
+        self.password = password
+        self.databases = {}     # db -> {key: (expiry time or None, value)}
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def live(self, db, key):
+        """Value of key in db, dropping it if expired (caller holds the lock)"""
+        entry = self.databases.get(db, {}).get(key)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] <= time.monotonic():
+            del self.databases[db][key]
+            return None
+        return entry[1]
+
+
+def _simple(text):
+    return b'+%s\r\n' % text.encode()
+
+
+def _error(text):
+    return b'-%s\r\n' % text.encode()
+
+
+def _integer(n):
+    return b':%d\r\n' % n
+
+
+def _bulk(value):
+    return b'$-1\r\n' if value is None else b'$%d\r\n%s\r\n' % (len(value), value)
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        self.db = 0
+        self.authenticated = self.server.password is None
+        while True:
+            try:
+                command = read_reply(self.rfile)
+            except (ConnectionError, CacheUnavailable, ValueError):
+                return
+            if not isinstance(command, list) or not command:
+                self.wfile.write(_error("ERR expected a command array"))
+                return
+            if self.server.latency_ms:
+                time.sleep(self.server.latency_ms / 1000)
+            name = command[0].decode().upper()
+            try:
+                reply = self.execute(name, command[1:])
+            except (IndexError, ValueError) as e:
+                reply = _error(f"ERR wrong arguments for '{name.lower()}': {e}")
+            self.wfile.write(reply)
+            if name == 'QUIT':
+                return
+
+    def execute(self, name, args):
+        server = self.server
+        with server.lock:
+            server.calls += 1
+        if name == 'AUTH':
+            self.authenticated = args[-1].decode() == server.password
+            return _simple('OK') if self.authenticated else _error("WRONGPASS invalid password")
+        if not self.authenticated:
+            return _error("NOAUTH Authentication required.")
+        if name in ('PING', 'QUIT'):
+            return _simple('PONG' if name == 'PING' else 'OK')
+        if name == 'SELECT':
+            self.db = int(args[0])
+            return _simple('OK')
+
+        with server.lock:
+            data = server.databases.setdefault(self.db, {})
+            if name == 'GET':
+                return _bulk(server.live(self.db, args[0]))
+            if name == 'SET':
+                expires = None
+                options = [arg.decode().upper() for arg in args[2:]]
+                for option, value in zip(options, args[3:]):
+                    if option in ('EX', 'PX'):
+                        expires = time.monotonic() + int(value) / (1 if option == 'EX' else 1000)
+                data[args[0]] = (expires, args[1])
+                return _simple('OK')
+            if name in ('DEL', 'EXISTS'):
+                present = [key for key in args if server.live(self.db, key) is not None]
+                if name == 'DEL':
+                    for key in present:
+                        del data[key]
+                return _integer(len(present))
+            if name == 'SCAN':
+                # Everything in one pass: a returned cursor of 0 is a valid end of the scan
+                options = {args[i].decode().upper(): args[i + 1] for i in range(1, len(args) - 1, 2)}
+                pattern = options.get('MATCH', b'*').decode()
+                keys = [key for key in list(data) if server.live(self.db, key) is not None
+                        and fnmatch.fnmatchcase(key.decode(), pattern)]
+                return b'*2\r\n' + _bulk(b'0') + b'*%d\r\n' % len(keys) + b''.join(_bulk(key) for key in keys)
+            if name == 'DBSIZE':
+                return _integer(len(data))
+            if name == 'FLUSHDB':
+                data.clear()
+                return _simple('OK')
+        return _error(f"ERR unknown command '{name.lower()}'")
+
+    def finish(self):
+        try:
+            super().finish()
+        except OSError:
+            pass
+
+
+def start_in_thread(host='127.0.0.1', port=0, **options):
+    """Start a server on a background thread; port 0 picks a free port"""
+    server = FakeRedisServer((host, port), **options)
+    thread = threading.Thread(target=server.serve_forever, name='fake-redis', daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6390)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--password')
+    args = parser.parse_args()
+
+    server = FakeRedisServer((args.host, args.port), latency_ms=args.latency_ms, password=args.password)
+    print(f"Fake Redis listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
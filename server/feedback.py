@@ -0,0 +1,170 @@
+"""Online learning from accepted/rejected food feedback.
+
+POST /feedback appends one fixed-size record per event to an append-only log
+(ARISE_FEEDBACK_LOG, default feedback/events.bin). Each record stores a
+timestamp, the health-condition/meal context packed into one integer, the
+catalog name id of the food and whether it was accepted. No user details are
+kept.
+
+Every worker tails the log on a background thread and folds new events into
+per-(context, food) accept/reject counts in micro-batches. Each batch builds a
+new FeedbackScorer and swaps it in with a single reference assignment, so
+requests see either the old counts or the new ones, never a half-updated
+array, and rollouts need no restart. DietRecommender multiplies its class
+probabilities by ((accepts + 1) / (rejects + 1)) ** FEEDBACK_WEIGHT for the
+request's context.
+"""
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from diet_recommender import CATEGORIES, CATEGORY_CODES, CATEGORY_DEFAULTS
+from food_catalog import get_catalog
+
+logger = logging.getLogger('arise')
+
+LOG_PATH = os.environ.get('ARISE_FEEDBACK_LOG', os.path.join('feedback', 'events.bin'))
+INTERVAL = float(os.environ.get('ARISE_FEEDBACK_INTERVAL', '5'))
+FEEDBACK_WEIGHT = 0.5
+
+EVENT_DTYPE = np.dtype([
+    ('time', '<f8'),
+    ('context', '<u2'),
+    ('food', '<i4'),
+    ('accepted', 'u1'),
+])
+
+# Contexts are the categorical model inputs in mixed radix: 3 * 3 * 4 * 4 = 144
+_RADIX = [len(values) for values in CATEGORIES.values()]
+N_CONTEXTS = int(np.prod(_RADIX))
+
+
+def context_code(health_conditions, meal_type):
+    """One integer for the categorical inputs; raises KeyError for unknown values"""
+    code = 0
+    for col, radix in zip(CATEGORIES, _RADIX):
+        value = meal_type if col == 'meal_type' else health_conditions.get(col, CATEGORY_DEFAULTS[col])
+        code = code * radix + CATEGORY_CODES[col][value]
+    return code
+
+
+class FeedbackScorer:
+    """Accept/reject counts per (context, catalog name id); treated as immutable"""
+
+    def __init__(self, accepts, rejects):
+        self.accepts = accepts
+        self.rejects = rejects
+        self.events = int(accepts.sum() + rejects.sum())
+
+    @classmethod
+    def empty(cls, n_foods):
+        return cls(np.zeros((N_CONTEXTS, n_foods), dtype=np.int32),
+                   np.zeros((N_CONTEXTS, n_foods), dtype=np.int32))
+
+    def updated(self, events):
+        """A new scorer with `events` (an EVENT_DTYPE array) folded in"""
+        accepts, rejects = self.accepts.copy(), self.rejects.copy()
+        events = events[(events['context'] < N_CONTEXTS) & (events['food'] >= 0) &
+                        (events['food'] < accepts.shape[1])]
+        accepted = events['accepted'] != 0
+        np.add.at(accepts, (events['context'][accepted], events['food'][accepted]), 1)
+        np.add.at(rejects, (events['context'][~accepted], events['food'][~accepted]), 1)
+        return FeedbackScorer(accepts, rejects)
+
+    def weights(self, contexts, food_ids):
+        """(len(contexts), len(food_ids)) multipliers; foods unknown to the catalog get 1"""
+        weights = np.ones((len(contexts), len(food_ids)))
+        known = food_ids >= 0
+        if self.events and known.any():
+            rows = np.asarray(contexts)[:, None]
+            cols = food_ids[known][None, :]
+            ratio = (self.accepts[rows, cols] + 1.0) / (self.rejects[rows, cols] + 1.0)
+            weights[:, known] = ratio ** FEEDBACK_WEIGHT
+        return weights
+
+
+class FeedbackLearner:
+    def __init__(self, path=LOG_PATH, interval=INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.scorer = FeedbackScorer.empty(len(get_catalog().names))
+        self._offset = 0
+        self._food_ids = (None, None)     # (model classes, their catalog ids)
+        self._refresh_lock = threading.Lock()
+        self._thread_pid = None
+        self._start_lock = threading.Lock()
+
+    def record(self, food, accepted, health_conditions, meal_type):
+        """Append one event; raises ValueError for unknown foods or categories"""
+        food_id = get_catalog().name_ids.get(food)
+        if food_id is None:
+            raise ValueError(f"Unknown food '{food}'")
+        try:
+            context = context_code(health_conditions, meal_type)
+        except KeyError as e:
+            raise ValueError(f"Unknown value {e}") from None
+        event = np.array([(time.time(), context, food_id, bool(accepted))], dtype=EVENT_DTYPE)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # One O_APPEND write per record, so concurrent workers never interleave bytes
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, event.tobytes())
+        finally:
+            os.close(fd)
+
+    def refresh(self):
+        """Fold events appended since the last call into a new scorer; returns how many"""
+        with self._refresh_lock:
+            try:
+                with open(self.path, 'rb') as f:
+                    f.seek(self._offset)
+                    data = f.read()
+            except FileNotFoundError:
+                return 0
+            # A record being written right now is picked up next time
+            usable = len(data) - len(data) % EVENT_DTYPE.itemsize
+            if not usable:
+                return 0
+            events = np.frombuffer(data[:usable], dtype=EVENT_DTYPE)
+            self.scorer = self.scorer.updated(events)
+            self._offset += usable
+            return len(events)
+
+    def _run(self):
+        while True:
+            try:
+                count = self.refresh()
+                if count:
+                    logger.info("Applied %d feedback events (%d total)", count, self.scorer.events)
+            except Exception:
+                logger.exception("Feedback update failed")
+            time.sleep(self.interval)
+
+    def ensure_running(self):
+        """Start the tailing thread in this process; threads don't survive gunicorn's
+        fork, so this is also called lazily from the request path"""
+        if self._thread_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread_pid != os.getpid():
+                threading.Thread(target=self._run, name='feedback-updater', daemon=True).start()
+                self._thread_pid = os.getpid()
+
+    def adjust(self, probabilities, requests, classes):
+        """Scale model probabilities by the feedback for each request's context"""
+        self.ensure_running()
+        scorer = self.scorer
+        if not scorer.events:
+            return probabilities
+        name_ids = get_catalog().name_ids
+        # Holding the classes array itself, not its id(), so a new model's array can't be
+        # mistaken for it after the old one is freed
+        cached_classes, food_ids = self._food_ids
+        if cached_classes is not classes:
+            food_ids = np.array([name_ids.get(name, -1) for name in classes], dtype=np.int64)
+            self._food_ids = (classes, food_ids)
+        contexts = [context_code(health_conditions, meal_type) for health_conditions, meal_type in requests]
+        return probabilities * scorer.weights(contexts, food_ids)
@@ -0,0 +1,267 @@
+"""Single food catalog shared by every recommender.
+
+food_catalog.csv is the source of truth. It is compiled once into
+models/food_catalog.npy (a NumPy structured array, memory-mapped on load)
+plus models/food_catalog.json (name and label tables), and rebuilt whenever
+the CSV changes. Foods are interned: each entry points at an integer name id,
+and meal types, sources, health conditions and allergens are bit flags.
+
+An entry is one (food, nutrition) pair; foods such as "Curd rice" that come
+in different portions for lunch and dinner have one entry per meal type.
+"""
+import csv
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+CATALOG_DIR = os.path.dirname(os.path.abspath(__file__))
+CSV_PATH = os.path.join(CATALOG_DIR, 'food_catalog.csv')
+COMPILED_DIR = os.path.join(CATALOG_DIR, 'models')
+
+MEAL_TYPES = ('breakfast', 'lunch', 'dinner', 'snacks')
+SOURCES = (
+    'model',    # training foods for DietRecommender
+    'snack',    # default snack suggestions in back.health_recommendation
+    'general',  # generic meals for back.recommend_meal_and_workout
+    'indian',   # condition-specific foods from indian_diet_dataset.py
+)
+CONDITIONS = ('diabetes', 'cholesterol', 'thyroid', 'general_health')
+ALLERGENS = ('dairy', 'peanut', 'tree_nut', 'gluten', 'soy', 'egg', 'fish', 'shellfish', 'sesame')
+
+MEAL_BITS = {name: 1 << i for i, name in enumerate(MEAL_TYPES)}
+SOURCE_BITS = {name: 1 << i for i, name in enumerate(SOURCES)}
+CONDITION_BITS = {name: 1 << i for i, name in enumerate(CONDITIONS)}
+ALLERGEN_BITS = {name: 1 << i for i, name in enumerate(ALLERGENS)}
+# Other spellings accepted from clients, mapped onto ALLERGENS
+ALLERGEN_ALIASES = {
+    'milk': 'dairy', 'lactose': 'dairy',
+    'peanuts': 'peanut', 'groundnut': 'peanut', 'groundnuts': 'peanut',
+    'nuts': 'tree_nut', 'tree nut': 'tree_nut', 'tree nuts': 'tree_nut', 'tree-nut': 'tree_nut',
+    'wheat': 'gluten',
+    'soya': 'soy', 'soybean': 'soy',
+    'eggs': 'egg',
+    'seafood': 'shellfish',
+}
+ALL_MEALS = sum(MEAL_BITS.values())
+
+NUTRIENT_FIELDS = ('calories', 'protein', 'carbs', 'fats', 'fiber')
+
+CATALOG_DTYPE = np.dtype([
+    ('name_id', '<i4'),
+    ('meals', 'u1'),
+    ('sources', 'u1'),
+    ('conditions', 'u1'),
+    ('nutrients_id', 'u1'),
+    ('allergens', '<u4'),
+    ('calories', '<f4'),   # NaN where the source had no value
+    ('protein', '<f4'),
+    ('carbs', '<f4'),
+    ('fats', '<f4'),
+    ('fiber', '<f4'),
+])
+
+
+def _bits(value, table, field):
+    mask = 0
+    for item in filter(None, (part.strip() for part in value.split(';'))):
+        if item not in table:
+            raise ValueError(f"Unknown {field} '{item}' in {os.path.basename(CSV_PATH)}")
+        mask |= table[item]
+    return mask
+
+
+def _float(value):
+    return float(value) if value.strip() else np.nan
+
+
+def mask_for(names, table):
+    """OR together the bits for an iterable of names, e.g. mask_for(['dairy'], ALLERGEN_BITS)"""
+    mask = 0
+    for name in names:
+        mask |= table[name]
+    return mask
+
+
+def allergen_mask(allergies):
+    """Bit mask for allergy names as sent by clients; raises ValueError for unknown ones"""
+    mask = 0
+    for allergy in allergies:
+        key = allergy.strip().lower()
+        if not key:
+            continue
+        key = ALLERGEN_ALIASES.get(key, key)
+        if key not in ALLERGEN_BITS:
+            raise ValueError(f"Unknown allergy '{allergy}'. Supported: {', '.join(ALLERGENS)}")
+        mask |= ALLERGEN_BITS[key]
+    return mask
+
+
+class FoodCatalog:
+    def __init__(self, entries, names, nutrient_labels):
+        self.entries = entries
+        self.names = list(names)
+        self.nutrient_labels = list(nutrient_labels)
+        self.name_ids = {name: i for i, name in enumerate(self.names)}
+        # Allergens per name (union over that name's entries), for name-only lookups
+        self.name_allergens = np.zeros(len(self.names), dtype='<u4')
+        np.bitwise_or.at(self.name_allergens, np.asarray(entries['name_id']), np.asarray(entries['allergens']))
+        self.name_meals = np.zeros(len(self.names), dtype='u1')
+        np.bitwise_or.at(self.name_meals, np.asarray(entries['name_id']), np.asarray(entries['meals']))
+        self.name_conditions = np.zeros(len(self.names), dtype='u1')
+        np.bitwise_or.at(self.name_conditions, np.asarray(entries['name_id']), np.asarray(entries['conditions']))
+        # First entry per (name_id, meal) for O(1) lookups
+        self._by_name_meal = {}
+        for index, (name_id, meals) in enumerate(zip(entries['name_id'].tolist(), entries['meals'].tolist())):
+            for meal, bit in MEAL_BITS.items():
+                if meals & bit:
+                    self._by_name_meal.setdefault((name_id, meal), index)
+            self._by_name_meal.setdefault((name_id, None), index)
+
+    def __len__(self):
+        return len(self.entries)
+
+    @classmethod
+    def from_csv(cls, path=CSV_PATH):
+        names, name_ids, labels, rows = [], {}, [''], []
+        with open(path, newline='') as f:
+            for record in csv.DictReader(f):
+                name = record['name'].strip()
+                if name not in name_ids:
+                    name_ids[name] = len(names)
+                    names.append(name)
+                label = record['nutrients'].strip()
+                if label not in labels:
+                    labels.append(label)
+                meals = _bits(record['meal_types'], MEAL_BITS, 'meal type') or ALL_MEALS
+                rows.append((
+                    name_ids[name], meals,
+                    _bits(record['sources'], SOURCE_BITS, 'source'),
+                    _bits(record['conditions'], CONDITION_BITS, 'condition'),
+                    labels.index(label),
+                    _bits(record['allergens'], ALLERGEN_BITS, 'allergen'),
+                    *(_float(record[field]) for field in NUTRIENT_FIELDS),
+                ))
+        return cls(np.array(rows, dtype=CATALOG_DTYPE), names, labels)
+
+    def save(self, directory=COMPILED_DIR, source_hash=None):
+        """Write the .npy/.json pair atomically so concurrent workers never see half a file"""
+        os.makedirs(directory, exist_ok=True)
+        array_path = os.path.join(directory, 'food_catalog.npy')
+        meta_path = os.path.join(directory, 'food_catalog.json')
+        tmp_suffix = f'.{os.getpid()}.tmp'
+        with open(array_path + tmp_suffix, 'wb') as f:
+            np.save(f, self.entries)
+        with open(meta_path + tmp_suffix, 'w') as f:
+            json.dump({'source_hash': source_hash, 'names': self.names,
+                       'nutrient_labels': self.nutrient_labels}, f)
+        os.replace(array_path + tmp_suffix, array_path)
+        os.replace(meta_path + tmp_suffix, meta_path)
+
+    @classmethod
+    def load_compiled(cls, directory=COMPILED_DIR, source_hash=None):
+        """Memory-map a compiled catalog; None if missing or built from another CSV"""
+        array_path = os.path.join(directory, 'food_catalog.npy')
+        meta_path = os.path.join(directory, 'food_catalog.json')
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if source_hash is not None and meta.get('source_hash') != source_hash:
+                return None
+            entries = np.load(array_path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        if entries.dtype != CATALOG_DTYPE:
+            return None
+        return cls(entries, meta['names'], meta['nutrient_labels'])
+
+    # --- queries -----------------------------------------------------------
+
+    def select(self, meal_type=None, source=None, condition=None, exclude_allergens=0):
+        """Indices of entries matching every given filter"""
+        keep = np.ones(len(self.entries), dtype=bool)
+        if meal_type is not None:
+            keep &= (self.entries['meals'] & MEAL_BITS[meal_type]) != 0
+        if source is not None:
+            keep &= (self.entries['sources'] & SOURCE_BITS[source]) != 0
+        if condition is not None:
+            keep &= (self.entries['conditions'] & CONDITION_BITS[condition]) != 0
+        if exclude_allergens:
+            keep &= (self.entries['allergens'] & exclude_allergens) == 0
+        return np.flatnonzero(keep)
+
+    def lookup(self, name, meal_type=None):
+        """Entry index for a food, preferring its meal_type portion; None if unknown"""
+        name_id = self.name_ids.get(name)
+        if name_id is None:
+            return None
+        index = self._by_name_meal.get((name_id, meal_type))
+        return index if index is not None else self._by_name_meal[(name_id, None)]
+
+    def name(self, index):
+        return self.names[self.entries['name_id'][index]]
+
+    def names_for(self, indices):
+        name_ids = self.entries['name_id'][indices]
+        return [self.names[i] for i in name_ids.tolist()]
+
+    def allergen_free(self, names, exclude_allergens):
+        """Boolean array: True where a food name carries none of the excluded allergens
+
+        Names missing from the catalog are treated as unsafe when anything is excluded.
+        """
+        return self.allowed(names, exclude_allergens=exclude_allergens)
+
+    def allowed(self, names, meal_type=None, exclude_allergens=0):
+        """Boolean array: True where a food name is served at meal_type (if given) and
+        carries none of the excluded allergens
+
+        Names missing from the catalog are only allowed when nothing is filtered.
+        """
+        ids = np.array([self.name_ids.get(name, -1) for name in names], dtype=np.int64)
+        if meal_type is None and not exclude_allergens:
+            return np.ones(len(ids), dtype=bool)
+        known = ids >= 0
+        keep = np.zeros(len(ids), dtype=bool)
+        keep[known] = (self.name_allergens[ids[known]] & exclude_allergens) == 0
+        if meal_type is not None:
+            keep[known] &= (self.name_meals[ids[known]] & MEAL_BITS[meal_type]) != 0
+        return keep
+
+    def calories(self, name, meal_type=None, default=None):
+        index = self.lookup(name, meal_type)
+        if index is None or np.isnan(self.entries['calories'][index]):
+            return default
+        return int(self.entries['calories'][index])
+
+    def nutrients_label(self, index):
+        return self.nutrient_labels[self.entries['nutrients_id'][index]]
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def _source_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def get_catalog():
+    """The process-wide catalog, compiled from the CSV on first use if needed"""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                source_hash = _source_hash(CSV_PATH)
+                catalog = FoodCatalog.load_compiled(source_hash=source_hash)
+                if catalog is None:
+                    catalog = FoodCatalog.from_csv(CSV_PATH)
+                    try:
+                        catalog.save(source_hash=source_hash)
+                    except OSError:
+                        pass  # read-only deployment: keep the in-memory build
+                _catalog = catalog
+    return _catalog
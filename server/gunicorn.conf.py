@@ -0,0 +1,53 @@
+"""gunicorn settings for back.py; every value can be overridden from the environment.
+
+    ARISE_SERVER_MODE   wsgi (default, threaded workers) or asgi (uvicorn workers)
+    ARISE_WORKERS       worker processes (default: number of CPUs)
+    ARISE_THREADS       threads per wsgi worker (default: 4)
+    ARISE_BIND          listen address (default: 0.0.0.0:5000)
+    ARISE_TIMEOUT       seconds before a stuck worker is killed (default: 120)
+    ARISE_GRACEFUL_TIMEOUT  seconds in-flight requests get after SIGTERM (default: 30)
+    ARISE_WORKER_MEMORY_BUDGET_MB  warn when a worker's PSS exceeds this (see memory_budget.py)
+    ARISE_CACHE_URL     cache backend (see cache_backends.py); use a shared one with several workers
+"""
+import multiprocessing
+import os
+
+_mode = os.environ.get('ARISE_SERVER_MODE', 'wsgi')
+
+# back.py reads its CSVs and models/ relative to this directory
+chdir = os.path.dirname(os.path.abspath(__file__))
+
+if _mode == 'asgi':
+    wsgi_app = 'asgi:app'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'wsgi:app'
+    worker_class = 'gthread'
+    threads = int(os.environ.get('ARISE_THREADS', '4'))
+
+bind = os.environ.get('ARISE_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('ARISE_WORKERS', multiprocessing.cpu_count()))
+
+# Import the app (and train/load the models) once in the master, then fork
+preload_app = True
+
+timeout = int(os.environ.get('ARISE_TIMEOUT', '120'))
+graceful_timeout = int(os.environ.get('ARISE_GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+
+
+def on_starting(server):
+    server.log.info("Starting in %s mode with %s workers", _mode, workers)
+    if workers > 1 and os.environ.get('ARISE_CACHE_URL', 'memory://').startswith('memory'):
+        server.log.warning("ARISE_CACHE_URL is in-process: each worker keeps its own caches. "
+                           "Use disk:// or redis:// to share them")
+
+
+def post_worker_init(worker):
+    # Per-worker memory right after the fork: the preloaded models are still shared with the master
+    import memory_budget
+    memory_budget.log_memory('starting worker')
+
+
+def worker_int(worker):
+    worker.log.info("Worker %s interrupted, finishing in-flight requests", worker.pid)
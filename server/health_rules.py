@@ -0,0 +1,172 @@
+"""Threshold rules for lab panels, evaluated for a whole batch at once.
+
+Every rule is a table row naming a field (a panel value such as
+"Cholesterol", or BMI), a comparison and a threshold. A RuleTable turns its
+rows into one column gather and one comparison over a (panels, fields)
+matrix, so a batch of thousands of panels is a single NumPy pass, and the
+single-panel helpers used by the routes are the batch functions on one row.
+Supporting a new analyte means adding rows here (and its marker in
+analysis_engine for extraction); nothing else changes.
+
+Missing values never fire a rule; values that aren't numbers raise ValueError. Tables where one row is
+picked per panel use the first row that fires.
+"""
+import math
+
+# (field, comparison, threshold, advice when it fires, advice otherwise); shown on /analyzereport
+# for each field the panel has a value for
+ADVICE = (
+    ("Fasting Blood Sugar", '>', 100,
+     "Consider consulting a doctor for potential diabetes management.",
+     "Your fasting blood sugar is in the normal range."),
+    ("Cholesterol", '>', 200,
+     "Your cholesterol is high. It's advisable to consult a healthcare provider.",
+     "Your cholesterol is in the normal range."),
+)
+
+# (condition, level, field, comparison, threshold): the condition levels DietRecommender and the
+# planners take; first row that fires per condition, 'normal' otherwise
+LEVELS = (
+    ('blood_sugar_level', 'high', "Fasting Blood Sugar", '>', 100),
+    ('cholesterol_level', 'high', "Cholesterol", '>', 200),
+    ('bmi_category', 'underweight', 'BMI', '<', 18.5),
+    ('bmi_category', 'obese', 'BMI', '>=', 30),
+    ('bmi_category', 'overweight', 'BMI', '>=', 25),
+)
+CONDITION_NAMES = tuple(dict.fromkeys(row[0] for row in LEVELS))
+
+# (weight status, field, comparison, threshold, advice): first row that fires; the last row
+# applies when none does
+WEIGHT_STATUS = (
+    ("Underweight", 'BMI', '<', 18.5, "Consider increasing calorie intake with healthy foods"),
+    ("Normal weight", 'BMI', '<', 25, "Maintain current healthy eating habits"),
+    ("Overweight", 'BMI', '<', 30, "Consider reducing calorie intake and increasing physical activity"),
+    ("Obese", 'BMI', '>=', 30, "Consult a healthcare provider for weight management guidance"),
+)
+
+# (field, comparison, threshold, advice) added to the health status for every row that fires
+STATUS_ADVICE = (
+    ("Fasting Blood Sugar", '>', 100, "Monitor blood sugar levels and consider dietary modifications"),
+    ("Cholesterol", '>', 200, "Focus on heart-healthy diet and regular exercise"),
+)
+
+# (catalog condition, field, comparison, threshold): the food-catalog conditions a panel has,
+# as indian_diet_dataset.py labels its cases; general_health when none fires
+FOOD_CONDITIONS = (
+    ('diabetes', "Fasting Blood Sugar", '>', 100),
+    ('diabetes', "Post Prandial Blood Sugar", '>', 140),
+    ('cholesterol', "Cholesterol", '>', 200),
+    ('cholesterol', "LDL Cholesterol", '>', 130),
+    ('thyroid', "Thyroxine", '<', 0.9),
+    ('thyroid', "Thyroxine", '>', 2.3),
+)
+
+COMPARISONS = ('>', '>=', '<', '<=')
+
+
+def _number(value):
+    # Blank means not measured; anything else must be a number (ValueError otherwise).
+    # Extracted panels go through analysis_engine.complete_panel first, which replaces
+    # unreadable values with the averages
+    return math.nan if value is None or value == '' else float(value)
+
+
+class RuleTable:
+    """(field, comparison, threshold) rows compiled to array operations"""
+
+    def __init__(self, rows):
+        self.rows = tuple(rows)
+        for field, comparison, threshold in self.rows:
+            if comparison not in COMPARISONS:
+                raise ValueError(f"Unknown comparison '{comparison}' for {field}")
+        self.fields = tuple(dict.fromkeys(field for field, _, _ in self.rows))
+        self._compiled = {}
+
+    def _compile(self, fields):
+        import numpy as np
+        compiled = self._compiled.get(fields)
+        if compiled is None:
+            columns = np.array([fields.index(field) for field, _, _ in self.rows], dtype=np.intp)
+            # x < t is -x > -t: one signed comparison covers all four operators
+            sign = np.array([1.0 if comparison[0] == '>' else -1.0 for _, comparison, _ in self.rows])
+            strict = np.array([len(comparison) == 1 for _, comparison, _ in self.rows])
+            threshold = np.array([float(t) for _, _, t in self.rows]) * sign
+            compiled = self._compiled[fields] = columns, sign, strict, threshold
+        return compiled
+
+    def matrix(self, panels, derived=None):
+        """(len(panels), len(fields)) floats, NaN where missing; `derived` maps a field
+        that isn't in the panels (e.g. BMI) to one value per panel"""
+        import numpy as np
+        derived = derived or {}
+        matrix = np.empty((len(panels), len(self.fields)))
+        for j, field in enumerate(self.fields):
+            if field in derived:
+                matrix[:, j] = [math.nan if value is None else value for value in derived[field]]
+            else:
+                matrix[:, j] = [_number(panel.get(field)) for panel in panels]
+        return matrix
+
+    def fires(self, matrix, fields=None):
+        """(len(matrix), len(rows)) booleans; NaN never fires. `fields` names the matrix
+        columns when it isn't one built by matrix()"""
+        import numpy as np
+        columns, sign, strict, threshold = self._compile(tuple(fields or self.fields))
+        values = matrix[:, columns] * sign
+        return np.where(strict, values > threshold, values >= threshold)
+
+
+_advice = RuleTable(row[:3] for row in ADVICE)
+_levels = RuleTable(row[2:] for row in LEVELS)
+_weight = RuleTable(row[1:4] for row in WEIGHT_STATUS)
+_status_advice = RuleTable(row[:3] for row in STATUS_ADVICE)
+_food = RuleTable(row[1:] for row in FOOD_CONDITIONS)
+
+
+def _first(fires, default):
+    """Index of the first row that fires per panel, `default` where none does"""
+    import numpy as np
+    return np.where(fires.any(axis=1), fires.argmax(axis=1), default)
+
+
+def advice_batch(panels):
+    """Per panel, {field: advice} for the ADVICE fields it has a value for"""
+    fires = _advice.fires(_advice.matrix(panels)).tolist()
+    return [{row[0]: row[3] if fired else row[4]
+             for row, fired in zip(ADVICE, fire_row) if panel.get(row[0])}
+            for panel, fire_row in zip(panels, fires)]
+
+
+def condition_levels(panels, bmis=None):
+    """Per panel, {condition: level} as DietRecommender expects; bmis is optional"""
+    import numpy as np
+    derived = {'BMI': bmis if bmis is not None else [None] * len(panels)}
+    fires = _levels.fires(_levels.matrix(panels, derived))
+    columns = []
+    for condition in CONDITION_NAMES:
+        rows = [i for i, row in enumerate(LEVELS) if row[0] == condition]
+        labels = np.array([LEVELS[i][1] for i in rows] + ['normal'], dtype=object)
+        columns.append(labels[_first(fires[:, rows], len(rows))].tolist())
+    return [dict(zip(CONDITION_NAMES, levels)) for levels in zip(*columns)]
+
+
+def health_status_batch(bmis, panels):
+    """Per panel, {'weight_status', 'recommendations'} for the panel and its BMI"""
+    weight = _first(_weight.fires(_weight.matrix(panels, {'BMI': bmis})), len(WEIGHT_STATUS) - 1).tolist()
+    advice = _status_advice.fires(_status_advice.matrix(panels, {'BMI': bmis})).tolist()
+    return [{
+        "weight_status": WEIGHT_STATUS[w][0],
+        "recommendations": [WEIGHT_STATUS[w][4]] + [row[3] for row, fired in zip(STATUS_ADVICE, fired_row) if fired],
+    } for w, fired_row in zip(weight, advice)]
+
+
+def food_condition_flags(matrix, fields, conditions):
+    """(len(matrix), len(conditions)) booleans for the catalog `conditions`, from FOOD_CONDITIONS
+    over a matrix with `fields` columns; general_health where nothing else fires"""
+    import numpy as np
+    fires = _food.fires(matrix, fields)
+    flags = np.zeros((len(matrix), len(conditions)), dtype=bool)
+    for i, row in enumerate(FOOD_CONDITIONS):
+        flags[:, conditions.index(row[0])] |= fires[:, i]
+    flags[:, conditions.index('general_health')] = ~flags.any(axis=1)
+    return flags
@@ -0,0 +1,201 @@
+"""Per-patient history of extracted lab panels.
+
+    python lab_history.py trends P-1042        # trends for one patient (by patient_id)
+    python lab_history.py show P-1042
+
+/analyzereport appends every panel it extracts to a SQLite database
+(ARISE_LAB_HISTORY, default history/lab_history.sqlite3) when the request
+carries a patient_id: one row per report with the patient column (the
+patient_key() hash of that id), the report time, a hash of the uploaded file
+and one column per analyte. Requests without a patient_id get no history;
+names are never used as keys, since they are optional and not unique. Rows are
+never updated; resubmitting the same file is ignored. Values a report doesn't
+print are stored as NULL rather than the averages the recommenders fill in.
+
+Queries read one patient's rows through the (patient, taken) index straight
+into NumPy arrays, and trends and recent means (over each analyte's last
+ROLLING_WINDOW measurements) are computed on those columns for all analytes
+at once, so recommendations can use history without re-parsing old PDFs. WAL
+mode lets every gunicorn worker append concurrently.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from analysis_engine import PANEL_FIELDS
+
+DB_PATH = os.environ.get('ARISE_LAB_HISTORY', os.path.join('history', 'lab_history.sqlite3'))
+ROLLING_WINDOW = 3     # measurements of an analyte averaged by recent_average() and trends()
+SECONDS_PER_30_DAYS = 30 * 24 * 3600
+
+MAX_PATIENT_ID = 128
+
+# Column per PANEL_FIELDS entry, in the same order
+COLUMNS = ('fasting_sugar', 'post_prandial_sugar', 'thyroxine', 'cholesterol', 'ldl', 'hdl')
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS panels (
+    patient TEXT NOT NULL,
+    taken REAL NOT NULL,
+    source TEXT NOT NULL,
+    {', '.join(f'{column} REAL' for column in COLUMNS)},
+    UNIQUE (patient, source)
+);
+CREATE INDEX IF NOT EXISTS panels_patient_taken ON panels (patient, taken);
+"""
+
+
+def _value(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def recent_mean(values, window):
+    """Per column of a (n, k) array, oldest row first: the mean of its last `window`
+    non-NaN values, however many rows back they are; NaN for columns with none"""
+    import numpy as np
+    present = ~np.isnan(values)
+    # 1 on each column's latest value, 2 on the one before, ...
+    rank = np.cumsum(present[::-1], axis=0)[::-1]
+    used = present & (rank <= window)
+    counts = used.sum(axis=0)
+    sums = np.where(used, values, 0.0).sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+def slopes(times, values):
+    """Least-squares slope per column of values against times, ignoring NaNs"""
+    import numpy as np
+    present = ~np.isnan(values)
+    counts = present.sum(axis=0)
+    t = np.where(present, times[:, None], 0.0)
+    y = np.where(present, values, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t_mean = t.sum(axis=0) / counts
+        y_mean = y.sum(axis=0) / counts
+        tc = np.where(present, times[:, None] - t_mean, 0.0)
+        slope = (tc * (y - y_mean)).sum(axis=0) / (tc ** 2).sum(axis=0)
+    return np.where(counts >= 2, slope, np.nan)
+
+
+class LabHistory:
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        # One connection per thread and process; sqlite3 connections don't survive a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def append(self, patient, panel, source, taken=None):
+        """Store one report's measured values; False if this source was already stored"""
+        values = [_value(panel.get(field)) for field in PANEL_FIELDS]
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute(
+                f"INSERT OR IGNORE INTO panels (patient, taken, source, {', '.join(COLUMNS)}) "
+                f"VALUES (?, ?, ?, {', '.join('?' * len(COLUMNS))})",
+                [patient, time.time() if taken is None else taken, source] + values)
+        return cursor.rowcount == 1
+
+    def panels(self, patient, since=None, until=None):
+        """(times, values): report times and a (n, len(PANEL_FIELDS)) float array, NaN where
+        not measured, oldest first"""
+        import numpy as np
+        query = f"SELECT taken, {', '.join(COLUMNS)} FROM panels WHERE patient = ?"
+        params = [patient]
+        if since is not None:
+            query += " AND taken >= ?"
+            params.append(since)
+        if until is not None:
+            query += " AND taken < ?"
+            params.append(until)
+        rows = self._connection().execute(query + " ORDER BY taken", params).fetchall()
+        table = np.array(rows, dtype=np.float64).reshape(len(rows), len(COLUMNS) + 1)
+        return table[:, 0], table[:, 1:]
+
+    def recent_average(self, patient, window=ROLLING_WINDOW):
+        """{field: mean of the last `window` reports that measured it}, or {} without history"""
+        import numpy as np
+        _, values = self.panels(patient)
+        if not len(values):
+            return {}
+        latest = recent_mean(values, window)
+        return {field: float(value) for field, value in zip(PANEL_FIELDS, latest) if not np.isnan(value)}
+
+    def trends(self, patient, window=ROLLING_WINDOW):
+        """Per analyte: reports measured, latest value, mean of the last `window` measurements
+        and change per 30 days"""
+        import numpy as np
+        times, values = self.panels(patient)
+        if not len(times):
+            return {}
+        rolling = recent_mean(values, window)
+        per_30_days = slopes(times, values) * SECONDS_PER_30_DAYS
+        counts = (~np.isnan(values)).sum(axis=0)
+        trends = {}
+        for j, field in enumerate(PANEL_FIELDS):
+            if not counts[j]:
+                continue
+            measured = values[~np.isnan(values[:, j]), j]
+            trends[field] = {
+                'reports': int(counts[j]),
+                'latest': float(measured[-1]),
+                'rolling_mean': round(float(rolling[j]), 2),
+                'change_per_30_days': None if np.isnan(per_30_days[j]) else round(float(per_30_days[j]), 2),
+            }
+        return trends
+
+
+def patient_key(patient_id):
+    """History key for a patient_id form field; None when there is none (no history then).
+    Raises ValueError for ids that aren't short strings"""
+    if patient_id is None:
+        return None
+    if not isinstance(patient_id, (str, int)) or isinstance(patient_id, bool):
+        raise ValueError("patient_id must be a string")
+    patient_id = str(patient_id).strip()
+    if not patient_id:
+        return None
+    if len(patient_id) > MAX_PATIENT_ID:
+        raise ValueError(f"patient_id must be at most {MAX_PATIENT_ID} characters")
+    from cache_backends import input_hash
+    return input_hash(['patient', patient_id])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('command', choices=['trends', 'show'])
+    parser.add_argument('patient_id', help="patient_id as sent with the upload form")
+    args = parser.parse_args(argv)
+
+    history = LabHistory(args.db)
+    patient = patient_key(args.patient_id)
+    if args.command == 'trends':
+        print(json.dumps(history.trends(patient), indent=2))
+    else:
+        times, values = history.panels(patient)
+        print('taken                ' + '  '.join(f'{column:>19}' for column in COLUMNS))
+        for taken, row in zip(times, values):
+            stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(taken))
+            print(f'{stamp}  ' + '  '.join(f'{value:19.2f}' for value in row))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
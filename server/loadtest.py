@@ -0,0 +1,273 @@
+"""Load test /diet and /analyzereport against a local fake Gemini.
+
+    python loadtest.py --concurrency 16 --duration 30
+    python loadtest.py --server gunicorn --llm-latency-ms 1200 --llm-error-rate 0.05
+    python loadtest.py --url http://staging:5000 --endpoints analyzereport
+
+Unless --url is given this starts fake_gemini.py on a background thread and
+back.py in a subprocess (wsgi.py's threaded server, or gunicorn with
+gunicorn.conf.py) wired to it through GEMINI_API_ENDPOINT. Each virtual user
+then replays report uploads round-robin from the corpus: the sample PDFs in
+the repository root, synthetic reports built by bench.py, and any PDFs in
+--corpus. The result is a throughput/latency table per endpoint (and JSON
+with --json).
+"""
+import argparse
+import asyncio
+import glob
+import itertools
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from urllib.parse import urlsplit
+
+import bench
+import fake_gemini
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# --- corpus ----------------------------------------------------------------
+
+def build_corpus(extra_dir=None, synthetic=20):
+    """List of (filename, bytes) report uploads"""
+    corpus = [(name, data) for name, data in bench.sample_report_bytes().items()]
+    for i, panel in enumerate(bench.panel_rows(synthetic)):
+        corpus.append((f"blood_report_{i}.pdf", bench.synthetic_report_pdf(panel)))
+    if extra_dir:
+        for path in sorted(glob.glob(os.path.join(extra_dir, '*.pdf'))):
+            with open(path, 'rb') as f:
+                corpus.append((os.path.basename(path), f.read()))
+    return corpus
+
+
+def multipart(fields, files):
+    """Encode form fields and (field, filename, bytes) files as multipart/form-data"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        )
+    for field, filename, data in files:
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: application/pdf\r\n\r\n'.encode() + data + b'\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def analyzereport_request(upload, i):
+    name, data = upload
+    fields = {'name': f'load{i}', 'age': 35, 'weight': 70, 'height': 168,
+              'dairy_allergy': 'true' if i % 3 == 0 else 'false',
+              'peanut_allergy': 'true' if i % 5 == 0 else 'false'}
+    return multipart(fields, [('file', name, data)])
+
+
+def diet_request(upload, i):
+    name, data = upload
+    fields = {'age': 20 + i % 50, 'gender': 'female' if i % 2 else 'male', 'weight': 70,
+              'height': 168, 'diseases': 'none', 'activity_level': 1 + i % 10, 'goal': 1 + i % 3}
+    return multipart(fields, [('reports', name, data)])
+
+
+ENDPOINTS = {
+    'diet': ('/diet', diet_request),
+    'analyzereport': ('/analyzereport', analyzereport_request),
+}
+
+
+# --- client ----------------------------------------------------------------
+
+async def post(host, port, path, body, content_type, timeout):
+    """One HTTP/1.1 POST on a fresh connection; returns the status code"""
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        head = (
+            f"POST {path} HTTP/1.1\r\nHost: {host}:{port}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+        ).encode()
+        writer.write(head + body)
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        await asyncio.wait_for(reader.read(), timeout)
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+async def virtual_user(worker_id, host, port, plan, deadline, max_requests, counter, samples, timeout):
+    while time.monotonic() < deadline:
+        i = next(counter)
+        if max_requests and i >= max_requests:
+            return
+        endpoint, path, build, upload = plan(i)
+        body, content_type = build(upload, i)
+        started = time.perf_counter()
+        try:
+            status = await post(host, port, path, body, content_type, timeout)
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError) as e:
+            status = type(e).__name__
+        samples.append((endpoint, status, time.perf_counter() - started))
+
+
+async def run_load(url, endpoints, corpus, concurrency, duration, max_requests, timeout):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    routes = [(name,) + ENDPOINTS[name] for name in endpoints]
+
+    def plan(i):
+        name, path, build = routes[i % len(routes)]
+        return name, path, build, corpus[i % len(corpus)]
+
+    samples = []
+    counter = itertools.count()
+    deadline = time.monotonic() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        virtual_user(n, host, port, plan, deadline, max_requests, counter, samples, timeout)
+        for n in range(concurrency)
+    ])
+    return samples, time.perf_counter() - started
+
+
+# --- reporting -------------------------------------------------------------
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(samples, elapsed):
+    report = {}
+    for endpoint in sorted({s[0] for s in samples}):
+        rows = [s for s in samples if s[0] == endpoint]
+        latencies = sorted(s[2] for s in rows)
+        statuses = {}
+        for _, status, _ in rows:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        errors = sum(count for status, count in statuses.items() if not status.startswith('2'))
+        report[endpoint] = {
+            'requests': len(rows),
+            'errors': errors,
+            'error_rate': errors / len(rows),
+            'throughput_rps': len(rows) / elapsed,
+            'latency_ms': {
+                'mean': statistics.fmean(latencies) * 1000,
+                'p50': percentile(latencies, 0.50) * 1000,
+                'p90': percentile(latencies, 0.90) * 1000,
+                'p99': percentile(latencies, 0.99) * 1000,
+                'max': latencies[-1] * 1000,
+            },
+            'statuses': statuses,
+        }
+    return report
+
+
+def print_report(report, elapsed, concurrency):
+    print(f"\n{elapsed:.1f}s at concurrency {concurrency}")
+    print(f"{'endpoint':<15} {'reqs':>6} {'err%':>6} {'req/s':>8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for endpoint, row in report.items():
+        lat = row['latency_ms']
+        print(f"{endpoint:<15} {row['requests']:6d} {row['error_rate']:6.1%} {row['throughput_rps']:8.2f} "
+              f"{lat['p50']:9.1f} {lat['p90']:9.1f} {lat['p99']:9.1f} {lat['max']:9.1f}")
+        if row['errors']:
+            print(f"{'':<15} statuses: {row['statuses']}")
+
+
+# --- server management -----------------------------------------------------
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(kind, port, gemini_endpoint, workers):
+    env = dict(os.environ, GEMINI_API_ENDPOINT=gemini_endpoint, ARISE_LOG_LEVEL='WARNING')
+    if kind == 'gunicorn':
+        env.update(ARISE_BIND=f'127.0.0.1:{port}', ARISE_WORKERS=str(workers))
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py']
+    else:
+        env.update(ARISE_HOST='127.0.0.1', ARISE_PORT=str(port))
+        command = [sys.executable, 'wsgi.py']
+    return subprocess.Popen(command, cwd=SERVER_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_until_up(port, process, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with status {process.returncode}")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1) as s:
+                s.sendall(b"GET /readyz HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n")
+                if s.recv(12).startswith(b"HTTP/1.1 200"):
+                    return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError("server did not come up in time")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='test an already running server instead of starting one')
+    parser.add_argument('--server', choices=['wsgi', 'gunicorn'], default='wsgi')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--endpoints', nargs='+', choices=sorted(ENDPOINTS), default=sorted(ENDPOINTS))
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds')
+    parser.add_argument('--requests', type=int, default=0, help='stop after this many requests')
+    parser.add_argument('--timeout', type=float, default=60.0, help='per-request timeout in seconds')
+    parser.add_argument('--corpus', help='directory of extra report PDFs to replay')
+    parser.add_argument('--llm-latency-ms', type=float, default=800.0)
+    parser.add_argument('--llm-jitter-ms', type=float, default=200.0)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--json', help='also write the report to this file')
+    args = parser.parse_args(argv)
+
+    corpus = build_corpus(args.corpus)
+    server = gemini = None
+    url = args.url
+    try:
+        if not url:
+            gemini = fake_gemini.start_in_thread(latency_ms=args.llm_latency_ms, jitter_ms=args.llm_jitter_ms,
+                                                 error_rate=args.llm_error_rate)
+            port = free_port()
+            server = start_server(args.server, port, gemini.endpoint, args.workers)
+            wait_until_up(port, server)
+            url = f'http://127.0.0.1:{port}'
+        print(f"Replaying {len(corpus)} reports against {url} ({', '.join(args.endpoints)})")
+        samples, elapsed = asyncio.run(run_load(url, args.endpoints, corpus, args.concurrency,
+                                                args.duration, args.requests, args.timeout))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        if gemini is not None:
+            gemini.shutdown()
+
+    report = summarize(samples, elapsed)
+    print_report(report, elapsed, args.concurrency)
+    if gemini is not None:
+        print(f"\nfake Gemini: {gemini.calls} calls, {gemini.errors} injected errors")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'url': url, 'concurrency': args.concurrency, 'elapsed_s': elapsed,
+                       'endpoints': report}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
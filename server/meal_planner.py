@@ -0,0 +1,197 @@
+"""Daily meal-plan optimizer over the food catalog.
+
+plan_day() picks up to three foods for each of breakfast, lunch, dinner and
+snacks so the day lands on the calorie target from calculate_daily_calories
+and on macro targets derived from it, subject to allergen exclusions and
+health-condition limits (less carbohydrate for high blood sugar, less fat
+for high cholesterol).
+
+It is a vectorized beam search: every 1-3 item combination of a meal's
+candidates is scored at once with NumPy, the best BEAM_WIDTH per meal are
+kept, and all BEAM_WIDTH ** 4 day plans are scored together on the daily
+totals. With the catalog's ~15 candidates per meal this takes 2-3 ms.
+"""
+import itertools
+from functools import lru_cache
+
+import numpy as np
+
+from food_catalog import get_catalog, MEAL_TYPES
+
+# Share of the daily calories planned for each meal
+MEAL_SHARES = {'breakfast': 0.25, 'lunch': 0.35, 'dinner': 0.30, 'snacks': 0.10}
+MAX_ITEMS = {'breakfast': 3, 'lunch': 3, 'dinner': 3, 'snacks': 3}
+BEAM_WIDTH = 8
+
+# Default share of calories from each macro; grams via 4/4/9 kcal per gram
+MACRO_SPLIT = {'protein': 0.20, 'carbs': 0.50, 'fats': 0.30}
+KCAL_PER_GRAM = {'protein': 4.0, 'carbs': 4.0, 'fats': 9.0}
+# Upper limits on the macro share used when a condition is flagged
+CONDITION_CAPS = {
+    ('blood_sugar_level', 'high'): ('carbs', 0.40),
+    ('cholesterol_level', 'high'): ('fats', 0.25),
+}
+
+_FIELDS = ('calories', 'protein', 'carbs', 'fats', 'fiber')
+_CALORIES, _PROTEIN, _CARBS, _FATS, _FIBER = range(len(_FIELDS))
+_MACRO_COLUMNS = {'protein': _PROTEIN, 'carbs': _CARBS, 'fats': _FATS}
+
+# Cost weights: calories matter most, then macros; a small cost per item keeps plans short
+W_CALORIES = 4.0
+W_MACROS = 1.0
+W_CAP = 20.0
+W_ITEM = 0.02
+W_DUPLICATE = 1.0
+PREFERRED_BONUS = 0.05
+
+
+def macro_targets(daily_calories, health_conditions=None):
+    """Gram targets and gram caps per macro for the day"""
+    split = dict(MACRO_SPLIT)
+    caps = {}
+    for (condition, level), (macro, share) in CONDITION_CAPS.items():
+        if (health_conditions or {}).get(condition) == level:
+            caps[macro] = daily_calories * share / KCAL_PER_GRAM[macro]
+            split[macro] = min(split[macro], share)
+    # Renormalise so the reduced split still covers the whole day
+    total = sum(split.values())
+    split = {macro: share / total for macro, share in split.items()}
+    targets = {macro: daily_calories * share / KCAL_PER_GRAM[macro] for macro, share in split.items()}
+    return targets, caps
+
+
+@lru_cache(maxsize=64)
+def _combinations(n, max_items):
+    """All 1..max_items subsets of range(n) as rows padded with n (an all-zero food row)"""
+    rows = []
+    for size in range(1, max_items + 1):
+        for combo in itertools.combinations(range(n), size):
+            rows.append(combo + (n,) * (max_items - size))
+    combos = np.array(rows, dtype=np.int32).reshape(-1, max_items)
+    combos.setflags(write=False)
+    return combos
+
+
+@lru_cache(maxsize=256)
+def _candidates(catalog, meal_type, exclude_allergens):
+    """Catalog indices, nutrient matrix and name ids of the foods a meal can use"""
+    indices = catalog.select(meal_type=meal_type, source='model', exclude_allergens=exclude_allergens)
+    foods = catalog.entries[indices]
+    values = np.column_stack([np.nan_to_num(foods[field]) for field in _FIELDS]).astype(np.float64)
+    name_ids = np.asarray(foods['name_id'], dtype=np.int64)
+    for array in (indices, values, name_ids):
+        array.setflags(write=False)
+    return indices, values, name_ids
+
+
+def _slot_beam(values, name_ids, preferred, combos, target_kcal, targets, beam, penalties=None):
+    """Best `beam` item combinations for one meal, scored against its share of the day"""
+    padded = np.vstack([values, np.zeros((1, values.shape[1]), dtype=values.dtype)])
+    totals = padded[combos].sum(axis=1)
+    padded_ids = np.append(name_ids, -1)
+
+    cost = W_CALORIES * ((totals[:, _CALORIES] - target_kcal) / target_kcal) ** 2
+    for macro, column in _MACRO_COLUMNS.items():
+        goal = targets[macro]
+        cost += W_MACROS * ((totals[:, column] - goal) / max(goal, 1.0)) ** 2
+    n_items = (combos < len(values)).sum(axis=1)
+    cost += W_ITEM * n_items
+    if preferred.any():
+        padded_pref = np.append(preferred, False)
+        cost -= PREFERRED_BONUS * padded_pref[combos].sum(axis=1)
+    if penalties is not None:
+        # The trailing zero makes the padding id (-1) free
+        cost += np.append(penalties, 0.0)[padded_ids[combos]].sum(axis=1)
+
+    keep = min(beam, len(cost))
+    best = np.argpartition(cost, keep - 1)[:keep]
+    best = best[np.argsort(cost[best])]
+    return combos[best], totals[best], cost[best], padded_ids[combos[best]]
+
+
+def _fixed_slot(catalog, meal_type, names):
+    """A slot whose only choice is the given foods, in the same shape _slot_beam returns"""
+    indices = [catalog.lookup(name, meal_type) for name in names]
+    indices = np.array([i for i in indices if i is not None], dtype=np.int64)
+    foods = catalog.entries[indices]
+    values = np.column_stack([np.nan_to_num(foods[field]) for field in _FIELDS]).astype(np.float64)
+    values = values.reshape(len(indices), len(_FIELDS))
+    chosen = np.arange(len(indices), dtype=np.int32)[None, :]
+    ids = np.asarray(foods['name_id'], dtype=np.int64)[None, :]
+    return meal_type, indices, chosen, values.sum(axis=0)[None, :], np.zeros(1), ids
+
+
+def plan_day(daily_calories, health_conditions=None, exclude_allergens=0, preferred=None,
+             meal_types=MEAL_TYPES, beam=BEAM_WIDTH, penalties=None, fixed=None):
+    """Plan one day; returns {meal: [{'item', 'calories'}], ..., 'plan_totals': {...}}
+
+    preferred maps meal type -> food names (e.g. the model's picks) that get a
+    small bonus, so ties are broken in favour of the recommender.
+    penalties is an optional cost per catalog name id, added for every item
+    picked (weekly_planner uses it for variety). fixed maps meal type -> food
+    names to keep as they are; those meals still count towards the day's totals,
+    so re-planning one meal only searches that meal.
+    """
+    catalog = get_catalog()
+    targets, caps = macro_targets(daily_calories, health_conditions)
+    preferred = preferred or {}
+    fixed = fixed or {}
+
+    slots = []
+    for meal_type in meal_types:
+        if meal_type in fixed:
+            slots.append(_fixed_slot(catalog, meal_type, fixed[meal_type]))
+            continue
+        indices, values, name_ids = _candidates(catalog, meal_type, exclude_allergens)
+        if not len(indices):
+            slots.append(None)
+            continue
+        wanted = {catalog.name_ids[name] for name in preferred.get(meal_type, ()) if name in catalog.name_ids}
+        is_preferred = np.isin(name_ids, list(wanted)) if wanted else np.zeros(len(indices), dtype=bool)
+
+        share = MEAL_SHARES[meal_type]
+        slot_targets = {macro: grams * share for macro, grams in targets.items()}
+        combos = _combinations(len(indices), min(MAX_ITEMS[meal_type], len(indices)))
+        chosen, totals, cost, ids = _slot_beam(values, name_ids, is_preferred, combos,
+                                               daily_calories * share, slot_targets, beam, penalties)
+        slots.append((meal_type, indices, chosen, totals, cost, ids))
+
+    active = [slot for slot in slots if slot is not None]
+    if not active:
+        return {meal: [] for meal in meal_types}
+
+    # Score every combination of the per-meal beams on the daily totals
+    grids = np.meshgrid(*[np.arange(len(slot[4])) for slot in active], indexing='ij')
+    picks = np.stack([grid.ravel() for grid in grids], axis=1)
+    day_totals = sum(slot[3][picks[:, k]] for k, slot in enumerate(active))
+    cost = sum(slot[4][picks[:, k]] for k, slot in enumerate(active))
+    cost = cost + W_CALORIES * ((day_totals[:, _CALORIES] - daily_calories) / daily_calories) ** 2
+    for macro, column in _MACRO_COLUMNS.items():
+        cost += W_MACROS * ((day_totals[:, column] - targets[macro]) / max(targets[macro], 1.0)) ** 2
+        if macro in caps:
+            over = np.maximum(day_totals[:, column] - caps[macro], 0) / caps[macro]
+            cost += W_CAP * over ** 2
+
+    # Penalise the same food showing up in two meals of the day
+    ids = np.concatenate([slot[5][picks[:, k]] for k, slot in enumerate(active)], axis=1)
+    ids = np.sort(ids, axis=1)
+    repeats = ((ids[:, 1:] == ids[:, :-1]) & (ids[:, 1:] >= 0)).sum(axis=1)
+    cost += W_DUPLICATE * repeats
+
+    best = int(np.argmin(cost))
+    plan = {}
+    for k, (meal_type, indices, chosen, _, _, _) in enumerate(active):
+        items = chosen[picks[best, k]]
+        items = items[items < len(indices)]
+        plan[meal_type] = [
+            {'item': catalog.name(indices[i]), 'calories': int(catalog.entries['calories'][indices[i]])}
+            for i in items
+        ]
+    for meal_type in meal_types:
+        plan.setdefault(meal_type, [])
+    plan['plan_totals'] = {
+        field: round(float(day_totals[best, column]), 1) for column, field in enumerate(_FIELDS)
+    }
+    plan['plan_targets'] = {'calories': daily_calories,
+                            **{macro: round(grams, 1) for macro, grams in targets.items()}}
+    return plan
@@ -0,0 +1,96 @@
+"""Per-worker memory accounting and compact DataFrame dtypes.
+
+ARISE_MEMORY_MODE=compact (the default) stores the in-process frames with the
+smallest integer type that fits, float32 and categoricals for repeated
+strings; ARISE_MEMORY_MODE=full keeps pandas' int64/float64/str defaults for
+comparison. Frames only needed for training are dropped once the models are
+fitted, so what a worker keeps is the models plus workout_df.
+
+Each process logs its RSS, PSS (RSS with shared pages split between the
+processes sharing them, the number to divide a node's memory by) and private
+memory when its models are loaded and when a gunicorn worker starts, and
+warns if PSS exceeds ARISE_WORKER_MEMORY_BUDGET_MB. The same values are
+exported as arise_process_memory_bytes{kind} on /metrics.
+"""
+import logging
+import os
+import resource
+
+import metrics
+
+logger = logging.getLogger('arise')
+
+MEMORY_MODE = os.environ.get('ARISE_MEMORY_MODE', 'compact')
+BUDGET_MB = float(os.environ.get('ARISE_WORKER_MEMORY_BUDGET_MB', '0'))  # 0: no budget
+
+# A string column becomes categorical when it has at most this many distinct values per row
+CATEGORY_RATIO = 0.5
+
+
+def compact_mode():
+    return MEMORY_MODE == 'compact'
+
+
+def process_memory():
+    """{'rss', 'pss', 'private'} in bytes for this process; pss/private need Linux"""
+    usage = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                key, _, rest = line.partition(':')
+                if key in ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty'):
+                    usage[key] = int(rest.split()[0]) * 1024
+    except OSError:
+        # Peak rather than current RSS, but the best the platform offers; KB on Linux, bytes on macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {'rss': maxrss if os.uname().sysname == 'Darwin' else maxrss * 1024}
+    return {'rss': usage.get('Rss', 0), 'pss': usage.get('Pss', 0),
+            'private': usage.get('Private_Clean', 0) + usage.get('Private_Dirty', 0)}
+
+
+def record_memory():
+    """Publish this process's memory to /metrics and return it"""
+    memory = process_memory()
+    for kind, value in memory.items():
+        metrics.PROCESS_MEMORY.set(value, kind=kind)
+    return memory
+
+
+def log_memory(stage):
+    memory = record_memory()
+    mb = {kind: value / 2 ** 20 for kind, value in memory.items()}
+    logger.info("Memory after %s (pid %s, %s mode): %s", stage, os.getpid(), MEMORY_MODE,
+                ', '.join(f"{kind} {value:.1f} MB" for kind, value in mb.items()))
+    used = mb.get('pss', mb['rss'])
+    if BUDGET_MB and used > BUDGET_MB:
+        logger.warning("Worker %s uses %.1f MB, over its %.0f MB budget", os.getpid(), used, BUDGET_MB)
+    return memory
+
+
+def frame_bytes(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+def compact_frame(df):
+    """df with downcast numbers and categorical strings; unchanged in full mode"""
+    if not compact_mode():
+        return df
+    import pandas as pd
+    compact = {}
+    for column in df.columns:
+        values = df[column]
+        if pd.api.types.is_integer_dtype(values):
+            compact[column] = pd.to_numeric(values, downcast='integer')
+        elif pd.api.types.is_float_dtype(values):
+            compact[column] = values.astype('float32')
+        elif not isinstance(values.dtype, pd.CategoricalDtype) and values.nunique() <= CATEGORY_RATIO * len(values):
+            compact[column] = values.astype('category')
+        else:
+            compact[column] = values
+    return pd.DataFrame(compact, index=df.index)
+
+
+def record_frame(name, df):
+    size = frame_bytes(df)
+    metrics.FRAME_BYTES.set(size, frame=name)
+    return size
@@ -0,0 +1,169 @@
+"""Small in-process metrics registry rendered in the Prometheus text format.
+
+Each worker process keeps its own values, so with several gunicorn workers
+every scrape sees the worker that answered it; scrape them individually (or
+put a per-worker sidecar in front) if you need exact totals.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from sub-millisecond model calls up to LLM round trips
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        with self._lock:
+            return [(key, value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in self.samples():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = [(key, dict(state, counts=list(state["counts"]))) for key, state in sorted(self._values.items())]
+        for key, state in items:
+            for bound, count in zip(self.buckets, state["counts"]):
+                labels = _format_labels(self.labelnames, key, [("le", bound)])
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key, [("le", "+Inf")])
+            lines.append(f"{self.name}_bucket{labels} {state['count']}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {state['sum']}")
+            lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+# Metrics shared by the whole server
+STAGE_SECONDS = Histogram(
+    "arise_stage_seconds",
+    "Time spent in each pipeline stage (upload_save, pdf_parse, extraction, recommend_foods, pdf_render, llm_call)",
+    ["stage"]
+)
+REQUEST_SECONDS = Histogram("arise_request_seconds", "End-to-end request latency", ["endpoint"])
+REQUESTS = Counter("arise_requests_total", "Finished requests", ["endpoint", "status"])
+QUEUE_DEPTH = Gauge("arise_request_queue_depth", "Requests accepted but not yet finished", ["endpoint"])
+CACHE_REQUESTS = Counter("arise_cache_requests_total", "Cache lookups", ["cache", "result"])
+ADMISSION_REJECTIONS = Counter("arise_admission_rejections_total", "Requests shed by admission control", ["pool", "reason"])
+ADMISSION_IN_USE = Gauge("arise_admission_units_in_use", "Cost units held by admitted requests", ["pool"])
+ADMISSION_QUEUED = Gauge("arise_admission_queued", "Requests waiting for admission", ["pool"])
+ADMISSION_WAIT_SECONDS = Histogram("arise_admission_wait_seconds", "Time requests waited for admission", ["pool"])
+CACHE_ERRORS = Counter("arise_cache_errors_total", "Cache calls that failed and were treated as misses", ["cache"])
+MODEL_LOAD_SECONDS = Gauge("arise_model_load_seconds", "Time taken to train or load each model", ["model"])
+MODEL_RELOADS = Counter("arise_model_reloads_total", "Model bundles picked up from the registry", ["result"])
+PROCESS_MEMORY = Gauge("arise_process_memory_bytes", "This worker's memory (rss, pss, private)", ["kind"])
+FRAME_BYTES = Gauge("arise_frame_bytes", "Memory held by each in-process DataFrame", ["frame"])
+TRAINING_SCORE = Gauge(
+    "arise_model_training_score",
+    "Evaluation scores recorded by DietRecommender.create_and_train_models",
+    ["model", "metric"]
+)
+
+
+@contextmanager
+def time_stage(stage):
+    """Record how long the wrapped block takes under arise_stage_seconds{stage=...}"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def record_training_scores(model_scores):
+    """Publish the {model: {metric: value}} dict kept by DietRecommender"""
+    for model, scores in (model_scores or {}).items():
+        for metric, value in scores.items():
+            TRAINING_SCORE.set(value, model=model, metric=metric)
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,200 @@
+"""Versioned model bundles with hot reload.
+
+    python model_registry.py publish models          # new version from a trained models/ dir
+    python model_registry.py list
+    python model_registry.py activate 20261019-120000  # roll forward or back
+
+The registry (ARISE_MODEL_REGISTRY, default models/registry) holds one
+directory per version with the DietRecommender files, and manifest.json
+naming the current version and the sha256 of every file in each bundle.
+Bundles are copied in under a temporary name and renamed into place, and the
+manifest is replaced atomically, so readers never see a half-written version.
+
+Each worker runs a ModelWatcher that polls the manifest. When the current
+version changes it loads the new bundle on the watcher thread, checks the
+hashes and hands it to a callback that swaps one reference; requests in
+flight keep the object they started with. Without a manifest back.py loads
+the flat models/ directory as before.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger('arise')
+
+REGISTRY_DIR = os.environ.get('ARISE_MODEL_REGISTRY', os.path.join('models', 'registry'))
+POLL_INTERVAL = float(os.environ.get('ARISE_MODEL_POLL_INTERVAL', '10'))
+MANIFEST = 'manifest.json'
+
+# A bundle needs the pickles or the pickle-free serving directory (serving_format.py)
+REQUIRED_FILES = ('diet_recommender.pkl', 'scaler.pkl', 'label_encoder.pkl')
+OPTIONAL_FILES = ('diet_scorer.npz', 'training_metrics.json')
+SERVING_DIR = 'serving'
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_manifest(registry=REGISTRY_DIR):
+    """The manifest dict, or None if the registry has none yet"""
+    try:
+        with open(os.path.join(registry, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_manifest(registry, manifest):
+    path = os.path.join(registry, MANIFEST)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, path)
+
+
+def publish(source_dir, registry=REGISTRY_DIR, version=None, activate=True):
+    """Copy a trained model directory into the registry as a new version"""
+    missing = [name for name in REQUIRED_FILES if not os.path.exists(os.path.join(source_dir, name))]
+    if missing and not os.path.exists(os.path.join(source_dir, SERVING_DIR, 'manifest.json')):
+        raise FileNotFoundError(f"{source_dir} is missing {', '.join(missing)}")
+    version = version or time.strftime('%Y%m%d-%H%M%S')
+    target = os.path.join(registry, version)
+    if os.path.exists(target):
+        raise FileExistsError(f"Version {version} already exists")
+
+    os.makedirs(registry, exist_ok=True)
+    staging = f'{target}.{os.getpid()}.tmp'
+    os.makedirs(staging)
+    files = {}
+    names = list(REQUIRED_FILES + OPTIONAL_FILES)
+    serving = os.path.join(source_dir, SERVING_DIR)
+    if os.path.isdir(serving):
+        os.makedirs(os.path.join(staging, SERVING_DIR))
+        names += [f'{SERVING_DIR}/{name}' for name in sorted(os.listdir(serving))]
+    for name in names:
+        path = os.path.join(source_dir, name)
+        if os.path.isfile(path):
+            shutil.copy2(path, os.path.join(staging, name))
+            files[name] = _sha256(path)
+    os.rename(staging, target)
+
+    manifest = read_manifest(registry) or {'current': None, 'versions': {}}
+    manifest['versions'][version] = {'created': time.time(), 'files': files}
+    if activate:
+        manifest['current'] = version
+    _write_manifest(registry, manifest)
+    return version
+
+
+def activate(version, registry=REGISTRY_DIR):
+    manifest = read_manifest(registry)
+    if not manifest or version not in manifest['versions']:
+        raise KeyError(f"Unknown version {version}")
+    manifest['current'] = version
+    _write_manifest(registry, manifest)
+
+
+def current_bundle(registry=REGISTRY_DIR):
+    """(version, directory) of the active bundle, or None without a manifest"""
+    manifest = read_manifest(registry)
+    if not manifest or not manifest.get('current'):
+        return None
+    return manifest['current'], os.path.join(registry, manifest['current'])
+
+
+def verify_bundle(version, registry=REGISTRY_DIR):
+    """Raise ValueError unless every file in the bundle matches its manifest hash"""
+    manifest = read_manifest(registry)
+    for name, expected in manifest['versions'][version]['files'].items():
+        if _sha256(os.path.join(registry, version, name)) != expected:
+            raise ValueError(f"{name} in version {version} does not match the manifest")
+
+
+class ModelWatcher:
+    """Polls the manifest and swaps in new bundles via load(directory) -> model
+    and on_swap(version, model)"""
+
+    def __init__(self, load, on_swap, registry=REGISTRY_DIR, interval=POLL_INTERVAL, version=None):
+        self.load = load
+        self.on_swap = on_swap
+        self.registry = registry
+        self.interval = interval
+        self.version = version
+        self._thread_pid = None
+        self._start_lock = threading.Lock()
+
+    def check(self):
+        """Load and swap in the current version if it changed; True if swapped"""
+        bundle = current_bundle(self.registry)
+        if bundle is None or bundle[0] == self.version:
+            return False
+        version, directory = bundle
+        verify_bundle(version, self.registry)
+        model = self.load(directory)
+        self.on_swap(version, model)
+        self.version = version
+        return True
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception:
+                # Keep serving the old bundle; a broken version is retried on the next poll
+                logger.exception("Could not load model version from %s", self.registry)
+                metrics.MODEL_RELOADS.inc(result='error')
+
+    def ensure_running(self):
+        """Start polling in this process; threads don't survive gunicorn's fork"""
+        if self._thread_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread_pid != os.getpid():
+                threading.Thread(target=self._run, name='model-watcher', daemon=True).start()
+                self._thread_pid = os.getpid()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--registry', default=REGISTRY_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+    publish_cmd = commands.add_parser('publish', help='add a trained model directory as a new version')
+    publish_cmd.add_argument('source_dir')
+    publish_cmd.add_argument('--version')
+    publish_cmd.add_argument('--no-activate', action='store_true')
+    commands.add_parser('list', help='show versions')
+    activate_cmd = commands.add_parser('activate', help='make a version current')
+    activate_cmd.add_argument('version')
+    args = parser.parse_args(argv)
+
+    if args.command == 'publish':
+        version = publish(args.source_dir, args.registry, args.version, not args.no_activate)
+        print(f"Published {version}")
+    elif args.command == 'activate':
+        activate(args.version, args.registry)
+        print(f"Activated {args.version}")
+    else:
+        manifest = read_manifest(args.registry) or {'current': None, 'versions': {}}
+        for version, info in sorted(manifest['versions'].items()):
+            marker = '*' if version == manifest['current'] else ' '
+            created = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(info['created']))
+            print(f"{marker} {version}  {created}  {', '.join(sorted(info['files']))}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
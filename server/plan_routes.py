@@ -0,0 +1,116 @@
+"""/weeklyplan and /feedback: per-user week plans and recommendation feedback."""
+import functools
+import logging
+import math
+
+from flask import Blueprint, jsonify, request
+
+import model_state
+from plan_store import PlanStoreUnavailable
+from report_routes import calculate_bmi, calculate_daily_calories, classify_health_conditions, parse_allergies
+from tracing import span
+
+logger = logging.getLogger('arise')
+
+blueprint = Blueprint('plan', __name__)
+
+# Week plans are stored per user (see plan_store.py), so single meals can be swapped cheaply
+@functools.lru_cache(maxsize=None)
+def get_weekly_planner():
+    from weekly_planner import WeeklyPlanner
+    return WeeklyPlanner()
+
+@blueprint.errorhandler(PlanStoreUnavailable)
+def plan_store_unavailable(e):
+    logger.error("Weekly plan store failed: %s", e)
+    return jsonify({"error": "Weekly plans are unavailable, retry later"}), 503
+
+def request_data():
+    """The JSON object or form a request carries; None for JSON that isn't an object"""
+    data = request.get_json(silent=True)
+    if data is None:
+        return request.form
+    return data if isinstance(data, dict) else None
+
+def positive_number(data, field):
+    """data[field] as a positive float; KeyError if missing, ValueError/TypeError if not one"""
+    value = float(data[field])
+    if not math.isfinite(value) or value <= 0:
+        raise ValueError(f"{field} must be a positive number")
+    return value
+
+@blueprint.route('/weeklyplan', methods=['POST'])
+def create_weekly_plan():
+    """Plan seven days for a user from their details and, optionally, their latest
+    fasting_blood_sugar / cholesterol readings"""
+    data = request_data()
+    if data is None:
+        return jsonify({"error": "Expected a JSON object or a form"}), 400
+    user_id = data.get('user_id')
+    if not user_id:
+        return jsonify({"error": "user_id is required"}), 400
+    try:
+        weight, height, age = (positive_number(data, field) for field in ('weight', 'height', 'age'))
+        gender = data.get('gender') or 'female'
+        if not isinstance(gender, str):
+            raise ValueError("gender must be a string")
+        bmi = calculate_bmi(weight, height)
+        daily_calories = calculate_daily_calories(weight, height, int(age), gender)
+        health_conditions = classify_health_conditions({
+            'Fasting Blood Sugar': data.get('fasting_blood_sugar'),
+            'Cholesterol': data.get('cholesterol'),
+        }, bmi)
+        exclude_allergens = parse_allergies(data)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid input: {e}"}), 400
+
+    model_state.load_models()
+    with span('weekly_plan'):
+        week = get_weekly_planner().create(str(user_id), daily_calories, health_conditions,
+                                           exclude_allergens, recommender=model_state.diet_recommender)
+    return jsonify(week.to_dict())
+
+@blueprint.route('/weeklyplan/<user_id>', methods=['GET'])
+def get_weekly_plan(user_id):
+    week = get_weekly_planner().get(user_id)
+    if week is None:
+        return jsonify({"error": "No plan for this user"}), 404
+    return jsonify(week.to_dict())
+
+@blueprint.route('/weeklyplan/<user_id>/swap', methods=['POST'])
+def swap_weekly_plan(user_id):
+    """Re-plan one day (1-7), or just one meal of it, keeping the rest of the week"""
+    data = request_data()
+    if data is None:
+        return jsonify({"error": "Expected a JSON object or a form"}), 400
+    try:
+        day = int(data['day']) - 1
+        with span('weekly_plan_swap'):
+            week = get_weekly_planner().swap(user_id, day, data.get('meal') or None)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid input: {e}"}), 400
+    if week is None:
+        return jsonify({"error": "No plan for this user"}), 404
+    return jsonify(week.to_dict())
+
+@blueprint.route('/feedback', methods=['POST'])
+def record_feedback():
+    """Accepted/rejected recommendation, e.g. {"food": "Quinoa salad", "meal_type": "lunch",
+    "accepted": false, "blood_sugar_level": "high"}; applied within a few seconds"""
+    data = request_data()
+    if data is None:
+        return jsonify({"error": "Expected a JSON object or a form"}), 400
+    accepted = data.get('accepted')
+    if isinstance(accepted, str):
+        accepted = accepted.lower() == 'true'
+    if not data.get('food') or not data.get('meal_type') or accepted is None:
+        return jsonify({"error": "food, meal_type and accepted are required"}), 400
+    if not model_state.models_loaded():
+        return jsonify({"error": "Models are still loading"}), 503
+    conditions = {key: data[key] for key in ('blood_sugar_level', 'cholesterol_level', 'bmi_category')
+                  if data.get(key)}
+    try:
+        model_state.feedback_learner.record(data['food'], bool(accepted), conditions, data['meal_type'])
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"status": "recorded"}), 202
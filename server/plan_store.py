@@ -0,0 +1,95 @@
+"""SQLite storage for weekly plans (weekly_planner.py).
+
+One row per user (ARISE_WEEKLY_PLANS, default history/weekly_plans.sqlite3)
+holding the plan's state as JSON. Every gunicorn worker on the node opens the
+same file in WAL mode, so GET and swap work whichever worker created the
+plan, and plans survive restarts. update() runs its read-modify-write inside
+BEGIN IMMEDIATE, which takes the database's write lock before reading: swaps
+of one plan from different workers apply one after the other instead of
+overwriting each other. Failures raise PlanStoreUnavailable (a 503 from the
+routes), so a plan is never reported as saved when it wasn't. Plans
+untouched for PLAN_TTL seconds are dropped.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DB_PATH = os.environ.get('ARISE_WEEKLY_PLANS', os.path.join('history', 'weekly_plans.sqlite3'))
+PLAN_TTL = 14 * 24 * 3600   # seconds a plan is kept after its last change
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plans (
+    user_id TEXT PRIMARY KEY,
+    updated REAL NOT NULL,
+    state TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS plans_updated ON plans (updated);
+"""
+
+
+class PlanStoreUnavailable(Exception):
+    """The plan database couldn't be read or written"""
+
+
+class PlanStore:
+    def __init__(self, path=DB_PATH, ttl=PLAN_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+
+    def _connection(self):
+        # One connection per thread and process, as in lab_history.py. Autocommit mode, so
+        # the transactions below start with an explicit BEGIN IMMEDIATE
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _load(self, conn, user_id):
+        row = conn.execute("SELECT state FROM plans WHERE user_id = ? AND updated >= ?",
+                           (user_id, time.time() - self.ttl)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def _store(self, conn, user_id, state):
+        conn.execute("INSERT OR REPLACE INTO plans (user_id, updated, state) VALUES (?, ?, ?)",
+                     (user_id, time.time(), json.dumps(state, separators=(',', ':'))))
+
+    def get(self, user_id):
+        """The user's plan state, or None"""
+        try:
+            return self._load(self._connection(), user_id)
+        except (sqlite3.Error, OSError) as e:
+            raise PlanStoreUnavailable(f"Can't read plans: {e}") from e
+
+    def put(self, user_id, state):
+        """Store a plan, replacing the user's previous one; expired plans are dropped too"""
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("DELETE FROM plans WHERE updated < ?", (time.time() - self.ttl,))
+                self._store(conn, user_id, state)
+        except (sqlite3.Error, OSError) as e:
+            raise PlanStoreUnavailable(f"Can't store the plan: {e}") from e
+
+    def update(self, user_id, change):
+        """Replace the user's plan state with change(state), atomically across processes;
+        None (and nothing stored) if the user has no plan"""
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                state = self._load(conn, user_id)
+                if state is None:
+                    return None
+                state = change(state)
+                self._store(conn, user_id, state)
+            return state
+        except (sqlite3.Error, OSError) as e:
+            raise PlanStoreUnavailable(f"Can't store the plan: {e}") from e
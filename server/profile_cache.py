@@ -0,0 +1,44 @@
+"""Per-user cache of /analyzereport stages.
+
+Each patient (lab_history.patient_key; requests without a patient_id share
+one profile) gets a profile holding results of every stage, each filed under
+a hash of exactly the inputs that stage depends on:
+
+    extraction       the uploaded file's bytes             -> extracted panel
+    recommendations  panel, allergens, model and feedback  -> per-report advice and foods
+    meal_plan        calories, conditions, allergens, picks -> the day's plan
+    pdf              everything shown in the report         -> saved PDF file name
+
+A resubmission that changes one input misses only the stages downstream of
+it; the rest are served from the profile. Entries live in the
+cache_backends backend (ARISE_CACHE_URL), so with a shared backend a
+resubmission hits on whichever worker or node takes it. Hits and misses are
+counted under arise_cache_requests_total{cache="profile_<stage>"}.
+"""
+from cache_backends import Cache, input_hash
+
+STAGES = ('extraction', 'recommendations', 'meal_plan', 'pdf')
+
+
+class ProfileCache:
+    def __init__(self, backend=None):
+        self._stages = {stage: Cache(f'profile_{stage}', backend) for stage in STAGES}
+
+    def get(self, user, stage, key):
+        """Cached value or None; counts the hit or miss. Callers get their own copy"""
+        return self._stages[stage].get(f'{user}:{key}')
+
+    def put(self, user, stage, key, value):
+        self._stages[stage].set(f'{user}:{key}', value)
+
+    def get_or_compute(self, user, stage, inputs, compute):
+        key = input_hash(inputs)
+        value = self.get(user, stage, key)
+        if value is None:
+            value = compute()
+            self.put(user, stage, key, value)
+        return value
+
+    def clear(self, user=None):
+        for cache in self._stages.values():
+            cache.clear('' if user is None else f'{user}:')
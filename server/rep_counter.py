@@ -0,0 +1,354 @@
+"""Rep counting and form checks from pose keypoints.
+
+    python rep_counter.py replay squats recording.jsonl --batch 8
+    python rep_counter.py synthesize squats recording.jsonl --reps 5 --partial-every 3
+
+The exercise pages run MediaPipe Pose in the browser; this takes the same 33
+landmarks server side, in batches of frames, from the HTTP route
+(exercise_routes.py) or the WebSocket stream in asgi.py. A batch is
+
+    {"frames": [[[x, y, z, visibility], ... 33 landmarks], ...],
+     "timestamps": [ms, ...]}            # optional; 30 fps is assumed without
+
+([x, y] or [x, y, z] per landmark and MediaPipe's {x, y, z, visibility}
+objects are accepted too). The WebSocket also takes binary messages, a
+Float32Array of [t, x, y, z, visibility x 33] per frame, which skip JSON
+parsing: most of a JSON batch's cost. Landmarks with visibility below MIN_VISIBILITY
+count as missing and freeze the state rather than guess.
+
+Joint angles for a whole batch come from one vectorised atan2 over the
+landmark array, with the same formula as the pages' calculateAngle. Rep
+exercises are a two-threshold state machine on one joint (as the pages count
+them): a rep is flexed (angle below `flexed_below`) and back to extended
+(above `extended_above`); going part way down and back up is reported as a
+partial rep, and the form checks (health_rules.RuleTable rows over the joint
+angles) are reported per rep once they fire in MIN_ERROR_FRAMES frames of it.
+The state machine only steps through the frames where the phase changes, so a
+batch costs a few NumPy calls whatever its length. Hold exercises (warrior,
+tree pose) count entries into the pose and time spent in it.
+
+Recordings are JSON lines, one {"t": ms, "landmarks": [...]} frame per line;
+`replay` feeds one through a counter batch by batch, `synthesize` writes one.
+"""
+import argparse
+import json
+import math
+import sys
+
+from health_rules import RuleTable
+
+MIN_VISIBILITY = 0.5
+MIN_ERROR_FRAMES = 3
+PARTIAL_MARGIN = 30     # degrees below extended_above that start a rep
+DEFAULT_FPS = 30
+MAX_BATCH_FRAMES = 300
+N_LANDMARKS = 33
+BINARY_FRAME_VALUES = 1 + N_LANDMARKS * 4
+
+# MediaPipe Pose landmark indices
+LANDMARKS = {
+    'left_shoulder': 11, 'right_shoulder': 12, 'left_elbow': 13, 'right_elbow': 14,
+    'left_wrist': 15, 'right_wrist': 16, 'left_hip': 23, 'right_hip': 24,
+    'left_knee': 25, 'right_knee': 26, 'left_ankle': 27, 'right_ankle': 28,
+}
+
+# Angle at the middle landmark of each triple
+JOINTS = {
+    'left_elbow': ('left_shoulder', 'left_elbow', 'left_wrist'),
+    'right_elbow': ('right_shoulder', 'right_elbow', 'right_wrist'),
+    'left_knee': ('left_hip', 'left_knee', 'left_ankle'),
+    'right_knee': ('right_hip', 'right_knee', 'right_ankle'),
+    'left_hip': ('left_shoulder', 'left_hip', 'left_knee'),
+    'right_hip': ('right_shoulder', 'right_hip', 'right_knee'),
+    'body_line': ('left_shoulder', 'left_hip', 'left_ankle'),
+    'shoulders': ('left_shoulder', 'right_shoulder', 'left_hip'),
+}
+
+# Rep exercises: the joint whose angle is counted, its thresholds and the form
+# checks, (error, joint, comparison, threshold), that fire on bad frames
+REP_EXERCISES = {
+    'pushups': {'joint': 'left_elbow', 'flexed_below': 90, 'extended_above': 160,
+                'checks': (('hips_sagging', 'body_line', '<', 150),)},
+    'squats': {'joint': 'left_knee', 'flexed_below': 70, 'extended_above': 160,
+               'checks': (('leaning_forward', 'left_hip', '<', 45),)},
+    'situps': {'joint': 'left_hip', 'flexed_below': 60, 'extended_above': 120, 'checks': ()},
+    # The pullup page compares shoulder/elbow/shoulder, which is always 0; the elbow it means
+    'pullup': {'joint': 'left_elbow', 'flexed_below': 70, 'extended_above': 150, 'checks': ()},
+}
+
+# Hold exercises: (joint, comparison, threshold) rows that must all hold
+HOLD_EXERCISES = {
+    'warrior': (('left_knee', '>', 160), ('right_knee', '<', 90), ('left_hip', '>', 160), ('shoulders', '>', 160)),
+    'yoga': (('left_knee', '>', 160), ('right_knee', '<', 90)),
+}
+
+EXERCISES = tuple(REP_EXERCISES) + tuple(HOLD_EXERCISES)
+
+_JOINT_NAMES = tuple(JOINTS)
+_TRIPLES = [[LANDMARKS[name] for name in JOINTS[joint]] for joint in _JOINT_NAMES]
+_CHECKS = {exercise: RuleTable(check[1:] for check in spec['checks']) for exercise, spec in REP_EXERCISES.items()}
+_POSES = {exercise: RuleTable(rows) for exercise, rows in HOLD_EXERCISES.items()}
+
+
+def keypoints(frames):
+    """(n, 33, 2) float array of x, y; NaN for landmarks below MIN_VISIBILITY.
+    ValueError for anything that isn't a batch of 33-landmark frames"""
+    import numpy as np
+    if not isinstance(frames, (list, tuple, np.ndarray)) or not len(frames):
+        raise ValueError("frames must be a non-empty list")
+    if len(frames) > MAX_BATCH_FRAMES:
+        raise ValueError(f"at most {MAX_BATCH_FRAMES} frames per batch")
+    if not isinstance(frames, np.ndarray):
+        if not all(isinstance(frame, (list, tuple)) for frame in frames):
+            raise ValueError("each frame must be a list of landmarks")
+        if any(frame and isinstance(frame[0], dict) for frame in frames):
+            try:
+                frames = [[(p.get('x'), p.get('y'), p.get('z', 0.0), p.get('visibility', 1.0)) for p in frame]
+                          for frame in frames]
+            except AttributeError:
+                raise ValueError("landmarks must all be lists or all be {x, y, z, visibility} objects") from None
+    try:
+        points = np.asarray(frames, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError("landmarks must be lists of numbers") from None
+    if points.ndim != 3 or points.shape[1] != N_LANDMARKS or not 2 <= points.shape[2] <= 4:
+        raise ValueError(f"expected frames of {N_LANDMARKS} [x, y(, z, visibility)] landmarks, "
+                         f"got shape {points.shape}")
+    xy = points[:, :, :2].copy()
+    if points.shape[2] == 4:
+        xy[points[:, :, 3] < MIN_VISIBILITY] = np.nan
+    return xy
+
+
+def joint_angles(xy):
+    """(n, len(JOINTS)) angles in degrees, 0-180, NaN where a landmark is missing"""
+    import numpy as np
+    triples = xy[:, _TRIPLES]                      # (n, joints, 3, 2)
+    a, b, c = triples[:, :, 0], triples[:, :, 1], triples[:, :, 2]
+    radians = (np.arctan2(c[..., 1] - b[..., 1], c[..., 0] - b[..., 0])
+               - np.arctan2(a[..., 1] - b[..., 1], a[..., 0] - b[..., 0]))
+    angles = np.abs(np.degrees(radians))
+    return np.where(angles > 180, 360 - angles, angles)
+
+
+def frame_times(n, timestamps, last_time):
+    """Seconds since the previous frame for each of n frames"""
+    import numpy as np
+    if timestamps is None:
+        return np.full(n, 1 / DEFAULT_FPS)
+    times = np.asarray(timestamps, dtype=np.float64) / 1000
+    if times.shape != (n,):
+        raise ValueError("timestamps must have one entry per frame")
+    previous = times[0] - 1 / DEFAULT_FPS if last_time is None else last_time
+    return np.clip(np.diff(times, prepend=previous), 0, None)
+
+
+class RepCounter:
+    """Counting state for one stream; feed() takes a batch and returns its results.
+    state()/RepCounter(exercise, state) carry it between stateless HTTP calls."""
+
+    def __init__(self, exercise, state=None):
+        if exercise not in EXERCISES:
+            raise KeyError(exercise)
+        self.exercise = exercise
+        state = state or {}
+        if not isinstance(state, dict):
+            raise TypeError("state must be the object a previous batch returned")
+        self.frames = int(state.get('frames', 0))
+        self.count = int(state.get('count', 0))
+        self.phase = state.get('phase')
+        self.partial = bool(state.get('partial', False))
+        self.fired = list(state.get('fired', ()))
+        self.hold_seconds = float(state.get('hold_seconds', 0.0))
+        self.last_time = state.get('last_time')
+        spec = REP_EXERCISES.get(exercise)
+        if spec is not None:
+            self.joint = _JOINT_NAMES.index(spec['joint'])
+            if len(self.fired) != len(spec['checks']):
+                self.fired = [0] * len(spec['checks'])
+
+    def state(self):
+        return {'frames': self.frames, 'count': self.count, 'phase': self.phase, 'partial': self.partial,
+                'fired': list(self.fired), 'hold_seconds': self.hold_seconds, 'last_time': self.last_time}
+
+    def feed(self, frames, timestamps=None):
+        angles = joint_angles(keypoints(frames))
+        dt = frame_times(len(angles), timestamps, self.last_time)
+        if timestamps is not None:
+            self.last_time = float(timestamps[-1]) / 1000
+        start, before = self.frames, self.count
+        if self.exercise in REP_EXERCISES:
+            result = self._feed_reps(angles)
+        else:
+            result = self._feed_hold(angles, dt)
+        self.frames += len(angles)
+        return dict(result, exercise=self.exercise, frames=self.frames, count=self.count,
+                    new=self.count - before, first_frame=start)
+
+    def _feed_reps(self, angles):
+        import numpy as np
+        spec = REP_EXERCISES[self.exercise]
+        angle = angles[:, self.joint]
+        # 0 extended, 1 part way down, 2 flexed, -1 between (or missing): frames keep the last phase
+        level = np.full(len(angle), -1, dtype=np.int8)
+        level[angle < spec['extended_above'] - PARTIAL_MARGIN] = 1
+        level[angle < spec['flexed_below']] = 2
+        level[angle > spec['extended_above']] = 0
+        events = np.flatnonzero(level >= 0)
+        if len(events):
+            changes = np.flatnonzero(np.diff(level[events], prepend=-1) != 0)
+            events = events[changes]
+        fired = _CHECKS[self.exercise].fires(angles, _JOINT_NAMES) if spec['checks'] else np.zeros((len(angle), 0), bool)
+        fired_before = np.vstack([np.zeros((1, fired.shape[1]), dtype=np.int64), np.cumsum(fired, axis=0)])
+
+        errors = []
+        rep_start = 0       # first frame of the rep in progress, within this batch
+        for i, kind in zip(events.tolist(), level[events].tolist()):
+            if kind == 2:
+                self.phase = 'flexed'
+            elif kind == 1:
+                if self.phase == 'extended':
+                    self.partial = True
+            elif self.phase == 'flexed':
+                self.count += 1
+                counts = np.asarray(self.fired) + fired_before[i + 1] - fired_before[rep_start]
+                errors.extend({'rep': self.count, 'error': check[0], 'frame': self.frames + i}
+                              for check, n in zip(spec['checks'], counts.tolist()) if n >= MIN_ERROR_FRAMES)
+                self.fired = [0] * len(spec['checks'])
+                rep_start = i + 1
+                self.phase, self.partial = 'extended', False
+            else:
+                if self.partial:
+                    errors.append({'rep': self.count + 1, 'error': 'partial_rep', 'frame': self.frames + i})
+                    self.fired = [0] * len(spec['checks'])
+                    rep_start = i + 1
+                self.phase, self.partial = 'extended', False
+        self.fired = (np.asarray(self.fired) + fired_before[-1] - fired_before[rep_start]).tolist()
+        last = angle[~np.isnan(angle)]
+        return {'phase': self.phase, 'angle': round(float(last[-1]), 1) if len(last) else None, 'errors': errors}
+
+    def _feed_hold(self, angles, dt):
+        import numpy as np
+        fires = _POSES[self.exercise].fires(angles, _JOINT_NAMES)
+        in_pose = fires.all(axis=1)
+        was_in_pose = np.concatenate([[self.phase == 'in_pose'], in_pose[:-1]])
+        self.count += int((in_pose & ~was_in_pose).sum())
+        self.hold_seconds += float(dt[in_pose].sum())
+        self.phase = 'in_pose' if in_pose[-1] else 'out'
+        # Which conditions the latest frame misses, as the form hint
+        failing = [row[0] for row, ok in zip(HOLD_EXERCISES[self.exercise], fires[-1].tolist()) if not ok]
+        return {'phase': self.phase, 'hold_seconds': round(self.hold_seconds, 2), 'failing': failing,
+                'errors': []}
+
+
+def decode_binary(data):
+    """(frames, timestamps) of a binary batch: little-endian float32, per frame the
+    timestamp in ms and then 33 x (x, y, z, visibility)"""
+    import numpy as np
+    values = np.frombuffer(data, dtype='<f4')
+    if not len(values) or len(values) % BINARY_FRAME_VALUES:
+        raise ValueError(f"binary batches are float32 frames of {BINARY_FRAME_VALUES} values")
+    values = values.reshape(-1, BINARY_FRAME_VALUES)
+    return values[:, 1:].reshape(-1, N_LANDMARKS, 4), values[:, 0]
+
+
+def handle_message(counter, message):
+    """One WebSocket message (a JSON text batch, or binary bytes) -> the JSON reply"""
+    try:
+        if isinstance(message, bytes):
+            result = counter.feed(*decode_binary(message))
+        else:
+            batch = json.loads(message)
+            result = counter.feed(batch['frames'], batch.get('timestamps'))
+    except (ValueError, KeyError, TypeError) as e:
+        result = {'error': f"Invalid batch: {e}"}
+    return json.dumps(result)
+
+
+def read_recording(path):
+    """(frames, timestamps) of a JSON lines recording"""
+    frames, timestamps = [], []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                frame = json.loads(line)
+                frames.append(frame['landmarks'])
+                timestamps.append(frame['t'])
+    return frames, timestamps
+
+
+def replay(exercise, path, batch=8):
+    """Every batch result of feeding a recording through a fresh counter"""
+    frames, timestamps = read_recording(path)
+    counter = RepCounter(exercise)
+    return [counter.feed(frames[i:i + batch], timestamps[i:i + batch]) for i in range(0, len(frames), batch)]
+
+
+# Standing pose, facing the camera's left, in MediaPipe's normalised image coordinates
+_STANDING = {
+    'left_shoulder': (0.50, 0.30), 'right_shoulder': (0.52, 0.30), 'left_elbow': (0.50, 0.42),
+    'right_elbow': (0.52, 0.42), 'left_wrist': (0.50, 0.54), 'right_wrist': (0.52, 0.54),
+    'left_hip': (0.50, 0.55), 'right_hip': (0.52, 0.55), 'left_knee': (0.50, 0.72),
+    'right_knee': (0.52, 0.72), 'left_ankle': (0.50, 0.90), 'right_ankle': (0.52, 0.90),
+}
+
+
+def synthesize(exercise, reps=5, frames_per_rep=40, partial_every=0, fps=DEFAULT_FPS):
+    """Recording frames of a rep exercise: the counted joint swings from extended to flexed and
+    back; every partial_every-th rep only goes part way"""
+    spec = REP_EXERCISES[exercise]
+    a, b, c = (LANDMARKS[name] for name in JOINTS[spec['joint']])
+    base = [[0.5, 0.5, 0.0, 0.99] for _ in range(N_LANDMARKS)]
+    for name, (x, y) in _STANDING.items():
+        base[LANDMARKS[name]] = [x, y, 0.0, 0.99]
+    ax, ay = base[a][0] - base[b][0], base[a][1] - base[b][1]
+    length = math.hypot(base[c][0] - base[b][0], base[c][1] - base[b][1])
+    extended, flexed = 175.0, spec['flexed_below'] - 20.0
+    recording = []
+    for rep in range(reps):
+        low = flexed
+        if partial_every and (rep + 1) % partial_every == 0:
+            low = (spec['extended_above'] - PARTIAL_MARGIN + spec['flexed_below']) / 2
+        for k in range(frames_per_rep):
+            angle = extended - (extended - low) * (1 - math.cos(2 * math.pi * k / frames_per_rep)) / 2
+            # c at `angle` degrees from the b->a direction
+            theta = math.atan2(ay, ax) + math.radians(angle)
+            landmarks = [list(point) for point in base]
+            landmarks[c] = [base[b][0] + length * math.cos(theta), base[b][1] + length * math.sin(theta), 0.0, 0.99]
+            recording.append({'t': round(len(recording) * 1000 / fps, 1),
+                              'landmarks': [[round(v, 5) for v in point] for point in landmarks]})
+    return recording
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    play = sub.add_parser('replay')
+    play.add_argument('exercise', choices=EXERCISES)
+    play.add_argument('path')
+    play.add_argument('--batch', type=int, default=8)
+    synth = sub.add_parser('synthesize')
+    synth.add_argument('exercise', choices=tuple(REP_EXERCISES))
+    synth.add_argument('path')
+    synth.add_argument('--reps', type=int, default=5)
+    synth.add_argument('--partial-every', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.command == 'replay':
+        results = replay(args.exercise, args.path, args.batch)
+        for result in results:
+            for error in result['errors']:
+                print(f"frame {error['frame']:6d}  rep {error['rep']:3d}  {error['error']}")
+        last = results[-1] if results else {'count': 0, 'frames': 0}
+        print(f"{args.exercise}: {last['count']} in {last['frames']} frames, "
+              f"{sum(len(result['errors']) for result in results)} form errors")
+    else:
+        recording = synthesize(args.exercise, args.reps, partial_every=args.partial_every)
+        with open(args.path, 'w') as f:
+            f.writelines(json.dumps(frame) + '\n' for frame in recording)
+        print(f"{len(recording)} frames -> {args.path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,466 @@
+"""/analyzereport: lab report upload, extraction, recommendations and PDF report.
+
+analyze_reports() runs the pipeline as a generator of stage results;
+/analyzereport collects them into one JSON response and /analyzereport/stream
+sends each as a Server-Sent Event as soon as it is ready.
+
+PyPDF2, ReportLab, the food catalog and the models are imported or loaded on
+first use (or by back.py's warm-up thread), not when this module is imported.
+"""
+import datetime
+import logging
+import os
+import time
+from io import BytesIO
+
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+
+import health_rules
+import model_state
+import tracing
+from analysis_engine import ModelStrategy, classify_health_conditions, complete_panel, extract_panel, read_pdf_text
+from cache_backends import Cache
+from lab_history import LabHistory, patient_key
+from profile_cache import ProfileCache, input_hash
+from tracing import span
+
+logger = logging.getLogger('arise')
+
+blueprint = Blueprint('report', __name__)
+
+# Foods come from the analysis engine's model strategy, over whichever recommender is current
+model_strategy = ModelStrategy(lambda: model_state.diet_recommender)
+
+def calculate_bmi(weight, height):
+    """Calculate BMI from weight (kg) and height (cm)"""
+    height_m = height / 100  # Convert height from cm to m
+    return weight / (height_m * height_m)
+
+def calculate_daily_calories(weight, height, age, gender):
+    # Using Mifflin-St Jeor Equation
+    if gender.lower() == 'male':
+        bmr = 10 * weight + 6.25 * height - 5 * age + 5
+    else:
+        bmr = 10 * weight + 6.25 * height - 5 * age - 161
+    
+    # Assuming moderate activity level (1.55 multiplier)
+    return int(bmr * 1.55)
+
+def generate_pdf_report(user_info, analysis, recommendations, bmi, daily_calories):
+    """Generate a PDF report with user information and recommendations"""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    styles = getSampleStyleSheet()
+    story = []
+
+    # Title
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Title'],
+        fontSize=24,
+        spaceAfter=30
+    )
+    story.append(Paragraph("Health Analysis Report", title_style))
+
+    # User Information
+    story.append(Paragraph("Personal Information", styles['Heading2']))
+    user_data = [
+        ["Name:", user_info['name']],
+        ["Age:", str(user_info['age'])],
+        ["Weight:", f"{user_info['weight']} kg"],
+        ["Height:", f"{user_info['height']} cm"],
+        ["BMI:", f"{bmi:.2f}"],
+        ["Daily Calorie Needs:", f"{daily_calories:.0f} kcal"]
+    ]
+    user_table = Table(user_data, colWidths=[100, 200])
+    user_table.setStyle(TableStyle([
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+    ]))
+    story.append(user_table)
+    story.append(Spacer(1, 20))
+
+    # Analysis (without heading)
+    for report_type, data in analysis.items():
+        if data:
+            story.append(Paragraph(f"{report_type.capitalize()} Report", styles['Heading3']))
+            for key, value in data.items():
+                story.append(Paragraph(f"{key}: {value}", styles['Normal']))
+            story.append(Spacer(1, 10))
+
+    # Diet Recommendations
+    story.append(Paragraph("Diet Recommendations", styles['Heading2']))
+    story.append(Paragraph(f"Daily Calorie Target: {recommendations['daily_calories']} kcal", styles['Heading3']))
+    
+    # Create separate tables for each meal type
+    for meal_type in ['breakfast', 'lunch', 'dinner', 'snacks']:
+        if recommendations[meal_type]:
+            story.append(Paragraph(meal_type.capitalize(), styles['Heading3']))
+            meal_data = [["Food Item", "Calories"]]
+            for item in recommendations[meal_type]:
+                meal_data.append([item['item'], f"{item['calories']} kcal"])
+            
+            meal_table = Table(meal_data, colWidths=[300, 100])
+            meal_table.setStyle(TableStyle([
+                ('GRID', (0, 0), (-1, -1), 1, colors.black),
+                ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+                ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 12),
+                ('FONTSIZE', (0, 1), (-1, -1), 10),
+                ('LEADING', (0, 0), (-1, -1), 14),
+                ('TOPPADDING', (0, 0), (-1, -1), 6),
+                ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+            ]))
+            story.append(meal_table)
+            story.append(Spacer(1, 10))
+
+    # Additional Notes
+    story.append(Paragraph("Additional Notes", styles['Heading2']))
+    notes = [
+        "• Maintain regular meal timings",
+        "• Stay hydrated throughout the day",
+        "• Include a variety of fruits and vegetables",
+        "• Limit processed foods and sugary drinks",
+        "• Exercise regularly as per your fitness level"
+    ]
+    for note in notes:
+        story.append(Paragraph(note, styles['Normal']))
+
+    doc.build(story)
+    buffer.seek(0)
+    return buffer
+
+def _flag(value):
+    """A form ('true', '1', 'on') or JSON (true) boolean"""
+    if isinstance(value, str):
+        return value.strip().lower() in ('true', '1', 'yes', 'on')
+    return value is True or value == 1
+
+def parse_allergies(form):
+    """Allergen bit mask from the dairy_allergy/peanut_allergy flags and the
+    optional `allergies` field: a comma-separated string (e.g. "gluten, soy, egg")
+    or, from JSON, a list of names. Anything else raises ValueError"""
+    allergies = form.get('allergies') or []
+    if isinstance(allergies, str):
+        allergies = allergies.split(',')
+    if not isinstance(allergies, list) or not all(isinstance(a, str) for a in allergies):
+        raise ValueError("allergies must be a list of names or a comma-separated string")
+    allergies = [a for a in allergies if a.strip()]
+    if _flag(form.get('dairy_allergy')):
+        allergies.append('dairy')
+    if _flag(form.get('peanut_allergy')):
+        allergies.append('peanut')
+    from food_catalog import allergen_mask
+    return allergen_mask(allergies)
+
+# Health recommendations based on extracted values
+def health_recommendation_batch(panels, exclude_allergens=0):
+    """(advice, diet) per complete panel: the threshold advice from health_rules and the model's
+    picks for every panel in one call"""
+    from food_catalog import get_catalog
+    catalog = get_catalog()
+
+    advice = health_rules.advice_batch(panels)
+    # ML-based picks for each meal, in one model call, plus the default snacks
+    with span('recommend_foods'):
+        foods = model_strategy.recommend(panels, exclude_allergens)
+    results = []
+    for recommendations, picks in zip(advice, foods):
+        diet_recommendations = {"breakfast": [], "lunch": [], "dinner": [], "snacks": []}
+        for meal_type, names in picks.items():
+            for food in names:
+                diet_recommendations[meal_type].append({
+                    "item": food,
+                    "calories": catalog.calories(food, meal_type)
+                })
+        results.append((recommendations, diet_recommendations))
+    return results
+
+def health_recommendation(data, exclude_allergens=0):
+    return health_recommendation_batch([data], exclude_allergens)[0]
+
+def analyze_health_status(bmi, data):
+    return health_rules.health_status_batch([bmi], [data])[0]
+
+# Function to extract data from report text
+def extract_data_from_report(text):
+    return complete_panel(extract_panel(text))
+
+def read_report(file_path):
+    """Lab values printed in one PDF report; fields it doesn't mention are left out"""
+    with span('pdf_parse'):
+        text = read_pdf_text(file_path)
+
+    with span('extraction'):
+        return extract_panel(text)
+
+def extract_data_from_file(file_path, exclude_allergens=0):
+    data = complete_panel(read_report(file_path))
+    recommendations, diet_recommendations = health_recommendation(data, exclude_allergens)
+    return data, recommendations, diet_recommendations
+
+# Stage results per user, so resubmissions only redo the stages whose inputs changed
+profile_cache = ProfileCache()
+# Rendered PDFs by file name, so /download works on a node other than the one that rendered it
+pdf_files = Cache('pdf_files')
+# Every measured panel, so later reports can be read against the patient's history
+lab_history = LabHistory()
+
+def parse_report_date(form):
+    """Unix time of the optional report_date field (YYYY-MM-DD); None means now"""
+    value = form.get('report_date')
+    if not value:
+        return None
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d').timestamp()
+    except ValueError:
+        raise ValueError(f"report_date must be YYYY-MM-DD, got '{value}'") from None
+
+def _model_state():
+    """What the recommendation stage depends on besides its inputs"""
+    watcher, learner = model_state.model_watcher, model_state.feedback_learner
+    return [watcher.version if watcher else None,
+            getattr(model_state.diet_recommender, 'model_dir', None),
+            learner.scorer.events if learner else 0]
+
+def stored_pdf(filename):
+    """Path of a rendered PDF in the upload folder, copied from the shared cache when it
+    was rendered on another node; None if neither has it"""
+    path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+    if os.path.exists(path):
+        return path
+    content = pdf_files.get_bytes(filename) if pdf_files.backend.remote else None
+    if content is None:
+        return None
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+def analysis_inputs():
+    """Validated /analyzereport form as a dict, or (error response, status) to return"""
+    if 'file' not in request.files:
+        logger.info("Rejected /analyzereport: no file part")
+        return jsonify({"error": "No file part"}), 400
+
+    files = request.files.getlist('file')
+    if any(file.filename == '' for file in files):
+        logger.info("Rejected /analyzereport: empty filename")
+        return jsonify({"error": "One or more files have no filename"}), 400
+    
+    # Get user information
+    user_info = {
+        'name': request.form.get('name'),
+        'age': int(request.form.get('age')),
+        'weight': float(request.form.get('weight')),
+        'height': float(request.form.get('height')),
+        'dairy_allergy': _flag(request.form.get('dairy_allergy')),
+        'peanut_allergy': _flag(request.form.get('peanut_allergy'))
+    }
+    try:
+        exclude_allergens = parse_allergies(request.form)
+        report_time = parse_report_date(request.form)
+        patient = patient_key(request.form.get('patient_id'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # Only shapes and flags go on the trace; the user's details stay out of the logs
+    tracing.annotate(files=len(files),
+                     dairy_allergy=user_info['dairy_allergy'],
+                     peanut_allergy=user_info['peanut_allergy'])
+    
+    # Calculate BMI and daily calories
+    try:
+        bmi = calculate_bmi(user_info['weight'], user_info['height'])
+        daily_calories = calculate_daily_calories(user_info['weight'], user_info['height'], user_info['age'], 'female')
+    except Exception as e:
+        logger.warning("Error calculating BMI/calories: %s", e)
+        return jsonify({"error": f"Error calculating health metrics: {str(e)}"}), 500
+    # Read now: a streamed response outlives the request's upload files
+    uploads = [(file.filename, file.read()) for file in files]
+    return {'uploads': uploads, 'user_info': user_info, 'exclude_allergens': exclude_allergens,
+            'report_time': report_time, 'bmi': bmi, 'daily_calories': daily_calories, 'patient': patient}
+
+def analyze_reports(uploads, user_info, exclude_allergens, report_time, bmi, daily_calories, patient=None):
+    """The /analyzereport pipeline as (stage, payload) pairs, yielded as each stage finishes:
+    'file' per report, 'conditions', 'recommendations', then 'pdf' (or 'error').
+    patient (lab_history.patient_key) enables the lab history; without it nothing is
+    stored and no earlier reports are consulted"""
+    from food_catalog import MEAL_TYPES
+    from meal_planner import plan_day
+
+    model_state.load_models()
+    # Stage results are keyed by their exact inputs, so requests without a patient can share a profile
+    profile = patient or 'anonymous'
+    results = {}
+    analysis = {
+        'blood': {},
+        'cholesterol': {},
+        'thyroxine': {}
+    }
+    
+    for filename, content in uploads:
+        def parse_upload():
+            # Save the uploaded file and extract its values
+            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+            with span('upload_save'), open(file_path, 'wb') as f:
+                f.write(content)
+            return read_report(file_path)
+        
+        measured = profile_cache.get_or_compute(profile, 'extraction', content, parse_upload)
+        if patient is not None:
+            with span('history_append'):
+                lab_history.append(patient, measured, source=input_hash(content), taken=report_time)
+        extracted_data = complete_panel(measured)
+        recommendations, diet_recommendations = profile_cache.get_or_compute(
+            profile, 'recommendations', [extracted_data, exclude_allergens, _model_state()],
+            lambda: health_recommendation(extracted_data, exclude_allergens))
+        
+        # Store results
+        results[filename] = {
+            "extracted_data": extracted_data,
+            "recommendations": recommendations,
+            "diet_recommendations": diet_recommendations
+        }
+        yield 'file', dict(results[filename], filename=filename)
+        
+        # Add to analysis
+        if 'blood' in filename.lower():
+            analysis['blood'] = recommendations
+        elif 'cholesterol' in filename.lower():
+            analysis['cholesterol'] = recommendations
+        elif 'thyroxine' in filename.lower():
+            analysis['thyroxine'] = recommendations
+    
+    # A condition flagged in any report, or in the average of the patient's
+    # recent reports, applies to the whole day
+    history, panels = None, [result['extracted_data'] for result in results.values()]
+    if patient is not None:
+        with span('history_query'):
+            history = lab_history.trends(patient)
+            panels.append(lab_history.recent_average(patient))
+    health_conditions = classify_health_conditions({}, bmi)
+    for levels in health_rules.condition_levels(panels):
+        for condition, level in levels.items():
+            if level == 'high':
+                health_conditions[condition] = level
+    
+    # Analyze health status
+    health_status = analyze_health_status(bmi, results.get(list(results.keys())[0], {}).get('extracted_data', {}))
+    yield 'conditions', {"analysis": analysis, "health_conditions": health_conditions,
+                         "health_status": health_status, "history": history}
+    
+    # Combine diet recommendations
+    combined_recommendations = {
+        'breakfast': [],
+        'lunch': [],
+        'dinner': [],
+        'snacks': [],
+        'daily_calories': daily_calories
+    }
+    
+    for result in results.values():
+        if result.get('diet_recommendations'):
+            for meal_type in ['breakfast', 'lunch', 'dinner', 'snacks']:
+                if result['diet_recommendations'].get(meal_type):
+                    combined_recommendations[meal_type].extend(result['diet_recommendations'][meal_type])
+    
+    # Remove duplicates and limit to 3 items per meal
+    for meal_type in ['breakfast', 'lunch', 'dinner', 'snacks']:
+        # Remove duplicates based on item name
+        seen = set()
+        unique_items = []
+        for item in combined_recommendations[meal_type]:
+            if isinstance(item, dict) and item['item'] not in seen:
+                seen.add(item['item'])
+                unique_items.append(item)
+        # Limit to 3 items
+        combined_recommendations[meal_type] = unique_items[:3]
+    
+    # Pick the day's meals to hit the calorie and macro targets, favouring the model's picks
+    preferred = {meal: [item['item'] for item in combined_recommendations[meal]] for meal in MEAL_TYPES}
+    with span('meal_plan'):
+        combined_recommendations.update(profile_cache.get_or_compute(
+            profile, 'meal_plan', [daily_calories, health_conditions, exclude_allergens, preferred],
+            lambda: plan_day(daily_calories, health_conditions, exclude_allergens, preferred=preferred)
+        ))
+    yield 'recommendations', {"diet_recommendations": combined_recommendations}
+    
+    try:
+        # Reuse the last PDF if nothing shown in it changed and it is still on disk (here or,
+        # with a shared cache, on the node that rendered it)
+        pdf_inputs = [user_info, analysis, combined_recommendations, bmi, daily_calories]
+        pdf_key = input_hash(pdf_inputs)
+        pdf_filename = profile_cache.get(profile, 'pdf', pdf_key)
+        if pdf_filename is None or stored_pdf(pdf_filename) is None:
+            # Generate PDF
+            with span('pdf_render'):
+                pdf_buffer = generate_pdf_report(user_info, analysis, combined_recommendations, bmi, daily_calories)
+            
+            # Save PDF temporarily with a unique name; the key suffix keeps cached names
+            # from being overwritten by a different report in the same second
+            pdf_filename = f"diet_recommendations_{user_info['name']}_{int(time.time())}_{pdf_key[:8]}.pdf"
+            pdf_path = os.path.join(current_app.config['UPLOAD_FOLDER'], pdf_filename)
+            with open(pdf_path, 'wb') as f:
+                f.write(pdf_buffer.getvalue())
+            if pdf_files.backend.remote:
+                pdf_files.set_bytes(pdf_filename, pdf_buffer.getvalue())
+            profile_cache.put(profile, 'pdf', pdf_key, pdf_filename)
+    except Exception as e:
+        logger.exception("Error generating PDF")
+        yield 'error', {"error": f"Error generating PDF: {str(e)}"}
+        return
+    yield 'pdf', {"pdf_url": f"http://localhost:5000/download/{pdf_filename}"}
+
+# Fields of the /analyzereport response, gathered from the stage payloads
+RESPONSE_FIELDS = ("analysis", "diet_recommendations", "health_status", "history", "pdf_url")
+
+# Route to upload multiple files
+@blueprint.route('/analyzereport', methods=['POST'])
+def upload_files():
+    inputs = analysis_inputs()
+    if not isinstance(inputs, dict):
+        return inputs
+    response = {}
+    for stage, payload in analyze_reports(**inputs):
+        if stage == 'error':
+            return jsonify(payload), 500
+        response.update(payload)
+    # Return results with the full URL for download
+    return jsonify({field: response[field] for field in RESPONSE_FIELDS})
+
+def sse_event(stage, payload):
+    return f"event: {stage}\ndata: {current_app.json.dumps(payload)}\n\n"
+
+@blueprint.route('/analyzereport/stream', methods=['POST'])
+def stream_analysis():
+    """/analyzereport as Server-Sent Events: the same form, and an event per stage as it
+    finishes ('file' per report, 'conditions', 'recommendations', 'pdf'), then 'done' with
+    the /analyzereport response. Invalid forms get the usual JSON error instead; a failure
+    once the stream has started (the 200 is already sent) is an 'error' event, and a stream
+    that ends with neither 'done' nor 'error' was cut off. Browsers' EventSource only does
+    GET, so read it with fetch()."""
+    inputs = analysis_inputs()
+    if not isinstance(inputs, dict):
+        return inputs
+
+    def events():
+        response = {}
+        try:
+            for stage, payload in analyze_reports(**inputs):
+                yield sse_event(stage, payload)
+                if stage == 'error':
+                    return
+                response.update(payload)
+        except Exception as e:
+            logger.exception("Error streaming /analyzereport")
+            yield sse_event('error', {"error": f"Error analyzing reports: {str(e)}"})
+            return
+        yield sse_event('done', {field: response[field] for field in RESPONSE_FIELDS})
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
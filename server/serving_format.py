@@ -0,0 +1,196 @@
+"""Pickle-free serving format for DietRecommender.
+
+    python serving_format.py models                # models/*.pkl -> models/serving/
+    python serving_format.py models --out /tmp/serving
+
+A serving bundle is a directory of flat .npy arrays plus manifest.json:
+
+    manifest.json     format version, feature order, categories, classes,
+                      scaler mean/scale, teacher name and the array index
+    forest_*.npy      every tree of the forest concatenated into one node table
+                      (left/right child, split feature, threshold, leaf
+                      class probabilities) plus each tree's root offset
+    scorer_*.npy      the distilled scorer's weights and bias, if present
+
+Loading is np.load(mmap_mode='r') per array: no pickle, no object
+reconstruction, and pages are shared between workers by the OS. Only this
+converter (and training) touch joblib.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+
+
+class FlatForest:
+    """A tree ensemble as one node table; predict_proba walks every tree at once"""
+
+    def __init__(self, left, right, feature, threshold, value, roots, classes, max_depth):
+        self.left = left
+        self.right = right
+        self.feature = feature
+        self.threshold = threshold
+        self.value = value
+        self.roots = roots
+        self.classes_ = classes
+        self.max_depth = max_depth
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Flatten a fitted RandomForestClassifier/ExtraTreesClassifier/DecisionTreeClassifier"""
+        trees = getattr(model, 'estimators_', None)
+        if trees is None and hasattr(model, 'tree_'):
+            trees = [model]
+        if not trees or not all(hasattr(tree, 'tree_') for tree in trees):
+            raise TypeError(f"{type(model).__name__} is not a tree ensemble")
+        left, right, feature, threshold, value, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in trees:
+            tree = estimator.tree_
+            leaf = tree.children_left < 0
+            roots.append(offset)
+            left.append(np.where(leaf, -1, tree.children_left + offset))
+            right.append(np.where(leaf, -1, tree.children_right + offset))
+            feature.append(np.where(leaf, 0, tree.feature))
+            threshold.append(tree.threshold)
+            # Per-node class distribution, normalised the way predict_proba does
+            counts = tree.value[:, 0, :]
+            value.append(counts / counts.sum(axis=1, keepdims=True))
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+        return cls(np.concatenate(left).astype(np.int32), np.concatenate(right).astype(np.int32),
+                   np.concatenate(feature).astype(np.int32), np.concatenate(threshold).astype(np.float64),
+                   np.concatenate(value).astype(np.float32), np.array(roots, dtype=np.int32),
+                   np.asarray(model.classes_), max_depth)
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        rows = np.arange(len(X))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            left = self.left[nodes]
+            leaf = left < 0
+            if leaf.all():
+                break
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(leaf, nodes, np.where(go_left, left, self.right[nodes]))
+        return self.value[nodes].mean(axis=1, dtype=np.float64)
+
+    def arrays(self):
+        return {'forest_left': self.left, 'forest_right': self.right, 'forest_feature': self.feature,
+                'forest_threshold': self.threshold, 'forest_value': self.value, 'forest_roots': self.roots}
+
+
+class Scaler:
+    """The part of a fitted StandardScaler serving needs"""
+
+    def __init__(self, mean, scale):
+        self.mean_ = np.asarray(mean, dtype=np.float64)
+        self.scale_ = np.asarray(scale, dtype=np.float64)
+
+    def transform(self, X):
+        return (np.asarray(X, dtype=np.float64) - self.mean_) / self.scale_
+
+
+def save_bundle(out_dir, forest, scaler, features, categories, scorer=None, teacher=None):
+    """Write a serving bundle; the directory is replaced in one rename"""
+    parent = os.path.dirname(os.path.abspath(out_dir))
+    os.makedirs(parent, exist_ok=True)
+    staging = f'{out_dir}.{os.getpid()}.tmp'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    arrays = dict(forest.arrays())
+    if scorer is not None:
+        arrays.update(scorer_weights=scorer.weights, scorer_bias=scorer.bias)
+    index = {}
+    for name, array in arrays.items():
+        np.save(os.path.join(staging, f'{name}.npy'), np.ascontiguousarray(array))
+        index[name] = {'file': f'{name}.npy', 'dtype': str(array.dtype), 'shape': list(array.shape)}
+    manifest = {
+        'format': FORMAT_VERSION,
+        'teacher': teacher,
+        'features': list(features),
+        'categories': categories,
+        'classes': [str(c) for c in forest.classes_],
+        'scaler': {'mean': scaler.mean_.tolist(), 'scale': scaler.scale_.tolist()},
+        'forest': {'max_depth': int(forest.max_depth), 'trees': len(forest.roots)},
+        'scorer': None if scorer is None else {'classes': [str(c) for c in scorer.classes_],
+                                                'meta': scorer.meta},
+        'arrays': index,
+    }
+    with open(os.path.join(staging, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    # Swap directories: move the old one aside, rename the new one in, then clean up
+    retired = f'{out_dir}.{os.getpid()}.old'
+    if os.path.exists(out_dir):
+        os.rename(out_dir, retired)
+    os.rename(staging, out_dir)
+    shutil.rmtree(retired, ignore_errors=True)
+
+
+def load_bundle(bundle_dir):
+    """manifest dict plus memory-mapped arrays; raises ValueError for unknown formats"""
+    with open(os.path.join(bundle_dir, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported serving format {manifest.get('format')} in {bundle_dir}")
+    arrays = {}
+    for name, spec in manifest['arrays'].items():
+        array = np.load(os.path.join(bundle_dir, spec['file']), mmap_mode='r', allow_pickle=False)
+        if str(array.dtype) != spec['dtype'] or list(array.shape) != spec['shape']:
+            raise ValueError(f"{spec['file']} does not match the manifest")
+        arrays[name] = array
+    classes = np.array(manifest['classes'])
+    forest = FlatForest(arrays['forest_left'], arrays['forest_right'], arrays['forest_feature'],
+                        arrays['forest_threshold'], arrays['forest_value'], arrays['forest_roots'],
+                        classes, manifest['forest']['max_depth'])
+    scaler = Scaler(manifest['scaler']['mean'], manifest['scaler']['scale'])
+    return manifest, forest, scaler, arrays
+
+
+def convert(model_dir, out_dir=None):
+    """Export the pickled model and scaler in model_dir (plus diet_scorer.npz if present)"""
+    import joblib
+    from diet_recommender import CATEGORIES, FEATURES, DistilledScorer
+
+    out_dir = out_dir or os.path.join(model_dir, 'serving')
+    model = joblib.load(os.path.join(model_dir, 'diet_recommender.pkl'))
+    scaler = joblib.load(os.path.join(model_dir, 'scaler.pkl'))
+    scorer_path = os.path.join(model_dir, 'diet_scorer.npz')
+    scorer = DistilledScorer.load(scorer_path) if os.path.exists(scorer_path) else None
+    forest = FlatForest.from_sklearn(model)
+    save_bundle(out_dir, forest, Scaler(scaler.mean_, scaler.scale_), FEATURES, CATEGORIES, scorer,
+                teacher=type(model).__name__)
+
+    # The flattened forest must reproduce the original exactly
+    import pandas as pd
+    probe = np.random.default_rng(0).normal(size=(256, len(FEATURES)))
+    for column, values in enumerate(CATEGORIES.values(), start=len(FEATURES) - len(CATEGORIES)):
+        probe[:, column] = np.random.default_rng(column).integers(0, len(values), len(probe))
+    expected = model.predict_proba(pd.DataFrame(probe, columns=FEATURES))
+    _, loaded, _, _ = load_bundle(out_dir)
+    error = float(np.abs(loaded.predict_proba(probe) - expected).max())
+    return out_dir, error
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('model_dir', help='directory with diet_recommender.pkl and scaler.pkl')
+    parser.add_argument('--out', help='bundle directory (default: <model_dir>/serving)')
+    args = parser.parse_args(argv)
+    out_dir, error = convert(args.model_dir, args.out)
+    print(f"Wrote {out_dir} (max probability difference vs the pickle: {error:.2e})")
+    return 0 if error < 1e-6 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
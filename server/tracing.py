@@ -0,0 +1,241 @@
+"""Per-request tracing, slow-request logging and opt-in profiling.
+
+Every request gets a trace id (returned in the X-Trace-Id header) and each
+pipeline stage wrapped in span() is recorded on it as well as in the
+arise_stage_seconds histogram. Requests slower than ARISE_SLOW_REQUEST_MS are
+logged with their stage breakdown.
+
+Profiling is off unless ARISE_PROFILE_TOKEN is set. Then a request carrying
+that token in X-Profile-Token can ask to be profiled with `X-Profile: 1` or
+`?profile=1` (`X-Profile: pyinstrument` uses pyinstrument when it is
+installed). The response's X-Profile-Id names the capture, <id>.prof or
+<id>.html in the profile directory:
+
+    ARISE_PROFILE_TOKEN        required to profile anything
+    ARISE_PROFILE_SAMPLE_RATE  fraction of flagged requests actually profiled (default 1.0)
+    ARISE_PROFILE_DIR          where .prof / .html captures are written (default: profiles)
+    ARISE_PROFILE_MAX_FILES    captures kept there; the oldest are removed (default 50)
+"""
+import contextvars
+import cProfile
+import glob
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from flask import g, request
+
+import metrics
+
+logger = logging.getLogger('arise.trace')
+
+SLOW_REQUEST_MS = float(os.environ.get('ARISE_SLOW_REQUEST_MS', '1000'))
+PROFILE_SAMPLE_RATE = float(os.environ.get('ARISE_PROFILE_SAMPLE_RATE', '1.0'))
+PROFILE_TOKEN = os.environ.get('ARISE_PROFILE_TOKEN')
+PROFILE_DIR = os.environ.get('ARISE_PROFILE_DIR', 'profiles')
+PROFILE_MAX_FILES = int(os.environ.get('ARISE_PROFILE_MAX_FILES', '50'))
+
+_TRACE_ID = re.compile(r'[A-Za-z0-9_-]{1,64}')
+_current_trace = contextvars.ContextVar('arise_trace', default=None)
+# Only one cProfile capture at a time; newer Pythons refuse concurrent profilers
+_profile_lock = threading.Lock()
+
+
+class Trace:
+    def __init__(self, name, trace_id=None):
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.name = name
+        self.start = time.perf_counter()
+        self.spans = []
+        self.attributes = {}
+        self._stack = []
+
+    def stage_breakdown(self):
+        """Total milliseconds per stage name"""
+        totals = {}
+        for span in self.spans:
+            totals[span['name']] = totals.get(span['name'], 0.0) + span['ms']
+        return {name: round(ms, 3) for name, ms in totals.items()}
+
+    def to_dict(self, duration_ms):
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'duration_ms': round(duration_ms, 3),
+            'attributes': self.attributes,
+            'stages': self.stage_breakdown(),
+            'spans': self.spans,
+        }
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def annotate(**attributes):
+    """Attach attributes (counts, sizes, flags - never raw user data) to the current trace"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.attributes.update(attributes)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time a pipeline stage on the current trace and in arise_stage_seconds"""
+    trace = _current_trace.get()
+    parent = trace._stack[-1] if trace is not None and trace._stack else None
+    if trace is not None:
+        trace._stack.append(name)
+    offset = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - offset
+        metrics.STAGE_SECONDS.observe(elapsed, stage=name)
+        if trace is not None:
+            trace._stack.pop()
+            record = {
+                'name': name,
+                'start_ms': round((offset - trace.start) * 1000, 3),
+                'ms': round(elapsed * 1000, 3),
+            }
+            if parent:
+                record['parent'] = parent
+            if attributes:
+                record['attributes'] = attributes
+            trace.spans.append(record)
+
+
+@contextmanager
+def start_trace(name, trace_id=None):
+    """Run a block (e.g. a background job or benchmark) under its own trace"""
+    trace = Trace(name, trace_id)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def trace_id_from(header):
+    """An upstream X-Trace-Id to reuse; it ends up in file names, so only if it is tame"""
+    return header if header and _TRACE_ID.fullmatch(header) else None
+
+
+def log_trace(trace):
+    """Log a finished request's trace, as a warning when it took SLOW_REQUEST_MS or more"""
+    duration_ms = (time.perf_counter() - trace.start) * 1000
+    if duration_ms >= SLOW_REQUEST_MS:
+        logger.warning("slow request %s", json.dumps(trace.to_dict(duration_ms)))
+    else:
+        logger.debug("request %s", json.dumps(trace.to_dict(duration_ms)))
+
+
+def _profile_requested():
+    flag = request.headers.get('X-Profile') or request.args.get('profile')
+    if not flag or flag in ('0', 'false') or not PROFILE_TOKEN:
+        return None
+    if not hmac.compare_digest(request.headers.get('X-Profile-Token', '').encode(), PROFILE_TOKEN.encode()):
+        return None
+    if random.random() >= PROFILE_SAMPLE_RATE:
+        return None
+    return 'pyinstrument' if flag == 'pyinstrument' else 'cprofile'
+
+
+def _start_profiler(kind):
+    if kind == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            kind = 'cprofile'
+        else:
+            profiler = Profiler()
+            profiler.start()
+            return kind, profiler
+    if not _profile_lock.acquire(blocking=False):
+        return None, None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is active in this interpreter
+        _profile_lock.release()
+        return None, None
+    return kind, profiler
+
+
+def _stop_profiler(kind, profiler, trace_id):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    if kind == 'pyinstrument':
+        profiler.stop()
+        path = os.path.join(PROFILE_DIR, f"{trace_id}.html")
+        with open(path, 'w') as f:
+            f.write(profiler.output_html())
+    else:
+        profiler.disable()
+        _profile_lock.release()
+        path = os.path.join(PROFILE_DIR, f"{trace_id}.prof")
+        profiler.dump_stats(path)
+    _prune_profiles()
+    return path
+
+
+def _prune_profiles():
+    """Keep only the newest PROFILE_MAX_FILES captures"""
+    captures = glob.glob(os.path.join(PROFILE_DIR, '*.prof')) + glob.glob(os.path.join(PROFILE_DIR, '*.html'))
+    if len(captures) <= PROFILE_MAX_FILES:
+        return
+    def mtime(path):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return 0.0
+    for path in sorted(captures, key=mtime)[:len(captures) - PROFILE_MAX_FILES]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def init_app(app):
+    """Trace every request of a Flask app"""
+
+    @app.before_request
+    def _begin_trace():
+        trace_id = trace_id_from(request.headers.get('X-Trace-Id'))
+        trace = Trace(request.url_rule.rule if request.url_rule else request.path, trace_id)
+        g.trace = trace
+        g.trace_token = _current_trace.set(trace)
+        kind = _profile_requested()
+        g.profiler_kind, g.profiler = _start_profiler(kind) if kind else (None, None)
+
+    @app.after_request
+    def _trace_headers(response):
+        trace = g.get('trace')
+        if trace is not None:
+            response.headers['X-Trace-Id'] = trace.trace_id
+            if g.get('profiler') is not None:
+                # The capture is named after the trace; the server's paths stay private
+                response.headers['X-Profile-Id'] = trace.trace_id
+            trace.attributes['status'] = response.status_code
+        return response
+
+    @app.teardown_request
+    def _end_trace(exc):
+        trace = g.pop('trace', None)
+        if trace is None:
+            return
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            trace.attributes['profile'] = _stop_profiler(g.pop('profiler_kind'), profiler, trace.trace_id)
+        if exc is not None:
+            trace.attributes['error'] = type(exc).__name__
+        _current_trace.reset(g.pop('trace_token'))
+        log_trace(trace)
@@ -0,0 +1,246 @@
+"""User clustering trained out of core.
+
+    python user_clustering.py fit users.csv                  # -> models/user_clusters.npz
+    python user_clustering.py fit users.parquet --chunk-rows 500000 --epochs 2
+    python user_clustering.py compare nutrition_distribution_large.csv
+    python user_clustering.py synthesize nutrition_distribution_large.csv 20000000 /tmp/users.csv
+
+model_state's clustering pipeline (mean imputer, StandardScaler, KMeans) needs
+the whole user table in memory. This fits the same model from a CSV or Parquet
+file (Parquet needs pyarrow) read in chunks of --chunk-rows rows, so memory
+depends on the chunk size, not on the file:
+
+    1. collect the values of the label-encoded columns (Gender, Diseases, Goal),
+       numbered in sorted order as preprocess_data's LabelEncoder does
+    2. StandardScaler.partial_fit over every chunk (missing values ignored)
+    3. KMeans on the first chunk for the initial centroids, then
+       MiniBatchKMeans.partial_fit on shuffled mini-batches of every chunk, for
+       --epochs passes (rows should be in no particular order, or the first
+       chunk a fair sample)
+
+The result is saved as one .npz (no pickle): categories, scaler mean/scale
+and centroids. load_models() uses it instead of fitting KMeans when
+ARISE_CLUSTER_MODEL (default models/user_clusters.npz) exists; predict()
+takes the same preprocessed features as the pipeline. `compare` fits both on
+a file that fits in memory and reports how far apart the matched centroids
+are, both inertias and how well the cluster assignments agree.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+
+from model_state import USER_FEATURES
+
+CLUSTER_MODEL = os.environ.get('ARISE_CLUSTER_MODEL', os.path.join('models', 'user_clusters.npz'))
+CHUNK_ROWS = int(os.environ.get('ARISE_CLUSTER_CHUNK_ROWS', '200000'))
+N_CLUSTERS = 5
+BATCH_SIZE = 4096
+EPOCHS = 3
+
+# Columns preprocess_data label-encodes
+ENCODED_FEATURES = ('Gender', 'Diseases', 'Goal')
+
+
+def read_chunks(path, chunk_rows=CHUNK_ROWS, columns=USER_FEATURES):
+    """DataFrames of at most chunk_rows rows of `columns` from a .csv or .parquet file"""
+    if path.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Reading Parquet needs pyarrow: pip install pyarrow") from e
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=list(columns)):
+            yield batch.to_pandas()
+    else:
+        import pandas as pd
+        yield from pd.read_csv(path, usecols=list(columns), chunksize=chunk_rows)
+
+
+def collect_categories(chunks):
+    """{column: sorted distinct values} of the encoded columns"""
+    import numpy as np
+    seen = {column: set() for column in ENCODED_FEATURES}
+    for chunk in chunks:
+        for column in ENCODED_FEATURES:
+            seen[column].update(chunk[column].dropna().unique().tolist())
+    return {column: np.array(sorted(values)) for column, values in seen.items()}
+
+
+def encode(chunk, categories):
+    """(len(chunk), len(USER_FEATURES)) floats with the encoded columns numbered like
+    LabelEncoder; NaN where missing"""
+    import numpy as np
+    X = np.empty((len(chunk), len(USER_FEATURES)))
+    for j, column in enumerate(USER_FEATURES):
+        values = chunk[column]
+        if column in categories:
+            present = values.notna().to_numpy()
+            codes = np.full(len(chunk), np.nan)
+            codes[present] = np.searchsorted(categories[column], values[present].to_numpy())
+            X[:, j] = codes
+        else:
+            X[:, j] = values.to_numpy(dtype=np.float64, na_value=np.nan)
+    return X
+
+
+class UserClusters:
+    """Scaler and centroids of the user clustering; predict() is plain NumPy"""
+
+    def __init__(self, categories, mean, scale, centroids, meta=None):
+        self.categories = categories
+        self.mean = mean
+        self.scale = scale
+        self.centroids = centroids
+        self.meta = meta or {}
+
+    def scaled(self, X):
+        """Standardised features, missing values imputed with the training mean"""
+        import numpy as np
+        X = np.asarray(X, dtype=np.float64)
+        X = np.where(np.isnan(X), self.mean, X)
+        return (X - self.mean) / self.scale
+
+    def predict(self, X):
+        """Cluster per row of preprocessed USER_FEATURES (a DataFrame or array), like the pipeline"""
+        Z = self.scaled(X[USER_FEATURES] if hasattr(X, 'columns') else X)
+        distances = (Z ** 2).sum(axis=1)[:, None] - 2 * Z @ self.centroids.T + (self.centroids ** 2).sum(axis=1)
+        return distances.argmin(axis=1)
+
+    @classmethod
+    def fit(cls, path, chunk_rows=CHUNK_ROWS, epochs=EPOCHS, n_clusters=N_CLUSTERS,
+            batch_size=BATCH_SIZE, random_state=42):
+        import numpy as np
+        from sklearn.cluster import KMeans, MiniBatchKMeans
+        from sklearn.preprocessing import StandardScaler
+
+        categories = collect_categories(read_chunks(path, chunk_rows))
+        scaler = StandardScaler()
+        rows = 0
+        for chunk in read_chunks(path, chunk_rows):
+            scaler.partial_fit(encode(chunk, categories))
+            rows += len(chunk)
+        model = cls(categories, scaler.mean_, scaler.scale_, None)
+
+        rng = np.random.default_rng(random_state)
+        kmeans = None
+        for _ in range(epochs):
+            for chunk in read_chunks(path, chunk_rows):
+                Z = model.scaled(encode(chunk, categories))[rng.permutation(len(chunk))]
+                if kmeans is None:
+                    # Seed with a full KMeans on the first chunk (what the pipeline does on the
+                    # whole file); the mini-batches then move the centroids to the rest of the data
+                    seeds = KMeans(n_clusters=n_clusters, random_state=random_state).fit(Z).cluster_centers_
+                    kmeans = MiniBatchKMeans(n_clusters=n_clusters, init=seeds, n_init=1,
+                                             batch_size=batch_size, random_state=random_state)
+                for start in range(0, len(Z), batch_size):
+                    kmeans.partial_fit(Z[start:start + batch_size])
+        model.centroids = kmeans.cluster_centers_
+        model.meta = {'rows': rows, 'chunk_rows': chunk_rows, 'epochs': epochs, 'batch_size': batch_size}
+        return model
+
+    def save(self, path):
+        import numpy as np
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        arrays = {f'categories_{column}': values for column, values in self.categories.items()}
+        np.savez(path, mean=self.mean, scale=self.scale, centroids=self.centroids,
+                 meta=np.array(json.dumps(dict(self.meta, features=USER_FEATURES))), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        import numpy as np
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            if meta.get('features') != USER_FEATURES:
+                raise ValueError(f"{path} was fitted on {meta.get('features')}, not {USER_FEATURES}")
+            categories = {column: data[f'categories_{column}'] for column in ENCODED_FEATURES}
+            return cls(categories, data['mean'], data['scale'], data['centroids'], meta)
+
+
+def compare(path, chunk_rows=CHUNK_ROWS, epochs=EPOCHS):
+    """Fit the in-memory pipeline and the out-of-core model on the same file. Reports, in the
+    pipeline's scaled space, the distance between matched centroids and each model's inertia,
+    plus the adjusted Rand index of their assignments. KMeans itself lands on different but
+    equally good partitions with another seed when users don't form clear clusters, so the
+    inertias are the numbers to compare there."""
+    import numpy as np
+    from scipy.optimize import linear_sum_assignment
+    from sklearn.metrics import adjusted_rand_score
+    import model_state
+
+    frame = model_state.preprocess_data(model_state.load_dataset(path))
+    pipeline = model_state.create_clustering_pipeline()
+    pipeline.fit(frame[USER_FEATURES])
+    Z = pipeline.named_steps['preprocessor'].transform(frame[USER_FEATURES])
+    scaler = pipeline.named_steps['preprocessor'].named_transformers_['num'].named_steps['scaler']
+    reference = pipeline.named_steps['clustering'].cluster_centers_
+
+    clusters = UserClusters.fit(path, chunk_rows=chunk_rows, epochs=epochs)
+    labels = clusters.predict(frame[USER_FEATURES])
+    centroids = (clusters.centroids * clusters.scale + clusters.mean - scaler.mean_) / scaler.scale_
+    distance = np.sqrt(((reference[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2))
+    rows, columns = linear_sum_assignment(distance)
+    matched = distance[rows, columns]
+    spacing = np.sqrt(((reference[:, None, :] - reference[None, :, :]) ** 2).sum(axis=2))
+    return {
+        'rows': len(frame),
+        'centroid_distance': {'mean': round(float(matched.mean()), 3), 'max': round(float(matched.max()), 3)},
+        'pipeline_centroid_spacing': round(float(spacing[spacing > 0].min()), 3),
+        'inertia': {'pipeline': round(float(pipeline.named_steps['clustering'].inertia_), 1),
+                    'out_of_core': round(float(((Z - centroids[labels]) ** 2).sum()), 1)},
+        'adjusted_rand_index': round(float(adjusted_rand_score(pipeline.predict(frame[USER_FEATURES]), labels)), 3),
+    }
+
+
+def synthesize(source, rows, out, chunk_rows=CHUNK_ROWS, seed=0):
+    """Write `rows` users resampled from `source` (with jitter on the numeric columns), chunk by chunk"""
+    import numpy as np
+    import pandas as pd
+    base = pd.read_csv(source, usecols=USER_FEATURES)
+    rng = np.random.default_rng(seed)
+    written = 0
+    while written < rows:
+        n = min(chunk_rows, rows - written)
+        chunk = base.iloc[rng.integers(0, len(base), n)].reset_index(drop=True)
+        for column, spread in (('Age', 2), ('Weight', 3), ('Height', 3)):
+            chunk[column] = (chunk[column] + rng.normal(0, spread, n)).round().astype(int)
+        chunk.to_csv(out, mode='w' if written == 0 else 'a', header=written == 0, index=False)
+        written += n
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    fit = sub.add_parser('fit')
+    fit.add_argument('path')
+    fit.add_argument('--out', default=CLUSTER_MODEL)
+    cmp = sub.add_parser('compare')
+    cmp.add_argument('path')
+    for command in (fit, cmp):
+        command.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+        command.add_argument('--epochs', type=int, default=EPOCHS)
+    synth = sub.add_parser('synthesize')
+    synth.add_argument('source')
+    synth.add_argument('rows', type=int)
+    synth.add_argument('out')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.command == 'fit':
+        clusters = UserClusters.fit(args.path, chunk_rows=args.chunk_rows, epochs=args.epochs)
+        clusters.save(args.out)
+        print(f"{clusters.meta['rows']} rows -> {args.out}")
+    elif args.command == 'compare':
+        print(json.dumps(compare(args.path, chunk_rows=args.chunk_rows, epochs=args.epochs), indent=2))
+    else:
+        synthesize(args.source, args.rows, args.out)
+        print(f"{args.rows} rows -> {args.out}")
+    # Peak, not current, RSS: what has to stay flat as the file grows
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{time.perf_counter() - start:.1f}s, peak rss {peak:.1f} MB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
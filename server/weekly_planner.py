@@ -0,0 +1,189 @@
+"""Seven-day meal plans with incremental re-planning.
+
+A week is seven meal_planner.plan_day() results. The recommender's picks per
+meal are computed once per plan and reused as preferences for every day;
+variety comes from a per-food penalty: a food already used within
+VARIETY_DAYS days of the slot is (almost) ruled out, and foods similar to
+those get a smaller cost. Similarity between foods is precomputed once per
+catalog from name tokens and nutrient profiles.
+
+Plans are stored per user in SQLite (plan_store.py), shared by every worker
+on the node; a swap re-plans inside the store's write transaction, so
+concurrent swaps of one plan on different workers apply one after the other.
+
+Swapping a meal re-plans only that slot with the rest of its day held fixed;
+swapping a day re-plans only that day. Both take a few milliseconds, so edits
+don't regenerate the whole report.
+"""
+import re
+from functools import lru_cache
+
+import numpy as np
+
+from food_catalog import get_catalog, MEAL_TYPES, NUTRIENT_FIELDS
+from meal_planner import plan_day
+from plan_store import PlanStore
+
+DAYS = 7
+VARIETY_DAYS = 3      # a food may come back on the VARIETY_DAYS-th day after it was used
+
+W_REPEAT = 10.0       # cost of reusing a food inside the variety window; effectively a ban
+W_SIMILAR = 0.15      # cost scale for foods similar to ones inside the window
+NAME_WEIGHT = 0.6     # share of similarity from name tokens; the rest is nutrients
+
+_STOP_WORDS = {'with', 'and', 'of', 'in', 'a', 'the'}
+
+
+def _tokens(name):
+    return {word for word in re.findall(r'[a-z]+', name.lower()) if word not in _STOP_WORDS}
+
+
+@lru_cache(maxsize=4)
+def food_similarity(catalog):
+    """Name-id x name-id similarity in [0, 1]; 1 on the diagonal"""
+    n = len(catalog.names)
+    # Name tokens: Jaccard overlap ("Vegetable khichdi" vs "Moong dal khichdi")
+    vocabulary = {}
+    rows, cols = [], []
+    for i, name in enumerate(catalog.names):
+        for token in _tokens(name):
+            rows.append(i)
+            cols.append(vocabulary.setdefault(token, len(vocabulary)))
+    tokens = np.zeros((n, max(len(vocabulary), 1)), dtype=np.float32)
+    tokens[rows, cols] = 1.0
+    shared = tokens @ tokens.T
+    sizes = tokens.sum(axis=1)
+    union = sizes[:, None] + sizes[None, :] - shared
+    name_sim = np.divide(shared, union, out=np.zeros_like(shared), where=union > 0)
+
+    # Nutrient profile: cosine similarity of standardised per-name nutrients
+    profile = np.zeros((n, len(NUTRIENT_FIELDS)), dtype=np.float32)
+    seen = np.zeros(n, dtype=bool)
+    for index, name_id in enumerate(catalog.entries['name_id'].tolist()):
+        if not seen[name_id]:
+            seen[name_id] = True
+            profile[name_id] = [np.nan_to_num(catalog.entries[field][index]) for field in NUTRIENT_FIELDS]
+    profile = (profile - profile[seen].mean(axis=0)) / (profile[seen].std(axis=0) + 1e-6)
+    profile[~seen] = 0
+    norms = np.linalg.norm(profile, axis=1, keepdims=True)
+    profile = np.divide(profile, norms, out=np.zeros_like(profile), where=norms > 0)
+    nutrient_sim = np.clip(profile @ profile.T, 0, 1)
+
+    similarity = NAME_WEIGHT * name_sim + (1 - NAME_WEIGHT) * nutrient_sim
+    np.fill_diagonal(similarity, 1.0)
+    similarity.setflags(write=False)
+    return similarity
+
+
+def _day_name_ids(catalog, day):
+    return [catalog.name_ids[item['item']] for meal in MEAL_TYPES for item in day.get(meal, [])
+            if item['item'] in catalog.name_ids]
+
+
+class WeekPlan:
+    def __init__(self, user_id, daily_calories, health_conditions, exclude_allergens, preferred,
+                 variety_days=VARIETY_DAYS):
+        self.user_id = user_id
+        self.daily_calories = daily_calories
+        self.health_conditions = dict(health_conditions or {})
+        self.exclude_allergens = exclude_allergens
+        self.preferred = preferred
+        self.variety_days = variety_days
+        self.days = [None] * DAYS
+
+    def penalties(self, catalog, day, extra=()):
+        """Variety cost per name id for a slot on `day`, from the plan's other days"""
+        window = []
+        for other in range(max(0, day - self.variety_days + 1), min(DAYS, day + self.variety_days)):
+            if other != day and self.days[other] is not None:
+                window.extend(_day_name_ids(catalog, self.days[other]))
+        window.extend(extra)
+        if not window:
+            return None
+        window = np.unique(window)
+        penalties = W_SIMILAR * food_similarity(catalog)[:, window].max(axis=1)
+        penalties[window] = W_REPEAT
+        return penalties
+
+    def plan(self, day, meal_type=None):
+        """(Re)plan a whole day, or one meal of it with the other meals held fixed"""
+        catalog = get_catalog()
+        current = self.days[day]
+        fixed = None
+        avoid = ()
+        if meal_type is not None and current is not None:
+            fixed = {meal: [item['item'] for item in current.get(meal, [])]
+                     for meal in MEAL_TYPES if meal != meal_type}
+            avoid = [catalog.name_ids[item['item']] for item in current.get(meal_type, [])
+                     if item['item'] in catalog.name_ids]
+        elif current is not None:
+            # A swapped day should come out different from the one it replaces
+            avoid = _day_name_ids(catalog, current)
+        plan = plan_day(self.daily_calories, self.health_conditions, self.exclude_allergens,
+                        preferred=self.preferred, penalties=self.penalties(catalog, day, avoid),
+                        fixed=fixed)
+        plan.pop('plan_targets', None)
+        self.days[day] = plan
+        return plan
+
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'daily_calories': self.daily_calories,
+            'variety_days': self.variety_days,
+            'days': [dict(day or {}, day=i + 1) for i, day in enumerate(self.days)],
+        }
+
+    def state(self):
+        """Everything needed to rebuild the plan, as JSON-able values"""
+        return {'user_id': self.user_id, 'daily_calories': self.daily_calories,
+                'health_conditions': self.health_conditions, 'exclude_allergens': self.exclude_allergens,
+                'preferred': self.preferred, 'variety_days': self.variety_days, 'days': self.days}
+
+    @classmethod
+    def from_state(cls, state):
+        week = cls(state['user_id'], state['daily_calories'], state['health_conditions'],
+                   state['exclude_allergens'], state['preferred'], state['variety_days'])
+        week.days = state['days']
+        return week
+
+
+class WeeklyPlanner:
+    """Per-user week plans, kept in a plan_store.PlanStore"""
+
+    def __init__(self, store=None, variety_days=VARIETY_DAYS):
+        self.variety_days = variety_days
+        self.store = store or PlanStore()
+
+    def get(self, user_id):
+        state = self.store.get(user_id)
+        return None if state is None else WeekPlan.from_state(state)
+
+    def create(self, user_id, daily_calories, health_conditions=None, exclude_allergens=0, recommender=None):
+        """Plan a fresh week for user_id, replacing any previous one"""
+        preferred = {}
+        if recommender is not None:
+            picks = recommender.recommend_foods_batch([(health_conditions or {}, meal) for meal in MEAL_TYPES],
+                                                      exclude_allergens=exclude_allergens)
+            preferred = dict(zip(MEAL_TYPES, picks))
+        week = WeekPlan(user_id, daily_calories, health_conditions, exclude_allergens, preferred,
+                        self.variety_days)
+        for day in range(DAYS):
+            week.plan(day)
+        self.store.put(user_id, week.state())
+        return week
+
+    def swap(self, user_id, day, meal_type=None):
+        """Re-plan one day (0-based) or one meal of it; None if the user has no plan"""
+        if not 0 <= day < DAYS:
+            raise ValueError(f"day must be between 1 and {DAYS}")
+        if meal_type is not None and meal_type not in MEAL_TYPES:
+            raise ValueError(f"meal must be one of: {', '.join(MEAL_TYPES)}")
+
+        def replan(state):
+            week = WeekPlan.from_state(state)
+            week.plan(day, meal_type)
+            return week.state()
+
+        state = self.store.update(user_id, replan)
+        return None if state is None else WeekPlan.from_state(state)
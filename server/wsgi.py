@@ -0,0 +1,23 @@
+"""Production WSGI entry point for the health recommendation API.
+
+    gunicorn -c gunicorn.conf.py
+
+gunicorn.conf.py sets preload_app, so this module (and with it every model in
+back.py) is imported once in the master and shared with the forked workers.
+Running `python wsgi.py` starts a threaded server without the reloader; it
+answers /healthz right away and loads the models on a warm-up thread.
+"""
+import os
+
+from back import create_app
+
+# Under gunicorn, load in the master before forking so workers share the models
+app = create_app(background=__name__ == '__main__')
+
+if __name__ == '__main__':
+    app.run(
+        host=os.environ.get('ARISE_HOST', '127.0.0.1'),
+        port=int(os.environ.get('ARISE_PORT', '5000')),
+        threaded=True,
+        use_reloader=False,
+    )